@@ -0,0 +1,155 @@
+"""In-memory catalog of the gameplay background videos.
+
+Built once at startup with probed metadata and kept current with a cheap
+directory mtime check instead of globbing and probing on every request.
+Only new or changed files are re-probed on refresh.
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_CATEGORIES = {
+    "minecraft": "Minecraft Parkour",
+    "roblox": "Roblox Gameplay",
+    "subway": "Subway Runner",
+    "satisfying": "Satisfying Loops",
+    "cooking": "ASMR Cooking",
+    "driving": "GTA City Cruise",
+}
+
+SELECTION_STRATEGIES = ("round_robin", "weighted")
+
+
+class BackgroundCatalog:
+    def __init__(
+        self,
+        root: Path,
+        probe: Callable[[str], dict],
+        categories: Dict[str, str] = BACKGROUND_CATEGORIES,
+        refresh_interval: float = 30.0,
+        strategy: str = "round_robin",
+    ):
+        if strategy not in SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown selection strategy '{strategy}'. Choose from: {', '.join(SELECTION_STRATEGIES)}")
+        self.root = root
+        self.probe = probe
+        self.categories = categories
+        self.refresh_interval = refresh_interval
+        self.strategy = strategy
+        self.videos: Dict[str, List[dict]] = {cat_id: [] for cat_id in categories}
+        self.etag = ""
+        self._dir_mtimes: Dict[str, float] = {}
+        self._last_check = 0.0
+        self._cursors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _probe_file(self, path: Path, stat) -> dict:
+        entry = {
+            "path": str(path),
+            "filename": path.name,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "duration": 0.0,
+            "width": 0,
+            "height": 0,
+        }
+        try:
+            data = self.probe(str(path))
+            entry["duration"] = float(data.get("format", {}).get("duration", 0))
+            video = next((st for st in data.get("streams", []) if st.get("codec_type") == "video"), {})
+            entry["width"] = int(video.get("width", 0))
+            entry["height"] = int(video.get("height", 0))
+        except Exception as e:
+            logger.error(f"Error probing background {path}: {e}")
+        return entry
+
+    def _current_dir_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for cat_id in self.categories:
+            cat_dir = self.root / cat_id
+            try:
+                mtimes[cat_id] = cat_dir.stat().st_mtime
+            except FileNotFoundError:
+                mtimes[cat_id] = 0.0
+        return mtimes
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rescan categories whose directory changed; returns True if the catalog changed"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            mtimes = self._current_dir_mtimes()
+            if not force and mtimes == self._dir_mtimes:
+                return False
+
+            changed = False
+            for cat_id in self.categories:
+                if not force and mtimes[cat_id] == self._dir_mtimes.get(cat_id):
+                    continue
+                known = {v["path"]: v for v in self.videos[cat_id]}
+                entries = []
+                cat_dir = self.root / cat_id
+                for path in sorted(cat_dir.glob("*.mp4")) if cat_dir.exists() else []:
+                    stat = path.stat()
+                    cached = known.get(str(path))
+                    if cached and cached["mtime"] == stat.st_mtime and cached["size"] == stat.st_size:
+                        entries.append(cached)
+                    else:
+                        entries.append(self._probe_file(path, stat))
+                if entries != self.videos[cat_id]:
+                    self.videos[cat_id] = entries
+                    changed = True
+
+            self._dir_mtimes = mtimes
+            if changed or not self.etag:
+                payload = json.dumps(self.listing(), sort_keys=True).encode("utf-8")
+                self.etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+            return changed
+
+    def maybe_refresh(self) -> bool:
+        """Refresh at most once per refresh_interval"""
+        if time.monotonic() - self._last_check < self.refresh_interval:
+            return False
+        return self.refresh()
+
+    def listing(self) -> List[dict]:
+        result = []
+        for cat_id, label in self.categories.items():
+            videos = self.videos[cat_id]
+            result.append({
+                "id": cat_id,
+                "label": label,
+                "videos": [f"/api/backgrounds/{cat_id}/{v['filename']}" for v in videos],
+                "items": [
+                    {
+                        "url": f"/api/backgrounds/{cat_id}/{v['filename']}",
+                        "duration": v["duration"],
+                        "width": v["width"],
+                        "height": v["height"],
+                        "size": v["size"],
+                    }
+                    for v in videos
+                ],
+                "video_count": len(videos),
+            })
+        return result
+
+    def choose(self, category: str) -> Optional[dict]:
+        """Pick a background from a category by round-robin or duration-weighted random"""
+        videos = self.videos.get(category) or []
+        if not videos:
+            return None
+        if self.strategy == "weighted":
+            # Longer clips loop less visibly, so they are picked proportionally more often
+            weights = [max(v["duration"], 1.0) for v in videos]
+            return random.choices(videos, weights=weights, k=1)[0]
+        with self._lock:
+            cursor = self._cursors.get(category, 0)
+            self._cursors[category] = cursor + 1
+        return videos[cursor % len(videos)]
@@ -0,0 +1,160 @@
+"""Caption timing: how long each caption line (and word) stays on screen.
+
+Time is allocated in proportion to how long a line takes to read (characters
+or estimated syllables at a reading speed), clamped to sane per-line bounds
+and fitted to the video length. ``[BEAT]`` markers from the caption prompt
+become short pauses with nothing on screen.
+
+All scheduling is done on NumPy arrays, so timing thousands of segments is a
+handful of vector operations. Nothing here touches ffmpeg.
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BEAT_MARKER = "[BEAT]"
+
+# Comfortable reading speeds for short-form captions
+READING_SPEED = {"chars": 15.0, "syllables": 4.5}
+MIN_LINE_SECONDS = 0.8
+MAX_LINE_SECONDS = 6.0
+BEAT_PAUSE_SECONDS = 0.6
+
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+", re.IGNORECASE)
+_WORD = re.compile(r"\S+")
+
+
+def parse_caption_script(captions: str) -> Tuple[List[str], np.ndarray]:
+    """Split LLM caption output into lines and the number of [BEAT] pauses after each line"""
+    lines: List[str] = []
+    pauses_after: List[int] = []
+    leading_beats = 0
+    for raw in captions.split("\n"):
+        beats = raw.count(BEAT_MARKER)
+        text = " ".join(raw.replace(BEAT_MARKER, " ").split())
+        if not text:
+            if lines:
+                pauses_after[-1] += beats
+            else:
+                leading_beats += beats
+            continue
+        if beats and raw.strip().startswith(BEAT_MARKER) and lines:
+            # "[BEAT] text" pauses before this line
+            pauses_after[-1] += 1
+            beats -= 1
+        lines.append(text)
+        pauses_after.append(beats)
+    return lines, np.asarray(pauses_after, dtype=np.float64)
+
+
+def estimate_syllables(word: str) -> int:
+    word = word.lower().strip(".,!?;:\"'()")
+    groups = len(_VOWEL_GROUPS.findall(word))
+    if word.endswith("e") and groups > 1 and not word.endswith(("le", "ee")):
+        groups -= 1
+    return max(groups, 1)
+
+
+def text_weight(text: str, unit: str = "chars") -> float:
+    if unit == "syllables":
+        return float(sum(estimate_syllables(w) for w in _WORD.findall(text)))
+    return float(len(text.replace(" ", "")))
+
+
+def schedule(
+    weights: np.ndarray,
+    pauses: np.ndarray,
+    total_duration: Optional[float] = None,
+    reading_speed: float = READING_SPEED["chars"],
+    min_duration: float = MIN_LINE_SECONDS,
+    max_duration: float = MAX_LINE_SECONDS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and end times for segments with the given reading weights and trailing pauses (seconds).
+
+    Without total_duration each segment gets its natural reading time. With it,
+    reading times are scaled so the segments plus pauses exactly fill the video;
+    when pauses alone would not fit they are shrunk first.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    pauses = np.asarray(pauses, dtype=np.float64)
+    if weights.size == 0:
+        return np.zeros(0), np.zeros(0)
+
+    durations = np.clip(weights / reading_speed, min_duration, max_duration)
+
+    if total_duration is not None:
+        pause_total = pauses.sum()
+        if pause_total > total_duration * 0.5:
+            pauses = pauses * (total_duration * 0.5 / pause_total)
+            pause_total = pauses.sum()
+        available = total_duration - pause_total
+        # Scale reading times to fill the video, keep short lines readable,
+        # then rescale so the total is exact
+        durations = np.maximum(durations * (available / durations.sum()), min(min_duration, available / weights.size))
+        durations *= available / durations.sum()
+
+    steps = durations + pauses
+    starts = np.concatenate(([0.0], np.cumsum(steps)[:-1]))
+    return starts, starts + durations
+
+
+def time_captions(
+    captions: str,
+    total_duration: Optional[float] = None,
+    unit: str = "chars",
+    reading_speed: Optional[float] = None,
+    durations: Optional[Sequence[float]] = None,
+) -> List[Tuple[float, float, str]]:
+    """(start, end, text) cues for LLM caption output.
+
+    If per-line durations are given (e.g. measured narration audio) they are used
+    as-is instead of reading-speed estimates.
+    """
+    lines, beats = parse_caption_script(captions)
+    if not lines:
+        return []
+    pauses = beats * BEAT_PAUSE_SECONDS
+
+    if durations is not None:
+        steps = np.asarray(durations, dtype=np.float64) + pauses
+        starts = np.concatenate(([0.0], np.cumsum(steps)[:-1]))
+        ends = starts + np.asarray(durations, dtype=np.float64)
+    else:
+        weights = np.fromiter((text_weight(line, unit) for line in lines), dtype=np.float64, count=len(lines))
+        starts, ends = schedule(
+            weights,
+            pauses,
+            total_duration,
+            reading_speed or READING_SPEED[unit],
+        )
+    return [(float(s), float(e), line) for s, e, line in zip(starts, ends, lines)]
+
+
+def word_timings(cues: Sequence[Tuple[float, float, str]], unit: str = "chars") -> List[List[Tuple[str, int]]]:
+    """Split each cue's duration across its words, in centiseconds, for karaoke \\k tags"""
+    words: List[str] = []
+    segment_ids: List[int] = []
+    for i, (_, _, text) in enumerate(cues):
+        line_words = _WORD.findall(text)
+        words.extend(line_words)
+        segment_ids.extend([i] * len(line_words))
+    if not words:
+        return [[] for _ in cues]
+
+    ids = np.asarray(segment_ids)
+    weights = np.fromiter((text_weight(w, unit) for w in words), dtype=np.float64, count=len(words))
+    seg_durations = np.asarray([end - start for start, end, _ in cues]) * 100.0
+    seg_weights = np.bincount(ids, weights=weights, minlength=len(cues))
+    share = weights / seg_weights[ids]
+    centis = np.floor(share * seg_durations[ids]).astype(np.int64)
+
+    # Give rounding leftovers to the last word of each segment so the \k sum matches the cue
+    totals = np.bincount(ids, weights=centis, minlength=len(cues)).astype(np.int64)
+    last_word = np.flatnonzero(np.r_[ids[1:] != ids[:-1], True])
+    centis[last_word] += np.floor(seg_durations[ids[last_word]]).astype(np.int64) - totals[ids[last_word]]
+
+    result: List[List[Tuple[str, int]]] = [[] for _ in cues]
+    for word, seg, cs in zip(words, ids.tolist(), centis.tolist()):
+        result[seg].append((word, cs))
+    return result
@@ -0,0 +1,123 @@
+"""Split-screen compositor: an uploaded clip stacked with a looping background.
+
+Backgrounds are normalized once per pane size (scaled and cropped to cover
+the pane, constant frame rate, yuv420p, no audio, short GOP) and cached by
+source path, size, mtime and geometry. A render then decodes the
+normalized loop as-is; only the user clip is decoded and scaled per request.
+Clip and background are combined with vstack/hstack in one filter graph.
+"""
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FPS = 30
+
+# layout -> (stack filter, pane width, pane height, clip is the first pane)
+SPLIT_LAYOUTS = {
+    "top_bottom": ("vstack", 1080, 960, True),
+    "bottom_top": ("vstack", 1080, 960, False),
+    "left_right": ("hstack", 960, 1080, True),
+    "right_left": ("hstack", 960, 1080, False),
+}
+
+_normalize_locks: Dict[str, threading.Lock] = {}
+_normalize_locks_guard = threading.Lock()
+
+
+def cover_filter(width: int, height: int) -> str:
+    """Scale to cover width x height, then center-crop to exactly that size"""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+        f"crop={width}:{height},setsar=1"
+    )
+
+
+def normalized_background_path(source: Path, cache_dir: Path, width: int, height: int) -> Path:
+    stat = source.stat()
+    key = hashlib.sha1(f"{source.resolve()}\0{stat.st_size}\0{stat.st_mtime}\0{width}x{height}".encode()).hexdigest()[:16]
+    return cache_dir / f"{source.stem}_{width}x{height}_{key}.mp4"
+
+
+def normalize_background(source: Path, cache_dir: Path, width: int, height: int, timeout: int = 600) -> Path:
+    """Cached pane-sized, constant-rate, silent copy of a background video"""
+    target = normalized_background_path(source, cache_dir, width, height)
+    if target.exists():
+        return target
+
+    with _normalize_locks_guard:
+        lock = _normalize_locks.setdefault(str(target), threading.Lock())
+    with lock:
+        if target.exists():
+            return target
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.stem}.{uuid.uuid4().hex[:8]}.tmp.mp4")
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error', '-nostdin',
+            '-i', str(source),
+            '-an', '-sn',
+            '-vf', f"{cover_filter(width, height)},fps={OUTPUT_FPS},format=yuv420p",
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20',
+            # Short GOP so the looped input restarts cheaply
+            '-g', str(OUTPUT_FPS * 2),
+            '-movflags', '+faststart',
+            str(tmp_path)
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+            if result.returncode != 0:
+                raise RuntimeError(f"Background normalization failed: {result.stderr.strip()}")
+            os.replace(tmp_path, target)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    logger.info(f"Normalized background {source.name} to {width}x{height}")
+    return target
+
+
+def build_split_screen_command(
+    clip_path: str,
+    background_path: str,
+    output_path: str,
+    layout: str,
+    duration: float,
+    clip_start: float = 0.0,
+    has_audio: bool = True,
+    output_args: Optional[List[str]] = None,
+) -> List[str]:
+    """ffmpeg command stacking the clip segment and a normalized background loop"""
+    stack, width, height, clip_first = SPLIT_LAYOUTS[layout]
+    panes = "[clip][bg]" if clip_first else "[bg][clip]"
+    graph = (
+        f"[0:v]{cover_filter(width, height)},fps={OUTPUT_FPS},format=yuv420p[clip];"
+        f"[1:v]setpts=PTS-STARTPTS[bg];"
+        f"{panes}{stack}=inputs=2:shortest=1[v]"
+    )
+    cmd = [
+        'ffmpeg', '-y', '-nostdin',
+        '-ss', str(clip_start),
+        '-t', str(duration),
+        '-i', clip_path,
+        '-stream_loop', '-1',
+        '-i', background_path,
+        '-filter_complex', graph,
+        '-map', '[v]'
+    ]
+    if has_audio:
+        # The clip carries the audio; backgrounds are silent
+        cmd += ['-map', '0:a:0', '-c:a', 'aac', '-b:a', '128k']
+    cmd += [
+        '-t', str(duration),
+        '-r', str(OUTPUT_FPS),
+        '-c:v', 'libx264',
+        '-preset', 'fast',
+        '-crf', '23',
+        *(output_args or []),
+        output_path
+    ]
+    return cmd
@@ -0,0 +1,149 @@
+"""Video file delivery for uploads, outputs and backgrounds.
+
+The API always authorizes and resolves the file itself. How the bytes reach the
+client depends on the configured mode:
+
+- ``stream``: Starlette ``FileResponse``; bytes are read and sent by this process.
+- ``sendfile``: 307 redirect to a short-lived signed URL on ``media_server.py``,
+  which serves the file with ``os.sendfile`` (zero-copy, no Python per-byte work).
+- ``x-accel-redirect``: empty response with an ``X-Accel-Redirect`` header so a
+  fronting nginx serves the file from an ``internal`` location.
+- ``x-sendfile``: empty response with an ``X-Sendfile`` header (Apache, lighttpd).
+
+Files that are still being rendered (fragmented MP4 mode) are always followed
+from this process with ``follow_response``, since neither sendfile nor a proxy
+can serve a file that is still growing.
+"""
+import asyncio
+import hashlib
+import hmac
+import time
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Optional
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+
+DELIVERY_MODES = ("stream", "sendfile", "x-accel-redirect", "x-sendfile")
+
+MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".jpg": "image/jpeg",
+    ".vtt": "text/vtt",
+}
+
+
+def resolve_media_path(base_dir: Path, *parts: str) -> Optional[Path]:
+    """Resolve a path below base_dir, rejecting traversal and missing files"""
+    base = base_dir.resolve()
+    try:
+        candidate = base.joinpath(*parts).resolve()
+    except (OSError, ValueError):
+        return None
+    if base not in candidate.parents or not candidate.is_file():
+        return None
+    return candidate
+
+
+def sign_media_path(key: bytes, path: str, expires: int) -> str:
+    """HMAC signature for a media path, shared with media_server.py"""
+    message = f"{path}:{expires}".encode("utf-8")
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def verify_media_signature(key: bytes, path: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_media_path(key, path, expires), signature)
+
+
+async def follow_file(
+    file_path: Path,
+    is_active: Callable[[], bool],
+    chunk_size: int = 256 * 1024,
+    poll_interval: float = 0.25,
+) -> AsyncIterator[bytes]:
+    """Yield a file's bytes as the writer appends them, until the writer is done"""
+    while not file_path.exists():
+        if not is_active():
+            return
+        await asyncio.sleep(poll_interval)
+
+    async with await anyio.open_file(file_path, mode="rb") as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if chunk:
+                yield chunk
+            elif is_active():
+                await asyncio.sleep(poll_interval)
+            else:
+                # Writer finished; drain whatever landed after the last read
+                rest = await f.read()
+                if rest:
+                    yield rest
+                return
+
+
+class MediaDelivery:
+    """Builds the response for an authorized media request according to the delivery mode"""
+
+    def __init__(
+        self,
+        roots: Dict[str, Path],
+        mode: str = "stream",
+        accel_prefix: str = "/protected",
+        sendfile_base_url: Optional[str] = None,
+        signing_key: str = "",
+        url_ttl: int = 300,
+    ):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f"Unknown delivery mode '{mode}'. Choose from: {', '.join(DELIVERY_MODES)}")
+        if mode == "sendfile" and not sendfile_base_url:
+            raise ValueError("sendfile delivery requires MEDIA_SERVER_URL")
+        self.roots = roots
+        self.mode = mode
+        self.accel_prefix = accel_prefix.rstrip("/")
+        self.sendfile_base_url = (sendfile_base_url or "").rstrip("/")
+        self.signing_key = signing_key.encode("utf-8")
+        self.url_ttl = url_ttl
+
+    def signed_url(self, root: str, relative_path: str) -> str:
+        expires = int(time.time()) + self.url_ttl
+        media_path = f"{root}/{relative_path}"
+        signature = sign_media_path(self.signing_key, media_path, expires)
+        return f"{self.sendfile_base_url}/{quote(media_path)}?expires={expires}&sig={signature}"
+
+    def response(self, root: str, *parts: str, media_type: str = "video/mp4", not_found: str = "File not found") -> Response:
+        base_dir = self.roots[root]
+        file_path = resolve_media_path(base_dir, *parts)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail=not_found)
+
+        relative_path = file_path.relative_to(base_dir.resolve()).as_posix()
+
+        if self.mode == "sendfile":
+            return RedirectResponse(self.signed_url(root, relative_path), status_code=307)
+        if self.mode == "x-accel-redirect":
+            return Response(
+                media_type=media_type,
+                headers={"X-Accel-Redirect": quote(f"{self.accel_prefix}/{root}/{relative_path}")},
+            )
+        if self.mode == "x-sendfile":
+            return Response(media_type=media_type, headers={"X-Sendfile": str(file_path)})
+        return FileResponse(file_path, media_type=media_type)
+
+    def follow_response(self, root: str, filename: str, is_active: Callable[[], bool], media_type: str = "video/mp4") -> Response:
+        """Stream a file that is still being written (fragmented MP4 renders)"""
+        base = self.roots[root].resolve()
+        file_path = (base / filename).resolve()
+        if file_path.parent != base:
+            raise HTTPException(status_code=404, detail="File not found")
+        return StreamingResponse(
+            follow_file(file_path, is_active),
+            media_type=media_type,
+            headers={"Cache-Control": "no-store"},
+        )
@@ -0,0 +1,43 @@
+"""Deterministic stand-in for the LLM (``LLM_BACKEND=fake``).
+
+Used by load tests and local development: no API key, no network, no cost.
+Structured prompts (see llm_output.schema_instructions) get JSON that
+validates against the requested schema; free-text prompts get the input
+echoed back as short lines, which is a usable caption script. An optional
+latency simulates the provider's response time without holding the event
+loop.
+"""
+import asyncio
+import json
+import re
+
+_CLIP_LINE = re.compile(r"^- Clip \d+:", re.MULTILINE)
+_TRANSCRIPT = re.compile(r"TRANSCRIPT:\s*\n(.*?)\n\s*\n", re.DOTALL)
+
+
+def fake_caption(index: int = 0) -> dict:
+    return {
+        "caption": f"You won't believe what happens next 🔥 (clip {index + 1})",
+        "hashtags": "#fyp #viral #foryou #trending #mustwatch",
+        "hook": "Wait for it...",
+        "cta": "Follow for more",
+        "summary": "Trimmed to the most engaging section with a hook-first cut.",
+    }
+
+
+def fake_response(prompt: str) -> str:
+    if '"title":"BatchCaptionOutput"' in prompt:
+        count = max(len(_CLIP_LINE.findall(prompt)), 1)
+        return json.dumps({"clips": [fake_caption(i) for i in range(count)]})
+    if '"title":"CaptionOutput"' in prompt:
+        return json.dumps(fake_caption())
+    match = _TRANSCRIPT.search(prompt)
+    source = match.group(1) if match else prompt
+    words = source.split()[:60]
+    return "\n".join(" ".join(words[i:i + 6]) for i in range(0, len(words), 6))
+
+
+async def fake_generate(prompt: str, system_message: str, latency: float = 0.0) -> str:
+    if latency > 0:
+        await asyncio.sleep(latency)
+    return fake_response(prompt)
@@ -0,0 +1,228 @@
+"""Highlight detection: where in a source video the most engaging window is.
+
+ffmpeg streams tiny grayscale frames (64x36 at 4 fps) and 8 kHz mono audio
+into NumPy. Per second of video we score:
+
+- scene change: histogram distance between consecutive frames (cuts)
+- motion energy: mean absolute pixel difference between consecutive frames
+- loudness: audio RMS in dB
+
+Each feature is robust-normalized and combined, and the best window of the
+requested length is found with a cumulative-sum sliding window. Per-second
+scores are cached on disk by the source's content hash, so any target
+duration (and any retry) reuses one analysis.
+"""
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 36
+FRAME_RATE = 4
+AUDIO_RATE = 8000
+HISTOGRAM_BINS = 16
+
+FEATURE_WEIGHTS = {"loudness": 0.4, "motion": 0.35, "scene": 0.25}
+
+
+def source_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def read_frames(path: str) -> np.ndarray:
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-i', path,
+        '-an', '-sn',
+        '-vf', f"fps={FRAME_RATE},scale={FRAME_WIDTH}:{FRAME_HEIGHT},format=gray",
+        '-f', 'rawvideo', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    frame_size = FRAME_WIDTH * FRAME_HEIGHT
+    usable = len(result.stdout) // frame_size * frame_size
+    return np.frombuffer(result.stdout[:usable], dtype=np.uint8).reshape(-1, FRAME_HEIGHT, FRAME_WIDTH)
+
+
+def read_audio(path: str) -> np.ndarray:
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-i', path,
+        '-vn', '-sn', '-ac', '1', '-ar', str(AUDIO_RATE),
+        '-f', 's16le', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    usable = len(result.stdout) // 2 * 2
+    return np.frombuffer(result.stdout[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def per_second(values: np.ndarray, per_sec: int, seconds: int) -> np.ndarray:
+    """Average consecutive samples into one value per second, padded to `seconds`"""
+    out = np.zeros(seconds, dtype=np.float64)
+    if values.size == 0:
+        return out
+    whole = min(values.size // per_sec, seconds)
+    if whole:
+        out[:whole] = values[: whole * per_sec].reshape(whole, per_sec).mean(axis=1)
+    if whole < seconds and values.size > whole * per_sec:
+        out[whole] = values[whole * per_sec:].mean()
+    return out
+
+
+def per_second_max(values: np.ndarray, per_sec: int, seconds: int) -> np.ndarray:
+    """Largest sample in each second; a cut anywhere in the second counts, not its average"""
+    padded = np.zeros(seconds * per_sec, dtype=np.float64)
+    n = min(values.size, padded.size)
+    padded[:n] = values[:n]
+    return padded.reshape(seconds, per_sec).max(axis=1)
+
+
+def robust_normalize(values: np.ndarray) -> np.ndarray:
+    median = np.median(values)
+    spread = np.percentile(values, 90) - np.percentile(values, 10)
+    if spread <= 1e-9:
+        return np.zeros_like(values)
+    return np.clip((values - median) / spread, -3.0, 3.0)
+
+
+def compute_scores(frames: np.ndarray, audio: np.ndarray) -> np.ndarray:
+    """Combined engagement score for each second of video"""
+    seconds = int(np.ceil(max(len(frames) / FRAME_RATE, len(audio) / AUDIO_RATE)))
+    if seconds == 0:
+        return np.zeros(0)
+
+    if len(frames) > 1:
+        pixels = frames.reshape(len(frames), -1).astype(np.int16)
+        motion = np.abs(np.diff(pixels, axis=0)).mean(axis=1)
+        bins = (pixels >> (8 - int(np.log2(HISTOGRAM_BINS)))).astype(np.int64)
+        offsets = np.arange(len(frames))[:, None] * HISTOGRAM_BINS
+        hist = np.bincount((bins + offsets).ravel(), minlength=len(frames) * HISTOGRAM_BINS)
+        hist = hist.reshape(len(frames), HISTOGRAM_BINS) / pixels.shape[1]
+        scene = 0.5 * np.abs(np.diff(hist, axis=0)).sum(axis=1)
+        motion = np.concatenate(([0.0], motion))
+        scene = np.concatenate(([0.0], scene))
+    else:
+        motion = scene = np.zeros(len(frames))
+
+    window = AUDIO_RATE // 4
+    n_windows = len(audio) // window
+    if n_windows:
+        rms = np.sqrt(np.square(audio[: n_windows * window].reshape(n_windows, window)).mean(axis=1))
+        loudness = 20 * np.log10(rms + 1e-6)
+    else:
+        loudness = np.zeros(0)
+
+    features = {
+        "motion": per_second(motion, FRAME_RATE, seconds),
+        "scene": per_second_max(scene, FRAME_RATE, seconds),
+        "loudness": per_second(loudness, 4, seconds),
+    }
+    return sum(FEATURE_WEIGHTS[name] * robust_normalize(values) for name, values in features.items())
+
+
+def window_sums(scores: np.ndarray, window: int) -> np.ndarray:
+    """Sum of scores for every window start (sliding window over a cumulative sum)"""
+    csum = np.concatenate(([0.0], np.cumsum(scores)))
+    return csum[window:] - csum[:-window]
+
+
+def best_window_start(scores: np.ndarray, target_duration: float) -> float:
+    window = int(round(target_duration))
+    if window <= 0 or len(scores) <= window:
+        return 0.0
+    return float(np.argmax(window_sums(scores, window)))
+
+
+def top_windows(scores: np.ndarray, target_duration: float, count: int) -> List[Tuple[float, float]]:
+    """Up to `count` non-overlapping (start, mean score) windows, best first"""
+    window = int(round(target_duration))
+    if window <= 0 or len(scores) < window:
+        return []
+    sums = window_sums(np.asarray(scores, dtype=np.float64), window)
+    available = np.ones(len(sums), dtype=bool)
+    picks: List[Tuple[float, float]] = []
+    while len(picks) < count and available.any():
+        best = int(np.argmax(np.where(available, sums, -np.inf)))
+        picks.append((float(best), float(sums[best] / window)))
+        # No later window may start within one window length of this one
+        available[max(best - window + 1, 0):best + window] = False
+    return picks
+
+
+def analyze_source(path: str, cache_dir: str) -> List[float]:
+    """Per-second engagement scores for a source, cached by content hash (runs in a worker process)"""
+    digest = source_hash(path)
+    cache_path = Path(cache_dir) / f"{digest}.json"
+    if cache_path.exists():
+        return json.loads(cache_path.read_text())["scores"]
+
+    # Decode video and audio concurrently; each ffmpeg only decodes the stream it needs
+    audio_holder = {}
+    audio_thread = threading.Thread(target=lambda: audio_holder.setdefault("audio", read_audio(path)))
+    audio_thread.start()
+    frames = read_frames(path)
+    audio_thread.join()
+    scores = compute_scores(frames, audio_holder.get("audio", np.zeros(0, dtype=np.float32)))
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f".{digest}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps({"scores": [round(float(s), 4) for s in scores]}))
+    os.replace(tmp_path, cache_path)
+    return scores.tolist()
+
+
+def clip_start(scores: Optional[List[float]], original_duration: float, target_duration: float) -> Optional[float]:
+    """Best start for a clip, or None to fall back to the fixed offset"""
+    if not scores or original_duration <= target_duration:
+        return None
+    start = best_window_start(np.asarray(scores), target_duration)
+    return min(start, max(original_duration - target_duration, 0.0))
+
+
+class HighlightAnalyzer:
+    """Process-pool highlight analysis; concurrent requests for the same source share one job"""
+
+    def __init__(self, cache_dir: Path, workers: int = 2):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, path: str) -> Future:
+        """Future resolving to the per-second scores for a source"""
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            future = self.pool.submit(analyze_source, path, str(self.cache_dir))
+            self._pending[path] = future
+        # Outside the lock: a future that is already done runs the callback right here, and _forget takes the lock
+        future.add_done_callback(lambda done: self._forget(path, done))
+        return future
+
+    def _forget(self, path: str, future: Future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
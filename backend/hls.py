@@ -0,0 +1,109 @@
+"""HLS rendition ladder packaging for finished outputs.
+
+One ffmpeg pass decodes the output once, splits it into every rung of the
+ladder and writes fMP4 segments plus a master playlist:
+
+    <hls_dir>/master.m3u8
+    <hls_dir>/<rung>/index.m3u8, init_N.mp4, seg_000.m4s, ...
+"""
+import logging
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+from renders import run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+# Rungs are defined by the short side so the same ladder fits portrait and landscape outputs
+HLS_LADDER = [
+    {"name": "1080p", "short_side": 1080, "video_bitrate": 5000, "audio_bitrate": 128},
+    {"name": "720p", "short_side": 720, "video_bitrate": 2800, "audio_bitrate": 128},
+    {"name": "480p", "short_side": 480, "video_bitrate": 1200, "audio_bitrate": 96},
+    {"name": "360p", "short_side": 360, "video_bitrate": 600, "audio_bitrate": 64},
+]
+
+SEGMENT_SECONDS = 4
+
+
+def select_ladder(source_short_side: int, ladder: List[dict] = HLS_LADDER) -> List[dict]:
+    """Drop rungs that would upscale the source, always keeping the smallest one"""
+    rungs = [r for r in ladder if r["short_side"] <= source_short_side]
+    return rungs or [ladder[-1]]
+
+
+def build_hls_command(input_path: str, hls_dir: str, rungs: List[dict], has_audio: bool) -> List[str]:
+    split_outputs = "".join(f"[s{i}]" for i in range(len(rungs)))
+    filters = [f"[0:v]split={len(rungs)}{split_outputs}"]
+    for i, rung in enumerate(rungs):
+        side = rung["short_side"]
+        filters.append(
+            f"[s{i}]scale=w='if(gt(iw,ih),-2,{side})':h='if(gt(iw,ih),{side},-2)'[v{i}]"
+        )
+
+    cmd = ['ffmpeg', '-y', '-i', input_path, '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for i, rung in enumerate(rungs):
+        cmd += ['-map', f'[v{i}]']
+        if has_audio:
+            cmd += ['-map', '0:a:0']
+        cmd += [
+            f'-b:v:{i}', f"{rung['video_bitrate']}k",
+            f'-maxrate:v:{i}', f"{int(rung['video_bitrate'] * 1.07)}k",
+            f'-bufsize:v:{i}', f"{rung['video_bitrate'] * 2}k",
+        ]
+        if has_audio:
+            cmd += [f'-b:a:{i}', f"{rung['audio_bitrate']}k"]
+        stream_map.append(f"v:{i},a:{i},name:{rung['name']}" if has_audio else f"v:{i},name:{rung['name']}")
+
+    cmd += [
+        '-c:v', 'libx264',
+        '-preset', 'fast',
+        # Aligned keyframes across rungs so players can switch at any segment boundary
+        '-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_SECONDS})',
+    ]
+    if has_audio:
+        cmd += ['-c:a', 'aac']
+    cmd += [
+        '-f', 'hls',
+        '-hls_time', str(SEGMENT_SECONDS),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_flags', 'independent_segments',
+        '-master_pl_name', 'master.m3u8',
+        '-hls_segment_filename', f'{hls_dir}/%v/seg_%03d.m4s',
+        '-var_stream_map', ' '.join(stream_map),
+        f'{hls_dir}/%v/index.m3u8',
+    ]
+    return cmd
+
+
+def package_hls_ladder(
+    input_path: str,
+    hls_dir: str,
+    width: int,
+    height: int,
+    has_audio: bool,
+    timeout: Optional[float] = None,
+) -> Optional[List[dict]]:
+    """Package input_path as an HLS ladder in hls_dir; returns the rungs written or None on failure"""
+    rungs = select_ladder(min(width, height)) if width and height else HLS_LADDER
+    out_dir = Path(hls_dir)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+
+    cmd = build_hls_command(input_path, str(out_dir), rungs, has_audio)
+    try:
+        # Own process group, killed whole on timeout
+        result = run_ffmpeg(cmd, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f"HLS packaging timed out for {input_path}")
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return None
+
+    if result.returncode != 0 or not (out_dir / "master.m3u8").exists():
+        logger.error(f"HLS packaging error: {result.stderr}")
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return None
+    return rungs
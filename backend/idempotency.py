@@ -0,0 +1,127 @@
+"""Idempotency keys for POST endpoints that start expensive work.
+
+A client sends ``Idempotency-Key: <unique string>`` and may resend the same
+request as often as it likes. The first request claims ``(user, key)``
+with an insert that the unique index makes atomic, then does the work.
+Retries with the same key:
+
+- get the stored response once the first request has finished
+- wait for it while it is still running (inline renders); a queued render
+  is recorded as soon as its job exists, so retries attach to that job
+- are rejected when the key was used for a different request (the
+  fingerprint of the parameters differs)
+
+A request that fails releases its key so the next retry does the work; so
+does a queued render whose job failed or was cancelled (``reopen``).
+A request that is still working keeps renewing its lock (``hold``), however
+long its render takes; a claim whose request died without releasing it can
+be taken over once its lock expires. Records expire through a TTL index.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with different parameters"""
+
+
+def fingerprint(scope: str, params: dict) -> str:
+    """Stable hash of what the request asks for"""
+    canonical = json.dumps({"scope": scope, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, collection, ttl: timedelta = timedelta(hours=24), lock: timedelta = timedelta(minutes=15)):
+        self.collection = collection
+        self.ttl = ttl
+        self.lock = lock
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("user_id", 1), ("key", 1)], unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def begin(self, user_id: str, key: str, request_fingerprint: str) -> Optional[dict]:
+        """Claim the key: None when this request should do the work, else the record of the one that did"""
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({
+                "user_id": user_id,
+                "key": key,
+                "fingerprint": request_fingerprint,
+                "status": "in_progress",
+                "locked_until": now + self.lock,
+                "created_at": now,
+                "expires_at": now + self.ttl,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        # A claim left behind by a request that died mid-way
+        taken = await self.collection.find_one_and_update(
+            {
+                "user_id": user_id, "key": key, "fingerprint": request_fingerprint,
+                "status": "in_progress", "locked_until": {"$lt": now},
+            },
+            {"$set": {"locked_until": now + self.lock}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if taken is not None:
+            return None
+        record = await self.collection.find_one({"user_id": user_id, "key": key}, {"_id": 0})
+        if record is None:
+            # Released between the insert and the lookup
+            return await self.begin(user_id, key, request_fingerprint)
+        if record["fingerprint"] != request_fingerprint:
+            raise IdempotencyConflict(key)
+        return record
+
+    async def get(self, user_id: str, key: str) -> Optional[dict]:
+        return await self.collection.find_one({"user_id": user_id, "key": key}, {"_id": 0})
+
+    async def hold(self, user_id: str, key: str):
+        """Renew the lock on this request's claim every third of its length, until cancelled"""
+        while True:
+            await asyncio.sleep(self.lock.total_seconds() / 3)
+            await self.collection.update_one(
+                {"user_id": user_id, "key": key, "status": "in_progress"},
+                {"$set": {"locked_until": datetime.now(timezone.utc) + self.lock}},
+            )
+
+    async def complete(self, user_id: str, key: str, status_code: int, body, job_id: Optional[str] = None):
+        now = datetime.now(timezone.utc)
+        await self.collection.update_one(
+            {"user_id": user_id, "key": key},
+            {
+                "$set": {
+                    "status": "completed", "status_code": status_code, "response": body,
+                    "job_id": job_id, "completed_at": now, "expires_at": now + self.ttl,
+                },
+                "$unset": {"locked_until": ""},
+            },
+        )
+
+    async def reopen(self, user_id: str, key: str, job_id: str) -> bool:
+        """Claim a completed key again because its job failed; False when another retry got there first"""
+        now = datetime.now(timezone.utc)
+        result = await self.collection.update_one(
+            {"user_id": user_id, "key": key, "status": "completed", "job_id": job_id},
+            {
+                "$set": {"status": "in_progress", "locked_until": now + self.lock, "expires_at": now + self.ttl},
+                "$unset": {"status_code": "", "response": "", "job_id": "", "completed_at": ""},
+            },
+        )
+        return result.modified_count == 1
+
+    async def release(self, user_id: str, key: str):
+        """Forget an in-progress claim whose request failed"""
+        await self.collection.delete_one({"user_id": user_id, "key": key, "status": "in_progress"})
@@ -0,0 +1,298 @@
+"""Mongo-backed render job queue, drained by any number of worker processes.
+
+A job is one document in the jobs collection. Its ``status`` goes
+``queued -> running -> completed | failed``, or to ``cancelled`` from
+either of the first two:
+
+- ``claim()`` takes the oldest runnable job with one atomic
+  ``find_one_and_update``. A job is runnable when it is queued and due, or
+  when it is running on a lease that has expired because its worker died or
+  stalled. The claim sets a lease of ``lease_seconds`` and counts an attempt
+- while a handler runs, the worker renews the lease every few seconds. If a
+  heartbeat finds the job is no longer its own (cancelled, or taken over
+  after a stall), the handler is cancelled
+- a handler that raises is retried with exponential backoff until
+  ``max_attempts`` is reached. ``JobFailed`` means retrying cannot help
+  (missing input, invalid request), so the job fails at once
+- a job whose last attempt's lease expires is marked failed by ``reap()``
+
+Delivery is at least once. Handlers must tolerate running twice for the
+same job, for example by writing their results under ids fixed at enqueue
+time. Finished jobs expire through a TTL index after ``retention``.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED = ("completed", "failed", "cancelled")
+RENDER_MODES = ("inline", "queue")
+
+
+class JobFailed(Exception):
+    """A job that cannot succeed on retry"""
+
+
+def public_job(job: dict) -> dict:
+    """The fields a client may see"""
+    def stamp(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "result": job.get("result"),
+        "created_at": stamp(job.get("created_at")),
+        "started_at": stamp(job.get("started_at")),
+        "finished_at": stamp(job.get("finished_at")),
+    }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        collection,
+        lease_seconds: float = 60,
+        max_attempts: int = 3,
+        retry_delay: float = 5,
+        retention: timedelta = timedelta(days=7),
+    ):
+        self.collection = collection
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("status", 1), ("available_at", 1)])
+        await self.collection.create_index([("status", 1), ("lease_expires", 1)])
+        await self.collection.create_index([("user_id", 1), ("created_at", -1)])
+        await self.collection.create_index("output_filename", sparse=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def enqueue(self, kind: str, params: dict, user_id: str, output_filename: Optional[str] = None) -> dict:
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "user_id": user_id,
+            "params": params,
+            "output_filename": output_filename,
+            "status": "queued",
+            "attempts": 0,
+            "available_at": now,
+            "lease_expires": None,
+            "worker": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.collection.insert_one(job)
+        job.pop("_id", None)
+        return job
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        query = {"id": job_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return await self.collection.find_one(query, {"_id": 0})
+
+    async def pending_outputs(self, output_filenames: List[str]) -> Set[str]:
+        """Which of these outputs a queued or running job will (still) write"""
+        cursor = self.collection.find(
+            {"output_filename": {"$in": output_filenames}, "status": {"$in": ["queued", "running"]}},
+            {"_id": 0, "output_filename": 1}
+        )
+        return {job["output_filename"] async for job in cursor}
+
+    async def claim(self, worker_id: str, kinds: Iterable[str]) -> Optional[dict]:
+        """Lease the oldest runnable job of one of these kinds"""
+        now = datetime.now(timezone.utc)
+        job = await self.collection.find_one_and_update(
+            {
+                "kind": {"$in": list(kinds)},
+                "$or": [
+                    {"status": "queued", "available_at": {"$lte": now}},
+                    {"status": "running", "lease_expires": {"$lt": now}, "attempts": {"$lt": self.max_attempts}},
+                ],
+            },
+            {
+                "$set": {"status": "running", "worker": worker_id, "lease_expires": now + self.lease, "started_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            job.pop("_id")
+        return job
+
+    async def heartbeat(self, job: dict) -> bool:
+        """Extend the lease; False when the job has been taken over or finished meanwhile"""
+        result = await self.collection.update_one(
+            {"id": job["id"], "worker": job["worker"], "status": "running"},
+            {"$set": {"lease_expires": datetime.now(timezone.utc) + self.lease}},
+        )
+        return result.matched_count == 1
+
+    async def _finish(self, job: dict, update: dict) -> bool:
+        result = await self.collection.update_one(
+            {"id": job["id"], "worker": job["worker"], "status": "running"}, {"$set": update}
+        )
+        return result.matched_count == 1
+
+    async def complete(self, job: dict, result: dict) -> bool:
+        now = datetime.now(timezone.utc)
+        return await self._finish(job, {
+            "status": "completed", "result": result, "error": None,
+            "finished_at": now, "expires_at": now + self.retention, "lease_expires": None,
+        })
+
+    async def fail(self, job: dict, error: str, retry: bool = True) -> bool:
+        """Requeue with backoff, or fail for good after the last attempt"""
+        now = datetime.now(timezone.utc)
+        if retry and job["attempts"] < self.max_attempts:
+            delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+            return await self._finish(job, {
+                "status": "queued", "error": error, "worker": None, "lease_expires": None,
+                "available_at": now + timedelta(seconds=delay),
+            })
+        return await self._finish(job, {
+            "status": "failed", "error": error, "finished_at": now,
+            "expires_at": now + self.retention, "lease_expires": None,
+        })
+
+    async def cancel(self, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        """Cancel a queued or running job; None if there is no such unfinished job"""
+        now = datetime.now(timezone.utc)
+        query = {"id": job_id, "status": {"$in": ["queued", "running"]}}
+        if user_id is not None:
+            query["user_id"] = user_id
+        job = await self.collection.find_one_and_update(
+            query,
+            {"$set": {
+                "status": "cancelled", "error": "Cancelled", "finished_at": now,
+                "expires_at": now + self.retention, "lease_expires": None,
+            }},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            job.pop("_id")
+        return job
+
+    async def reap(self) -> int:
+        """Fail jobs whose final attempt's lease ran out"""
+        now = datetime.now(timezone.utc)
+        result = await self.collection.update_many(
+            {"status": "running", "lease_expires": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {
+                "status": "failed", "error": "Worker stopped responding",
+                "finished_at": now, "expires_at": now + self.retention, "lease_expires": None,
+            }},
+        )
+        return result.modified_count
+
+    async def depth(self) -> Dict[str, int]:
+        counts = {status: 0 for status in STATUSES}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["n"]
+        return counts
+
+
+class JobWorker:
+    """Claims jobs and runs ``handlers[kind](params)``, ``concurrency`` at a time"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[dict], Awaitable[dict]]],
+        concurrency: int = 1,
+        poll_interval: float = 1.0,
+        heartbeat_interval: float = 5.0,
+        worker_id: Optional[str] = None,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        # Also how quickly a cancelled job is noticed; never so rare that the lease lapses
+        self.heartbeat_interval = min(heartbeat_interval, queue.lease.total_seconds() / 3)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Finish the jobs in hand, claim no more"""
+        self._stopping.set()
+
+    async def run(self):
+        logger.info(f"Worker {self.worker_id} taking {', '.join(self.handlers)} jobs, {self.concurrency} at a time")
+        await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _slot(self):
+        while not self._stopping.is_set():
+            try:
+                await self.queue.reap()
+                job = await self.queue.claim(self.worker_id, self.handlers)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                await self._idle()
+                continue
+            await self.run_job(job)
+
+    async def _keep_leased(self, job: dict, task: asyncio.Task) -> bool:
+        """Renew the lease until the task is done; cancels it and returns True if the lease is lost"""
+        while not task.done():
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                owned = await self.queue.heartbeat(job)
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {job['id']} failed: {e}")
+                continue
+            if not owned:
+                logger.warning(f"Job {job['id']} was cancelled or taken over, stopping it")
+                task.cancel()
+                return True
+        return False
+
+    async def run_job(self, job: dict):
+        handler = self.handlers[job["kind"]]
+        logger.info(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']}")
+        task = asyncio.create_task(handler(job["params"]))
+        keeper = asyncio.create_task(self._keep_leased(job, task))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if keeper.done() and not keeper.cancelled() and keeper.result():
+                return
+            raise
+        except JobFailed as e:
+            await self.queue.fail(job, str(e), retry=False)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} failed")
+            await self.queue.fail(job, str(e) or type(e).__name__)
+        else:
+            await self.queue.complete(job, result)
+        finally:
+            keeper.cancel()
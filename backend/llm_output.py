@@ -0,0 +1,166 @@
+"""Structured (JSON) LLM output: schema prompt, validating parser, local repair.
+
+The prompt carries the JSON schema of the expected pydantic model and asks
+for a bare JSON object. Parsing goes from cheapest to most expensive:
+
+1. validate the response as-is
+2. local repair: strip code fences and prose around the object, normalize
+   smart quotes, drop trailing commas, and as a last resort read legacy
+   ``KEY: value`` lines
+3. only then re-ask the model, quoting the validation error
+
+Outcomes are counted per output kind so the parse failure rate is visible,
+in /api/health and as the ``cliptag_llm_parse_total`` Prometheus counter.
+"""
+import json
+import logging
+import re
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from metrics import LLM_PARSE_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+DEFAULT_SUMMARY = "This clip was optimized for engagement using hook-first cuts and dynamic pacing."
+
+OUTCOMES = ("ok", "repaired", "retried", "failed")
+# kind -> Counter of outcomes
+PARSE_STATS: Dict[str, Counter] = {}
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE | re.MULTILINE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_KEY_LINE = re.compile(r"^\s*\**([A-Za-z_ ]+?)\**\s*:\s*(.+)$")
+
+
+class LLMOutputError(Exception):
+    pass
+
+
+class CaptionOutput(BaseModel):
+    caption: str = Field(min_length=1, description="Viral caption, 2-3 lines max, with emojis")
+    hashtags: str = Field(min_length=1, description="5 relevant hashtags separated by spaces")
+    hook: str = Field("", description="Hook phrase for the first 3 seconds")
+    cta: str = Field("", description="One call-to-action")
+    summary: str = Field(DEFAULT_SUMMARY, description="1 sentence about the optimization applied")
+
+    @field_validator("hashtags", mode="before")
+    @classmethod
+    def join_hashtags(cls, value):
+        if isinstance(value, list):
+            return " ".join(tag if str(tag).startswith("#") else f"#{tag}" for tag in value)
+        return value
+
+
+class BatchCaptionOutput(BaseModel):
+    clips: List[CaptionOutput] = Field(min_length=1, description="One entry per clip, in order")
+
+
+def record(kind: str, outcome: str):
+    PARSE_STATS.setdefault(kind, Counter())[outcome] += 1
+    LLM_PARSE_OUTCOMES.labels(kind, outcome).inc()
+
+
+def parse_stats() -> Dict[str, dict]:
+    """Outcome counts and failure rates (first-pass and final) per output kind"""
+    stats = {}
+    for kind, counts in PARSE_STATS.items():
+        total = sum(counts[k] for k in OUTCOMES)
+        stats[kind] = {
+            **{k: counts[k] for k in OUTCOMES},
+            "total": total,
+            "first_pass_failure_rate": round(1 - counts["ok"] / total, 4) if total else 0.0,
+            "failure_rate": round(counts["failed"] / total, 4) if total else 0.0,
+        }
+    return stats
+
+
+def schema_instructions(model: Type[BaseModel]) -> str:
+    schema = json.dumps(model.model_json_schema(), separators=(",", ":"))
+    return (
+        "Respond with a single JSON object and nothing else (no markdown, no commentary). "
+        f"It must validate against this JSON schema: {schema}"
+    )
+
+
+def extract_json_block(text: str) -> str:
+    """The outermost {...} in the text, without code fences or surrounding prose"""
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end <= start:
+        return text
+    return text[start:end + 1]
+
+
+def legacy_fields(text: str) -> dict:
+    """Read ``KEY: value`` lines (the pre-JSON response format)"""
+    fields = {}
+    for line in text.splitlines():
+        match = _KEY_LINE.match(line)
+        if match:
+            fields[match.group(1).strip().lower().replace(" ", "_")] = match.group(2).strip()
+    return fields
+
+
+def repair_candidates(text: str) -> List[object]:
+    block = extract_json_block(text).translate(_SMART_QUOTES)
+    candidates = []
+    for attempt in (block, _TRAILING_COMMA.sub(r"\1", block)):
+        try:
+            candidates.append(json.loads(attempt))
+        except json.JSONDecodeError:
+            continue
+    fields = legacy_fields(text)
+    if fields:
+        candidates.append(fields)
+    return candidates
+
+
+def parse_structured(text: str, model: Type[T]) -> Tuple[T, bool]:
+    """Validate an LLM response against model; returns (value, needed_repair)"""
+    try:
+        return model.model_validate_json(text), False
+    except ValidationError as first_error:
+        error = first_error
+    for candidate in repair_candidates(text):
+        try:
+            return model.model_validate(candidate), True
+        except ValidationError as e:
+            error = e
+    raise LLMOutputError(str(error))
+
+
+async def generate_structured(
+    generate: Callable[[str, str], Awaitable[str]],
+    prompt: str,
+    system_message: str,
+    model: Type[T],
+    kind: str,
+    retries: int = 1,
+) -> T:
+    """Ask for JSON matching model; repair locally and only re-ask the model when repair fails"""
+    full_prompt = f"{prompt}\n\n{schema_instructions(model)}"
+    response = await generate(full_prompt, system_message)
+    for attempt in range(retries + 1):
+        try:
+            value, repaired = parse_structured(response, model)
+        except LLMOutputError as e:
+            if attempt == retries:
+                record(kind, "failed")
+                raise
+            logger.warning(f"Unparseable {kind} output, retrying: {e}")
+            response = await generate(
+                f"{full_prompt}\n\nYour previous answer was not valid: {str(e)[:500]}\n"
+                "Return only the corrected JSON object.",
+                system_message
+            )
+            continue
+        record(kind, "retried" if attempt else ("repaired" if repaired else "ok"))
+        return value
+    raise LLMOutputError(f"No valid {kind} output")
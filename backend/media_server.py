@@ -0,0 +1,71 @@
+"""Zero-copy media server for VIDEO_DELIVERY_MODE=sendfile.
+
+The API authorizes each request and redirects to a signed URL on this server,
+which serves the file with aiohttp's FileResponse (os.sendfile on Linux, with
+Range support). Run it next to the API:
+
+    python media_server.py --host 0.0.0.0 --port 8002
+"""
+import argparse
+import os
+from pathlib import Path
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from delivery import MEDIA_TYPES, resolve_media_path, verify_media_signature
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+MEDIA_ROOTS = {
+    "videos": ROOT_DIR / "uploads",
+    "outputs": ROOT_DIR / "outputs",
+    "backgrounds": ROOT_DIR / "assets" / "backgrounds",
+    "hls": ROOT_DIR / "outputs" / "hls",
+    "thumbnails": ROOT_DIR / "thumbnails",
+}
+
+SIGNING_KEY = os.environ.get(
+    'MEDIA_SIGNING_KEY',
+    os.environ.get('JWT_SECRET', 'cliptag-ai-secret-key-2024')
+).encode('utf-8')
+
+
+async def serve_media(request: web.Request) -> web.StreamResponse:
+    root = request.match_info["root"]
+    relative_path = request.match_info["path"]
+    if root not in MEDIA_ROOTS:
+        raise web.HTTPNotFound()
+
+    try:
+        expires = int(request.query.get("expires", "0"))
+    except ValueError:
+        raise web.HTTPForbidden()
+    signature = request.query.get("sig", "")
+    if not verify_media_signature(SIGNING_KEY, f"{root}/{relative_path}", expires, signature):
+        raise web.HTTPForbidden()
+
+    file_path = resolve_media_path(MEDIA_ROOTS[root], relative_path)
+    if file_path is None:
+        raise web.HTTPNotFound()
+
+    response = web.FileResponse(file_path, chunk_size=1024 * 1024)
+    response.content_type = MEDIA_TYPES.get(file_path.suffix, "application/octet-stream")
+    return response
+
+
+def create_app(roots=None) -> web.Application:
+    if roots is not None:
+        MEDIA_ROOTS.update(roots)
+    app = web.Application()
+    app.router.add_get("/{root}/{path:.+}", serve_media)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ClipTag zero-copy media server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MEDIA_SERVER_PORT", 8002)))
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,140 @@
+"""Prometheus metrics: per-stage timings, HTTP latency, ffmpeg CPU and queues.
+
+- ``timed(stage)`` / ``stage_timer(stage)`` record a stage of a request
+  (probe, encode, LLM call, ...) in one histogram labelled by stage
+- ``MetricsMiddleware`` records latency and in-flight requests per route
+  template (``/api/outputs/{filename}``, not the concrete path)
+- ``MongoCommandMetrics`` is a pymongo command listener timing every Mongo
+  command by name
+- ``LLM_PARSE_OUTCOMES`` counts structured LLM output parses per kind and
+  outcome (see llm_output.py), so parse failures can be alerted on
+- CPU time of waited-for child processes (ffmpeg, ffprobe, TTS) is read
+  from ``getrusage(RUSAGE_CHILDREN)`` at scrape time
+"""
+import functools
+import inspect
+import resource
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, REGISTRY
+from pymongo import monitoring
+from starlette.routing import Match
+
+# Seconds; renders can take minutes
+STAGE_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "cliptag_stage_seconds", "Time spent in a processing stage", ["stage", "outcome"], buckets=STAGE_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "cliptag_http_request_seconds", "HTTP request latency by route", ["method", "route", "status"], buckets=STAGE_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("cliptag_http_requests_in_flight", "Requests being handled by route", ["method", "route"])
+MONGO_COMMAND_SECONDS = Histogram(
+    "cliptag_mongo_command_seconds", "Mongo command latency", ["command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+)
+UPLOAD_BYTES = Counter("cliptag_upload_bytes_total", "Bytes received in video uploads")
+EVENT_LOOP_STALLS = Counter("cliptag_event_loop_stalls_total", "Times the event loop was blocked past the lag threshold")
+QUEUE_DEPTH = Gauge("cliptag_queue_depth", "Work waiting for or holding a slot", ["queue", "state"])
+LLM_PARSE_OUTCOMES = Counter(
+    "cliptag_llm_parse_total", "Structured LLM outputs by parse outcome (ok, repaired, retried, failed)", ["kind", "outcome"]
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.labels(stage, outcome).observe(time.perf_counter() - started)
+
+
+def timed(stage: str):
+    """Decorator recording a sync or async function's duration as a stage"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ChildCPUCollector:
+    """CPU seconds used by child processes the server has waited for (ffmpeg, ffprobe, TTS)"""
+
+    def collect(self):
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        family = CounterMetricFamily(
+            "cliptag_child_process_cpu_seconds", "CPU time of finished child processes", labels=["mode"]
+        )
+        family.add_metric(["user"], usage.ru_utime)
+        family.add_metric(["system"], usage.ru_stime)
+        yield family
+
+
+REGISTRY.register(ChildCPUCollector())
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
+
+
+def route_template(scope) -> str:
+    """Path template of the route that will handle this request (bounded label cardinality)"""
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency histogram and in-flight gauge"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status["code"])).observe(time.perf_counter() - started)
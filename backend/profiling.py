@@ -0,0 +1,150 @@
+"""Opt-in request profiling and event-loop lag detection.
+
+``ProfilingMiddleware`` runs a sampling profiler (pyinstrument) around a
+request when either an admin sends ``X-Profile: 1`` with their bearer token,
+or a configured random sample rate selects the request. The profile is saved
+as speedscope JSON (open at https://www.speedscope.app) in the profile
+directory and its name is returned in the ``X-Profile-Id`` header.
+
+``LoopLagMonitor`` notices when the event loop stops turning: a task on the
+loop stamps a heartbeat, and a watchdog thread that sees a stale heartbeat
+logs the loop thread's current stack, which is the callback blocking it
+(typically a synchronous ``subprocess.run``).
+
+pyinstrument is optional: ``pip install pyinstrument``.
+"""
+import asyncio
+import importlib.util
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def pyinstrument_available() -> bool:
+    return importlib.util.find_spec("pyinstrument") is not None
+
+
+def profile_name(method: str, path: str) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+    slug = _UNSAFE_NAME.sub("_", path.strip("/"))[:80] or "root"
+    return f"{stamp}_{method}_{slug}.speedscope.json"
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware; is_admin_request(headers) decides whether X-Profile is honoured"""
+
+    def __init__(
+        self,
+        app,
+        profile_dir: Path,
+        is_admin_request: Callable[[dict], bool],
+        sample_rate: float = 0.0,
+        interval: float = 0.001,
+    ):
+        self.app = app
+        self.profile_dir = profile_dir
+        self.is_admin_request = is_admin_request
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.enabled = pyinstrument_available()
+        if not self.enabled:
+            logger.info("pyinstrument is not installed; request profiling is disabled")
+
+    def _wants_profile(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        headers = dict(scope.get("headers") or [])
+        if headers.get(PROFILE_HEADER) not in (b"1", b"true"):
+            return False
+        return self.is_admin_request(headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        name = profile_name(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", name.encode())]
+            await send(message)
+
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            try:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                (self.profile_dir / name).write_text(profiler.output(SpeedscopeRenderer()))
+                logger.info(f"Saved request profile {name}")
+            except Exception as e:
+                logger.error(f"Could not save request profile {name}: {e}")
+
+
+class LoopLagMonitor:
+    """Log the loop thread's stack whenever the event loop is blocked for longer than threshold_ms"""
+
+    def __init__(self, threshold_ms: float = 100.0, interval: float = 0.05, on_lag: Optional[Callable[[float], None]] = None):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval
+        self.on_lag = on_lag
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    async def _beat(self):
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Call from the event loop (e.g. a startup hook)"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._heartbeat
+            lag = time.monotonic() - beat - self.interval
+            if lag < self.threshold:
+                continue
+            if reported_beat == beat:
+                # Same stall, already reported
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(loop thread stack unavailable)"
+            logger.warning(f"Event loop blocked for at least {lag * 1000:.0f} ms; loop thread stack:\n{stack}")
+            if self.on_lag:
+                self.on_lag(lag)
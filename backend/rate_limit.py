@@ -0,0 +1,146 @@
+"""Per-user token-bucket rate limiting for expensive endpoints.
+
+Every user has one bucket per cost class ("render" for ffmpeg/CPU-heavy work,
+"llm" for paid model calls), sized by their plan. A bucket holds up to
+``capacity`` tokens and refills continuously at ``per_hour`` tokens per hour;
+a request takes one token or is rejected with the time until one is free.
+
+Two stores:
+
+- ``MemoryBucketStore``: in-process, for a single worker; buckets that have
+  refilled are dropped, since a missing bucket starts full anyway
+- ``MongoBucketStore``: one document per (user, bucket) updated atomically
+  with an aggregation-pipeline ``find_one_and_update``, shared by every
+  worker; idle buckets expire through a TTL index
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Dict, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+BUCKETS = ("render", "llm")
+STORES = ("memory", "mongo")
+
+# Seconds between sweeps of refilled buckets out of the in-process store
+PRUNE_INTERVAL = 60.0
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    capacity: float
+    per_hour: float
+
+    @property
+    def rate(self) -> float:
+        """Tokens per second"""
+        return self.per_hour / 3600.0
+
+
+PLAN_LIMITS: Dict[str, Dict[str, BucketLimit]] = {
+    "free": {
+        "render": BucketLimit(capacity=3, per_hour=10),
+        "llm": BucketLimit(capacity=10, per_hour=60),
+    },
+    "pro": {
+        "render": BucketLimit(capacity=10, per_hour=60),
+        "llm": BucketLimit(capacity=30, per_hour=400),
+    },
+}
+DEFAULT_PLAN = "free"
+
+
+class RateLimited(Exception):
+    def __init__(self, bucket: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {bucket}")
+        self.bucket = bucket
+        self.retry_after = retry_after
+
+
+class MemoryBucketStore:
+    """Buckets in this process only"""
+
+    def __init__(self):
+        # key -> (tokens, updated, time the bucket is full again)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = asyncio.Lock()
+        self._pruned = time.time()
+
+    async def take(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        async with self._lock:
+            now = time.time()
+            if now - self._pruned >= PRUNE_INTERVAL:
+                self._prune(now)
+            tokens, updated, _ = self._buckets.get(key, (limit.capacity, now, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (limit.capacity - tokens) / limit.rate)
+        return allowed, tokens
+
+    def _prune(self, now: float):
+        """Forget buckets that are full again, so the store only holds recently active users"""
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._pruned = now
+
+
+class MongoBucketStore:
+    """Buckets shared across workers through a Mongo collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def take(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.time()
+        # A bucket left alone this long is full again, so its document can go
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=limit.capacity / limit.rate)
+        refilled = {
+            "$min": [
+                limit.capacity,
+                {"$add": [
+                    {"$ifNull": ["$tokens", limit.capacity]},
+                    {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, limit.rate]},
+                ]},
+            ]
+        }
+        pipeline = [
+            {"$set": {"tokens": refilled, "updated": now, "expires_at": expires_at}},
+            {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+            {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}},
+        ]
+        update = partial(
+            self.collection.find_one_and_update,
+            {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        try:
+            doc = await update()
+        except DuplicateKeyError:
+            # Another first request for this bucket inserted it between our match and upsert; now it matches
+            doc = await update()
+        return bool(doc["allowed"]), float(doc["tokens"])
+
+
+class RateLimiter:
+    def __init__(self, store, limits: Dict[str, Dict[str, BucketLimit]] = PLAN_LIMITS):
+        self.store = store
+        self.limits = limits
+
+    def limit_for(self, plan: str, bucket: str) -> BucketLimit:
+        return self.limits.get(plan, self.limits[DEFAULT_PLAN])[bucket]
+
+    async def check(self, user_id: str, plan: str, bucket: str, cost: float = 1.0):
+        """Take cost tokens from the user's bucket or raise RateLimited with the wait in seconds"""
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown rate limit bucket '{bucket}'")
+        limit = self.limit_for(plan, bucket)
+        allowed, tokens = await self.store.take(f"{user_id}:{bucket}", limit, cost)
+        if not allowed:
+            raise RateLimited(bucket, (cost - tokens) / limit.rate)
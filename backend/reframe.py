@@ -0,0 +1,208 @@
+"""Subject-aware reframing for portrait crops.
+
+Instead of a centered ``crop=ih*9/16:ih``, the crop window follows the
+subject. ffmpeg samples the clip at 2 fps as small grayscale frames; for
+each sample we find the subject's horizontal position:
+
+- the largest face (OpenCV Haar cascade, CPU) when OpenCV is installed
+- otherwise the centroid of motion energy between consecutive samples
+
+Missing samples hold the last known position, the track is smoothed and
+speed-limited so the virtual camera pans instead of jumping, then simplified
+to a few keyframes. ffmpeg gets a piecewise-linear crop ``x`` expression over
+``t``, so the crop moves inside the normal render with no extra pass.
+
+OpenCV is optional: ``pip install opencv-python-headless``.
+"""
+import importlib.util
+import logging
+import re
+import subprocess
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FPS = 2
+SAMPLE_WIDTH = 160
+# Subject must move this fraction of the frame width before the camera follows
+DEADZONE = 0.04
+# Fastest pan, in frame widths per second
+MAX_PAN_SPEED = 0.25
+SMOOTHING_SECONDS = 1.5
+MAX_KEYFRAMES = 32
+# Keyframe simplification tolerance, in frame widths
+KEYFRAME_TOLERANCE = 0.01
+
+PGM_HEADER = re.compile(rb"P5\s+(\d+)\s+(\d+)\s+255\s")
+
+_face_detector = None
+
+
+def opencv_available() -> bool:
+    return importlib.util.find_spec("cv2") is not None
+
+
+def _detector():
+    global _face_detector
+    if _face_detector is None:
+        import cv2
+
+        _face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    return _face_detector
+
+
+def sample_frames(path: str, start: float, duration: float) -> np.ndarray:
+    """Grayscale frames of the segment at SAMPLE_FPS, SAMPLE_WIDTH wide"""
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-ss', str(start), '-t', str(duration),
+        '-i', path,
+        '-an', '-sn',
+        '-vf', f"fps={SAMPLE_FPS},scale={SAMPLE_WIDTH}:-2,format=gray",
+        '-f', 'image2pipe', '-c:v', 'pgm', '-'
+    ]
+    data = subprocess.run(cmd, capture_output=True).stdout
+    # PGM frames carry their own size, so the scaled height needs no separate probe
+    header = PGM_HEADER.match(data)
+    if not header:
+        return np.zeros((0, 1, SAMPLE_WIDTH), dtype=np.uint8)
+    width, height = int(header.group(1)), int(header.group(2))
+    header_size = header.end()
+    frame_size = header_size + width * height
+    count = len(data) // frame_size
+    frames = np.frombuffer(data[: count * frame_size], dtype=np.uint8).reshape(count, frame_size)
+    return frames[:, header_size:].reshape(count, height, width)
+
+
+def face_positions(frames: np.ndarray) -> np.ndarray:
+    """Horizontal center (0..1) of the largest face per frame, NaN where none was found"""
+    positions = np.full(len(frames), np.nan)
+    if not opencv_available():
+        return positions
+    detector = _detector()
+    min_size = max(frames.shape[1] // 10, 12)
+    for i, frame in enumerate(frames):
+        faces = detector.detectMultiScale(frame, scaleFactor=1.15, minNeighbors=4, minSize=(min_size, min_size))
+        if len(faces):
+            x, _, w, _ = max(faces, key=lambda f: f[2] * f[3])
+            positions[i] = (x + w / 2) / frames.shape[2]
+    return positions
+
+
+def motion_positions(frames: np.ndarray) -> np.ndarray:
+    """Horizontal centroid (0..1) of motion energy per frame, NaN where nothing moved"""
+    positions = np.full(len(frames), np.nan)
+    if len(frames) < 2:
+        return positions
+    diff = np.abs(np.diff(frames.astype(np.int16), axis=0))
+    # Ignore sensor noise and compression shimmer
+    diff[diff < 12] = 0
+    columns = diff.sum(axis=1).astype(np.float64)
+    energy = columns.sum(axis=1)
+    xs = (np.arange(frames.shape[2]) + 0.5) / frames.shape[2]
+    moving = energy > frames.shape[1] * frames.shape[2] * 0.5
+    centroids = np.divide(columns @ xs, energy, out=np.full(len(energy), np.nan), where=energy > 0)
+    positions[1:] = np.where(moving, centroids, np.nan)
+    return positions
+
+
+def fill_gaps(positions: np.ndarray) -> np.ndarray:
+    """Hold the last known position across gaps (leading gap takes the first known one; none -> center)"""
+    known = ~np.isnan(positions)
+    if not known.any():
+        return np.full(len(positions), 0.5)
+    index = np.where(known, np.arange(len(positions)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = positions[index]
+    filled[: np.argmax(known)] = positions[np.argmax(known)]
+    return filled
+
+
+def smooth_track(positions: np.ndarray, crop_fraction: float, fps: float = SAMPLE_FPS) -> np.ndarray:
+    """Camera center per sample: deadzone, moving average and a pan speed limit, clamped to the frame"""
+    if len(positions) == 0:
+        return positions
+    window = max(int(SMOOTHING_SECONDS * fps) | 1, 1)
+    padded = np.pad(positions, window // 2, mode="edge")
+    averaged = np.convolve(padded, np.ones(window) / window, mode="valid")
+
+    max_step = MAX_PAN_SPEED / fps
+    track = np.empty_like(averaged)
+    track[0] = averaged[0]
+    for i in range(1, len(averaged)):
+        delta = averaged[i] - track[i - 1]
+        if abs(delta) < DEADZONE:
+            delta = 0.0
+        track[i] = track[i - 1] + np.clip(delta, -max_step, max_step)
+
+    half = crop_fraction / 2
+    return np.clip(track, half, 1 - half)
+
+
+def simplify(times: np.ndarray, values: np.ndarray, tolerance: float = KEYFRAME_TOLERANCE) -> List[int]:
+    """Indices of keyframes whose linear interpolation stays within tolerance (Ramer-Douglas-Peucker)"""
+    keep = {0, len(values) - 1}
+    stack = [(0, len(values) - 1)]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 2:
+            continue
+        span = np.interp(times[lo + 1:hi], [times[lo], times[hi]], [values[lo], values[hi]])
+        errors = np.abs(values[lo + 1:hi] - span)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            mid = lo + 1 + worst
+            keep.add(mid)
+            stack += [(lo, mid), (mid, hi)]
+    return sorted(keep)
+
+
+def keyframes(track: np.ndarray, fps: float = SAMPLE_FPS) -> List[Tuple[float, float]]:
+    times = np.arange(len(track)) / fps
+    tolerance = KEYFRAME_TOLERANCE
+    indices = simplify(times, track, tolerance)
+    while len(indices) > MAX_KEYFRAMES:
+        tolerance *= 1.5
+        indices = simplify(times, track, tolerance)
+    return [(float(times[i]), float(track[i])) for i in indices]
+
+
+def center_expression(points: List[Tuple[float, float]]) -> str:
+    """Piecewise-linear ffmpeg expression of t for the crop center (fraction of input width)"""
+    if len(points) == 1:
+        return f"{points[0][1]:.4f}"
+    expr = f"{points[-1][1]:.4f}"
+    for (t0, x0), (t1, x1) in reversed(list(zip(points, points[1:]))):
+        slope = (x1 - x0) / (t1 - t0)
+        expr = f"if(lt(t,{t1:.2f}),{x0:.4f}+({slope:.5f})*(t-{t0:.2f}),{expr})"
+    return expr
+
+
+def portrait_crop_filter(path: str, start: float, duration: float) -> Optional[str]:
+    """Subject-following 9:16 crop + scale for a segment, or None to keep the static center crop"""
+    frames = sample_frames(path, start, duration)
+    if len(frames) < 2:
+        return None
+    height, width = frames.shape[1:]
+    crop_fraction = (height * 9 / 16) / width
+    if crop_fraction >= 1:
+        # Source is already portrait (or narrower); nothing to track
+        return None
+
+    positions = face_positions(frames)
+    source = "face"
+    if np.isnan(positions).all():
+        positions = motion_positions(frames)
+        source = "motion"
+    if np.isnan(positions).all():
+        return None
+
+    track = smooth_track(fill_gaps(positions), crop_fraction)
+    points = keyframes(track)
+    logger.info(f"Reframe ({source}): {len(frames)} samples -> {len(points)} keyframes")
+    center = center_expression(points)
+    # Commas inside the expression must be escaped for the filtergraph parser
+    x_expr = f"min(max(({center})*iw-ow/2,0),iw-ow)".replace(",", "\\,")
+    return f"crop=ih*9/16:ih:x={x_expr}:y=0,scale=1080:1920"
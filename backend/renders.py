@@ -0,0 +1,375 @@
+"""ffmpeg render functions shared by the API and the benchmarks.
+
+Everything here is blocking and takes its configuration as arguments (no
+environment or database access), so the API runs these in the threadpool
+under the encode scheduler and benchmarks/render_suite.py calls them
+directly.
+
+ffmpeg runs in its own process group with a time limit that grows with the
+media being encoded (``RenderTimeout``). A ``CancelToken`` passed as
+``cancel`` lets another thread stop a render: cancelling kills the group of
+every ffmpeg the render has running and makes it raise ``RenderCancelled``
+instead of trying a fallback command.
+"""
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from caption_timing import time_captions, word_timings
+from metrics import timed
+from reframe import portrait_crop_filter
+from subtitles import build_ass, subtitle_file
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RenderTimeout:
+    """Seconds an ffmpeg run may take: a fixed allowance plus some per second of output"""
+    base: float = 60.0
+    per_second: float = 4.0
+
+    def __call__(self, media_seconds: float) -> float:
+        return self.base + self.per_second * max(media_seconds, 0)
+
+
+DEFAULT_TIMEOUT = RenderTimeout()
+
+
+class RenderCancelled(Exception):
+    """The render was cancelled and its ffmpeg killed"""
+
+
+def kill_group(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class CancelToken:
+    """Handed to a render in a worker thread; cancel() from any thread kills its running ffmpeg"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for proc in processes:
+            kill_group(proc)
+
+    def _track(self, proc: subprocess.Popen) -> bool:
+        """False when already cancelled (the caller kills the process)"""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._processes.add(proc)
+            return True
+
+    def _untrack(self, proc: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(proc)
+
+
+def run_ffmpeg(
+    cmd: List[str],
+    timeout: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    pass_fds: Sequence[int] = ()
+) -> subprocess.CompletedProcess:
+    """subprocess.run for ffmpeg in a new process group, so a timeout or cancel leaves nothing running"""
+    if cancel is not None and cancel.cancelled:
+        raise RenderCancelled()
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True, pass_fds=pass_fds
+    )
+    if cancel is not None and not cancel._track(proc):
+        kill_group(proc)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except BaseException:
+        kill_group(proc)
+        proc.communicate()
+        raise
+    finally:
+        if cancel is not None:
+            cancel._untrack(proc)
+    if cancel is not None and cancel.cancelled:
+        raise RenderCancelled()
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def mp4_output_args(fragmented: bool = False) -> List[str]:
+    """Muxer flags that let players start before the whole file is downloaded"""
+    if fragmented:
+        # moov up front with no samples, then a moof/mdat fragment at every forced 2s keyframe
+        return [
+            '-force_key_frames', 'expr:gte(t,n_forced*2)',
+            '-movflags', '+frag_keyframe+empty_moov+default_base_moof'
+        ]
+    return ['-movflags', '+faststart']
+
+@timed("probe_video")
+def probe_video(file_path: str) -> dict:
+    """Run ffprobe and return its format/streams JSON"""
+    cmd = [
+        'ffprobe', '-v', 'quiet', '-print_format', 'json',
+        '-show_format', '-show_streams', file_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+@timed("get_video_duration")
+def get_video_duration(file_path: str) -> float:
+    """Get video duration in seconds using ffprobe"""
+    try:
+        data = probe_video(file_path)
+        duration = float(data.get('format', {}).get('duration', 0))
+        return duration
+    except Exception as e:
+        logger.error(f"Error getting video duration: {e}")
+        return 0
+
+def portrait_filter(input_path: str, start_time: float, duration: float, reframe: bool = True) -> str:
+    """9:16 crop for a segment: subject-following when reframing finds a subject, else centered"""
+    if reframe:
+        try:
+            vf_filter = portrait_crop_filter(input_path, start_time, duration)
+            if vf_filter:
+                return vf_filter
+        except Exception as e:
+            logger.warning(f"Reframing failed, using center crop: {e}")
+    return "crop=ih*9/16:ih,scale=1080:1920"
+
+@timed("process_video_clip")
+def process_video_clip(
+    input_path: str,
+    output_path: str,
+    target_duration: int,
+    aspect_ratio: str,
+    start_time: Optional[float] = None,
+    reframe: bool = True,
+    fragmented: bool = False,
+    timeout: RenderTimeout = DEFAULT_TIMEOUT,
+    cancel: Optional[CancelToken] = None
+) -> bool:
+    """Process video using ffmpeg - cut to duration and apply aspect ratio"""
+    try:
+        # Get original duration
+        original_duration = get_video_duration(input_path)
+        
+        # Calculate start time to get the most engaging middle section
+        if original_duration > target_duration:
+            if start_time is None:
+                # No highlight analysis: start from 10% into the video to skip intros
+                start_time = original_duration * 0.1
+            start_time = min(max(start_time, 0), original_duration - target_duration)
+        else:
+            start_time = 0
+            target_duration = int(original_duration)
+        
+        # Set filter based on aspect ratio
+        if aspect_ratio == "portrait":
+            # 9:16 - crop to vertical
+            vf_filter = portrait_filter(input_path, start_time, target_duration, reframe)
+        else:
+            # 16:9 - crop to horizontal
+            vf_filter = "crop=iw:iw*9/16,scale=1920:1080"
+        
+        cmd = [
+            'ffmpeg', '-y',
+            '-ss', str(start_time),
+            '-i', input_path,
+            '-t', str(target_duration),
+            '-vf', vf_filter,
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            *mp4_output_args(fragmented),
+            output_path
+        ]
+        
+        result = run_ffmpeg(cmd, timeout(target_duration), cancel)
+        if result.returncode != 0:
+            logger.error(f"FFmpeg error: {result.stderr}")
+            # If aspect ratio crop fails, try simpler processing
+            cmd_simple = [
+                'ffmpeg', '-y',
+                '-ss', str(start_time),
+                '-i', input_path,
+                '-t', str(target_duration),
+                '-c:v', 'libx264',
+                '-preset', 'fast',
+                '-crf', '23',
+                '-c:a', 'aac',
+                *mp4_output_args(fragmented),
+                output_path
+            ]
+            result = run_ffmpeg(cmd_simple, timeout(target_duration), cancel)
+            return result.returncode == 0
+        return True
+    except RenderCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing video: {e}")
+        return False
+
+@timed("process_video_clips")
+def process_video_clips(
+    input_path: str,
+    segments: List[dict],
+    aspect_ratio: str,
+    has_audio: bool = True,
+    reframe: bool = True,
+    fragmented: bool = False,
+    timeout: RenderTimeout = DEFAULT_TIMEOUT,
+    cancel: Optional[CancelToken] = None
+) -> bool:
+    """Cut several segments from one source in a single decode pass.
+
+    Each segment is {"start", "duration", "output_path"}. The source is decoded
+    once from the earliest start to the latest end; split/trim hand every
+    output only its own frames, which are then cropped, scaled and encoded.
+    """
+    if not segments:
+        return False
+    first = min(seg["start"] for seg in segments)
+    last = max(seg["start"] + seg["duration"] for seg in segments)
+    n = len(segments)
+    
+    graph = ["[0:v]split=" + str(n) + "".join(f"[v{i}]" for i in range(n))]
+    if has_audio:
+        graph.append("[0:a]asplit=" + str(n) + "".join(f"[a{i}]" for i in range(n)))
+    for i, seg in enumerate(segments):
+        start = seg["start"] - first
+        end = start + seg["duration"]
+        if aspect_ratio == "portrait":
+            crop = portrait_filter(input_path, seg["start"], seg["duration"], reframe)
+        else:
+            crop = "crop=iw:iw*9/16,scale=1920:1080"
+        graph.append(f"[v{i}]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS,{crop}[ov{i}]")
+        if has_audio:
+            graph.append(f"[a{i}]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS[oa{i}]")
+    
+    cmd = [
+        'ffmpeg', '-y',
+        '-ss', str(first),
+        '-t', str(last - first),
+        '-i', input_path,
+        '-filter_complex', ";".join(graph)
+    ]
+    for i, seg in enumerate(segments):
+        cmd += ['-map', f"[ov{i}]"]
+        if has_audio:
+            cmd += ['-map', f"[oa{i}]", '-c:a', 'aac', '-b:a', '128k']
+        cmd += [
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            *mp4_output_args(fragmented),
+            seg["output_path"]
+        ]
+    
+    try:
+        # One decode, but every segment is encoded
+        result = run_ffmpeg(cmd, timeout(sum(seg["duration"] for seg in segments)), cancel)
+    except RenderCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing clips: {e}")
+        return False
+    if result.returncode != 0:
+        logger.error(f"FFmpeg multi-clip error: {result.stderr}")
+        return False
+    return True
+
+@timed("render_story_video")
+def render_story_video(
+    background_path: str,
+    captions: str,
+    output_path: str,
+    target_duration: int,
+    style: str,
+    narration_path: Optional[str] = None,
+    line_durations: Optional[List[float]] = None,
+    timing_unit: str = "chars",
+    karaoke: bool = False,
+    fragmented: bool = False,
+    timeout: RenderTimeout = DEFAULT_TIMEOUT,
+    cancel: Optional[CancelToken] = None
+) -> bool:
+    """Render a story video with captions overlaid on background, optionally with narration audio"""
+    try:
+        # Time each line by its narration audio, or by reading length; [BEAT] markers become pauses
+        if narration_path and line_durations:
+            cues = time_captions(captions, durations=line_durations)
+        else:
+            cues = time_captions(captions, total_duration=target_duration, unit=timing_unit)
+        lines = [text for _, _, text in cues]
+        karaoke_timings = word_timings(cues, timing_unit) if karaoke else None
+        
+        # FFmpeg command to create video with subtitles
+        # Loop background video if needed; the ASS document never touches disk
+        # Narration is muxed in the same pass as the caption burn-in
+        if narration_path:
+            audio_inputs = ["-i", narration_path]
+            audio_args = ["-map", "0:v", "-map", "1:a", "-c:a", "aac", "-b:a", "128k"]
+        else:
+            audio_inputs = []
+            audio_args = ["-an"]
+        
+        with subtitle_file(build_ass(cues, style, karaoke_timings)) as (subtitle_path, pass_fds):
+            cmd = [
+                "ffmpeg", "-y",
+                "-stream_loop", "-1",  # Loop input
+                "-i", background_path,
+                *audio_inputs,
+                "-t", str(target_duration),
+                "-vf", f"subtitles=filename={subtitle_path}",
+                "-c:v", "libx264",
+                "-preset", "fast",
+                "-crf", "23",
+                *audio_args,
+                *mp4_output_args(fragmented),
+                output_path
+            ]
+            
+            result = run_ffmpeg(cmd, timeout(target_duration), cancel, pass_fds=pass_fds)
+        
+        if result.returncode != 0:
+            logger.error(f"FFmpeg error: {result.stderr}")
+            # Try simpler approach without subtitles filter
+            cmd_simple = [
+                "ffmpeg", "-y",
+                "-stream_loop", "-1",
+                "-i", background_path,
+                *audio_inputs,
+                "-t", str(target_duration),
+                "-vf", f"drawtext=text='{lines[0][:50] if lines else 'Story'}':fontsize=36:fontcolor=white:x=(w-text_w)/2:y=h-200:borderw=2:bordercolor=black",
+                "-c:v", "libx264",
+                "-preset", "fast",
+                "-crf", "23",
+                *audio_args,
+                *mp4_output_args(fragmented),
+                output_path
+            ]
+            result = run_ffmpeg(cmd_simple, timeout(target_duration), cancel)
+            return result.returncode == 0
+            
+        return True
+    except RenderCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Video rendering error: {str(e)}")
+        return False
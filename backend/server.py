@@ -1,23 +1,53 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form, BackgroundTasks, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import Awaitable, Callable, List, Optional
 import uuid
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 import aiofiles
-import subprocess
 import json
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import asyncio
+import math
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from delivery import MediaDelivery, MEDIA_TYPES, resolve_media_path
+from hls import package_hls_ladder
+from thumbnails import generate_poster, generate_sprite, is_fresh
+from background_catalog import BackgroundCatalog, BACKGROUND_CATEGORIES
+from caption_timing import parse_caption_script, BEAT_PAUSE_SECONDS
+from tts import get_engine, synthesize_narration, TTSError
+from transcription import Transcriber, TranscriptionUnavailable
+from highlights import HighlightAnalyzer, clip_start, top_windows
+from renders import (
+    CancelToken, RenderCancelled, RenderTimeout, get_video_duration, mp4_output_args, probe_video,
+    process_video_clip, process_video_clips, render_story_video, run_ffmpeg
+)
+from compositor import SPLIT_LAYOUTS, build_split_screen_command, normalize_background
+from storage_manager import GIB, QuotaExceeded, StorageManager
+from storage_backends import BACKENDS, LocalStorage, ReadThroughCache, S3Storage, check_name
+from job_queue import RENDER_MODES, JobFailed, JobQueue, public_job
+from idempotency import HEADER as IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, IdempotencyConflict, IdempotencyStore, fingerprint
+from rate_limit import MongoBucketStore, MemoryBucketStore, RateLimited, RateLimiter, STORES
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from metrics import (
+    EVENT_LOOP_STALLS, QUEUE_DEPTH, UPLOAD_BYTES, MetricsMiddleware, MongoCommandMetrics, stage_timer, timed
+)
+from profiling import LoopLagMonitor, ProfilingMiddleware
+from fake_llm import fake_generate
+from llm_output import BatchCaptionOutput, CaptionOutput, DEFAULT_SUMMARY, generate_structured, parse_stats
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -26,12 +56,20 @@ load_dotenv(ROOT_DIR / '.env')
 UPLOAD_DIR = ROOT_DIR / "uploads"
 OUTPUT_DIR = ROOT_DIR / "outputs"
 BACKGROUNDS_DIR = ROOT_DIR / "assets" / "backgrounds"
+HLS_DIR = OUTPUT_DIR / "hls"
+THUMBNAIL_DIR = ROOT_DIR / "thumbnails"
+TTS_CACHE_DIR = ROOT_DIR / "cache" / "tts"
+HIGHLIGHT_CACHE_DIR = ROOT_DIR / "cache" / "highlights"
+NORMALIZED_BACKGROUND_DIR = ROOT_DIR / "cache" / "backgrounds"
+PROFILE_DIR = ROOT_DIR / "profiles"
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
+HLS_DIR.mkdir(exist_ok=True)
+THUMBNAIL_DIR.mkdir(exist_ok=True)
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # JWT Config
@@ -41,8 +79,167 @@ JWT_EXPIRATION_HOURS = 24
 
 # LLM Config
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+# "emergent" calls the model; "fake" answers locally (load tests, development)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'emergent')
+FAKE_LLM_LATENCY_MS = float(os.environ.get('FAKE_LLM_LATENCY_MS', 0))
+
+# Render output: fragmented MP4 lets clients play a render while it is still being written
+FRAGMENTED_MP4 = os.environ.get('FRAGMENTED_MP4', 'false').lower() == 'true'
+
+# Encode scheduling: renders beyond this many wait for a free slot instead of oversubscribing the CPU
+RENDER_MAX_CONCURRENT = int(os.environ.get('RENDER_MAX_CONCURRENT', max((os.cpu_count() or 2) // 2, 1)))
+
+# HLS ladder packaging after each render (runs after the response is sent)
+HLS_ENABLED = os.environ.get('HLS_ENABLED', 'false').lower() == 'true'
+HLS_MAX_CONCURRENT = int(os.environ.get('HLS_MAX_CONCURRENT', 2))
+
+# Background catalog: round_robin | weighted selection, directory mtime re-check interval in seconds
+BACKGROUND_SELECTION = os.environ.get('BACKGROUND_SELECTION', 'round_robin')
+BACKGROUND_REFRESH_SECONDS = float(os.environ.get('BACKGROUND_REFRESH_SECONDS', 30))
+
+# Story captions: time by chars | syllables at reading speed; optional word-by-word karaoke highlight
+CAPTION_TIMING_UNIT = os.environ.get('CAPTION_TIMING_UNIT', 'chars')
+CAPTION_KARAOKE = os.environ.get('CAPTION_KARAOKE', 'false').lower() == 'true'
+
+# Story voiceover: local TTS engine (espeak | piper) and its default voice
+TTS_ENGINE = os.environ.get('TTS_ENGINE', 'espeak')
+TTS_VOICE = os.environ.get('TTS_VOICE')
+tts_engine = get_engine(TTS_ENGINE, TTS_VOICE)
+
+# Local speech-to-text: faster-whisper model size and process pool size
+transcriber = Transcriber(
+    model_size=os.environ.get('TRANSCRIBE_MODEL', 'base'),
+    workers=int(os.environ.get('TRANSCRIBE_WORKERS', 2)),
+    cpu_threads=int(os.environ.get('TRANSCRIBE_THREADS_PER_WORKER', 2))
+)
 
-app = FastAPI()
+# Clip start from scene/motion/loudness analysis instead of a fixed offset (see highlights.py)
+HIGHLIGHTS_ENABLED = os.environ.get('HIGHLIGHTS_ENABLED', 'true').lower() == 'true'
+highlight_analyzer = HighlightAnalyzer(
+    cache_dir=HIGHLIGHT_CACHE_DIR,
+    workers=int(os.environ.get('HIGHLIGHT_WORKERS', 2))
+)
+
+# Split-screen: normalize every catalog background for the default layout at startup
+SPLIT_SCREEN_PRENORMALIZE = os.environ.get('SPLIT_SCREEN_PRENORMALIZE', 'true').lower() == 'true'
+
+# Per-user token buckets for renders and LLM calls; "mongo" shares them across workers
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+if RATE_LIMIT_STORE not in STORES:
+    raise ValueError(f"Unknown RATE_LIMIT_STORE '{RATE_LIMIT_STORE}'. Choose from: {', '.join(STORES)}")
+rate_limiter = RateLimiter(
+    MongoBucketStore(db.rate_limits) if RATE_LIMIT_STORE == "mongo" else MemoryBucketStore()
+)
+
+# Storage lifecycle (see storage_manager.py): unclaimed uploads expire, orphans are swept, usage is capped per plan
+STORAGE_QUOTAS_ENABLED = os.environ.get('STORAGE_QUOTAS_ENABLED', 'true').lower() == 'true'
+UPLOAD_RETENTION_HOURS = float(os.environ.get('UPLOAD_RETENTION_HOURS', 24))
+ORPHAN_GRACE_MINUTES = float(os.environ.get('ORPHAN_GRACE_MINUTES', 60))
+# Seconds between sweeps; 0 disables the sweeper
+STORAGE_SWEEP_INTERVAL = float(os.environ.get('STORAGE_SWEEP_INTERVAL', 600))
+
+# Where uploads and renders live (see storage_backends.py); "s3" serves pre-signed URLs and caches ffmpeg inputs locally
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+if STORAGE_BACKEND not in BACKENDS:
+    raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'. Choose from: {', '.join(BACKENDS)}")
+if STORAGE_BACKEND == "s3":
+    media_store = S3Storage(
+        os.environ['S3_BUCKET'],
+        ReadThroughCache(
+            Path(os.environ.get('STORAGE_CACHE_DIR', ROOT_DIR / "cache" / "media")),
+            max_bytes=int(float(os.environ.get('STORAGE_CACHE_MAX_GB', 10)) * GIB)
+        ),
+        prefix=os.environ.get('S3_PREFIX', ''),
+        endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+        region=os.environ.get('S3_REGION'),
+        url_ttl=int(os.environ.get('S3_URL_TTL', 300)),
+        multipart_chunk_mb=int(os.environ.get('S3_MULTIPART_CHUNK_MB', 8)),
+        max_concurrency=int(os.environ.get('S3_MULTIPART_CONCURRENCY', 8))
+    )
+else:
+    media_store = LocalStorage({"videos": UPLOAD_DIR, "outputs": OUTPUT_DIR})
+
+# ffmpeg time limit per render: a fixed allowance plus this many seconds per second of output
+RENDER_TIMEOUT = RenderTimeout(
+    base=float(os.environ.get('RENDER_TIMEOUT_BASE', 60)),
+    per_second=float(os.environ.get('RENDER_TIMEOUT_PER_SECOND', 4))
+)
+
+# How often a request rendering inline checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 1.0
+
+# Renders run in the request ("inline") or are queued for worker.py processes ("queue"), see job_queue.py
+RENDER_MODE = os.environ.get('RENDER_MODE', 'inline')
+if RENDER_MODE not in RENDER_MODES:
+    raise ValueError(f"Unknown RENDER_MODE '{RENDER_MODE}'. Choose from: {', '.join(RENDER_MODES)}")
+job_queue = JobQueue(
+    db.jobs,
+    lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', 60)),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 3)),
+    retry_delay=float(os.environ.get('JOB_RETRY_DELAY', 5))
+)
+
+# Idempotency-Key records for the generate endpoints (see idempotency.py)
+idempotency_store = IdempotencyStore(db.idempotency, ttl=timedelta(hours=float(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))))
+# How often a retry waits on a first request that is still rendering inline
+IDEMPOTENCY_POLL_SECONDS = 1.0
+
+# Admins (comma-separated emails) may profile requests with "X-Profile: 1"; a sample rate profiles random requests
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()}
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Log the blocking stack when the event loop stalls longer than this (0 disables)
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get('LOOP_LAG_THRESHOLD_MS', 100))
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_THRESHOLD_MS, on_lag=lambda lag: EVENT_LOOP_STALLS.inc())
+
+# Portrait crops follow the subject (face via OpenCV, else motion) instead of the frame center
+REFRAME_ENABLED = os.environ.get('REFRAME_ENABLED', 'true').lower() == 'true'
+
+# Video delivery: stream | sendfile | x-accel-redirect | x-sendfile (see delivery.py)
+media_delivery = MediaDelivery(
+    roots={
+        "videos": UPLOAD_DIR,
+        "outputs": OUTPUT_DIR,
+        "backgrounds": BACKGROUNDS_DIR,
+        "hls": HLS_DIR,
+        "thumbnails": THUMBNAIL_DIR
+    },
+    mode=os.environ.get('VIDEO_DELIVERY_MODE', 'stream'),
+    accel_prefix=os.environ.get('X_ACCEL_PREFIX', '/protected'),
+    sendfile_base_url=os.environ.get('MEDIA_SERVER_URL'),
+    signing_key=os.environ.get('MEDIA_SIGNING_KEY', JWT_SECRET),
+)
+
+async def ensure_indexes():
+    stores = [storage_manager, job_queue, idempotency_store]
+    if RATE_LIMIT_STORE == "mongo":
+        stores.append(rate_limiter.store)
+    await asyncio.gather(*(store.ensure_indexes() for store in stores))
+
+async def load_background_catalog():
+    await run_in_threadpool(background_catalog.refresh, True)
+    logger.info(f"Background catalog loaded: {sum(len(v) for v in background_catalog.videos.values())} videos")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LOOP_LAG_THRESHOLD_MS > 0:
+        loop_lag_monitor.start()
+    # Index checks wait on Mongo, the catalog scan on disk and the storage client (boto3 for S3) on imports,
+    # so none of them holds up the others
+    await asyncio.gather(ensure_indexes(), load_background_catalog(), run_in_threadpool(media_store.connect))
+    if STORAGE_SWEEP_INTERVAL > 0:
+        storage_manager.start(STORAGE_SWEEP_INTERVAL)
+    if SPLIT_SCREEN_PRENORMALIZE:
+        # Runs in the background; a render that needs a background before it is ready normalizes it itself
+        asyncio.get_running_loop().run_in_executor(None, prenormalize_backgrounds)
+    yield
+    client.close()
+    loop_lag_monitor.stop()
+    storage_manager.stop()
+    transcriber.shutdown()
+    highlight_analyzer.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
@@ -88,6 +285,13 @@ class ContentItem(BaseModel):
     output_url: Optional[str] = None
     captions: Optional[str] = None
     duration: Optional[float] = None
+    hls: Optional[dict] = None
+    poster_url: Optional[str] = None
+    sprite_url: Optional[str] = None
+    sprite_vtt_url: Optional[str] = None
+    segments: Optional[List[dict]] = None
+    real_time_factor: Optional[float] = None
+    clip_start: Optional[float] = None
 
 class VideoClipResponse(BaseModel):
     id: str
@@ -98,6 +302,12 @@ class VideoClipResponse(BaseModel):
     captions: Optional[str] = None
     ai_summary: Optional[str] = None
     duration: Optional[float] = None
+    clip_start: Optional[float] = None
+    score: Optional[float] = None
+
+class MultiClipResponse(BaseModel):
+    source_duration: float
+    clips: List[VideoClipResponse]
 
 class GenerateStoryRequest(BaseModel):
     topic: str
@@ -109,7 +319,9 @@ class GenerateVoiceoverRequest(BaseModel):
     voice_style: str = "professional"
 
 class TranscriptionRequest(BaseModel):
-    video_description: str
+    video_description: str = ""
+    video_filename: Optional[str] = None
+    language: Optional[str] = None
 
 class VideoRankingRequest(BaseModel):
     video_title: str
@@ -144,88 +356,278 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def is_admin_request(headers: dict) -> bool:
+    """Whether raw ASGI headers carry a valid token for an admin email (no database lookup)"""
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.lower().startswith("bearer ") or not ADMIN_EMAILS:
+        return False
+    try:
+        payload = jwt.decode(auth[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return False
+    return str(payload.get("email", "")).lower() in ADMIN_EMAILS
+
+async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict:
+    if current_user.get("email", "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+async def enforce_rate_limit(user: dict, bucket: str, cost: int = 1):
+    """Take cost tokens from the user's bucket; 429 with Retry-After when it is empty.
+    Call it in the handler after validating the request, so rejected input costs nothing
+    (not as a dependency: FastAPI resolves those even when the body fails validation)."""
+    if not RATE_LIMITS_ENABLED:
+        return
+    capacity = rate_limiter.limit_for(user.get("plan", "free"), bucket).capacity
+    if cost > capacity:
+        # Waiting would never help, so no Retry-After
+        raise HTTPException(status_code=429, detail=f"Your plan allows at most {capacity:g} {bucket} requests at once")
+    try:
+        await rate_limiter.check(user["id"], user.get("plan", "free"), bucket, cost)
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many {bucket} requests. Try again in {math.ceil(e.retry_after)}s.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
 # ==================== VIDEO HELPERS ====================
 
-def get_video_duration(file_path: str) -> float:
-    """Get video duration in seconds using ffprobe"""
+# Output filenames whose ffmpeg process is still writing them
+ACTIVE_RENDERS = set()
+
+render_semaphore = asyncio.Semaphore(RENDER_MAX_CONCURRENT)
+
+storage_manager = StorageManager(
+    db.files,
+    db.content,
+    media_store,
+    hls_dir=HLS_DIR,
+    thumbnail_dir=THUMBNAIL_DIR,
+    upload_retention=timedelta(hours=UPLOAD_RETENTION_HOURS),
+    orphan_grace=timedelta(minutes=ORPHAN_GRACE_MINUTES),
+    in_flight=lambda filenames: renders_in_flight(filenames)
+)
+
+async def enforce_storage_quota(user: dict, incoming_bytes: int = 0):
+    """413 when the user's stored files (plus an incoming upload) would pass their plan's quota"""
+    if not STORAGE_QUOTAS_ENABLED:
+        return
     try:
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', file_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        data = json.loads(result.stdout)
-        duration = float(data.get('format', {}).get('duration', 0))
-        return duration
+        await storage_manager.check_quota(user, incoming_bytes)
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Storage quota exceeded ({e.used / GIB:.1f} of {e.quota / GIB:.1f} GB used). "
+                   "Delete items from your library to free space."
+        )
+
+async def save_stored(kind: str, filename: str, path: Path) -> Path:
+    """Hand a finished local file to the storage backend; returns where a local copy now is"""
+    try:
+        return await run_in_threadpool(media_store.save, kind, filename, path)
     except Exception as e:
-        logger.error(f"Error getting video duration: {e}")
-        return 0
+        Path(path).unlink(missing_ok=True)
+        logger.error(f"Storing {kind}/{filename} failed: {e}")
+        raise HTTPException(status_code=503, detail="Storage is unavailable, please try again")
+
+@asynccontextmanager
+async def checked_out(kind: str, filename: str):
+    """Local path of a stored file (None if missing), kept from cache eviction inside the block"""
+    path = await run_in_threadpool(media_store.checkout, kind, filename)
+    try:
+        yield path
+    finally:
+        if path is not None:
+            await run_in_threadpool(media_store.release, kind, filename)
 
-def process_video_clip(input_path: str, output_path: str, target_duration: int, aspect_ratio: str) -> bool:
-    """Process video using ffmpeg - cut to duration and apply aspect ratio"""
+async def stored_media_response(kind: str, filename: str, not_found: str):
+    """Redirect to the backend's direct URL when it has one, else stream through MediaDelivery"""
     try:
-        # Get original duration
-        original_duration = get_video_duration(input_path)
-        
-        # Calculate start time to get the most engaging middle section
-        if original_duration > target_duration:
-            # Start from 10% into the video to skip intros
-            start_time = min(original_duration * 0.1, original_duration - target_duration)
-        else:
-            start_time = 0
-            target_duration = int(original_duration)
-        
-        # Set filter based on aspect ratio
-        if aspect_ratio == "portrait":
-            # 9:16 - crop to vertical
-            vf_filter = "crop=ih*9/16:ih,scale=1080:1920"
-        else:
-            # 16:9 - crop to horizontal
-            vf_filter = "crop=iw:iw*9/16,scale=1920:1080"
-        
-        cmd = [
-            'ffmpeg', '-y',
-            '-ss', str(start_time),
-            '-i', input_path,
-            '-t', str(target_duration),
-            '-vf', vf_filter,
-            '-c:v', 'libx264',
-            '-preset', 'fast',
-            '-crf', '23',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            output_path
+        check_name(filename)
+    except ValueError:
+        # "..", empty and the like: not a name anything is stored under
+        raise HTTPException(status_code=404, detail=not_found)
+    url = await run_in_threadpool(media_store.url, kind, filename)
+    if url:
+        if not await run_in_threadpool(media_store.exists, kind, filename):
+            raise HTTPException(status_code=404, detail=not_found)
+        return RedirectResponse(url, status_code=307)
+    return media_delivery.response(kind, filename, not_found=not_found)
+
+async def run_render(func, *args, **kwargs):
+    """Run a blocking render in the threadpool once an encode slot is free"""
+    waiting = QUEUE_DEPTH.labels("render", "waiting")
+    running = QUEUE_DEPTH.labels("render", "running")
+    waiting.inc()
+    try:
+        await render_semaphore.acquire()
+    finally:
+        waiting.dec()
+    try:
+        with running.track_inprogress():
+            cancel = CancelToken()
+            future = asyncio.get_running_loop().run_in_executor(None, partial(func, *args, cancel=cancel, **kwargs))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Kill ffmpeg and let the thread return, so cleanup after this finds nothing writing
+                cancel.cancel()
+                await asyncio.gather(future, return_exceptions=True)
+                raise
+    finally:
+        render_semaphore.release()
+
+@contextmanager
+def rendering(*output_filenames: str):
+    """Mark outputs as being written; a render that is cancelled or raises leaves no partial files"""
+    ACTIVE_RENDERS.update(output_filenames)
+    try:
+        yield
+    except BaseException:
+        for filename in output_filenames:
+            (OUTPUT_DIR / filename).unlink(missing_ok=True)
+        raise
+    finally:
+        ACTIVE_RENDERS.difference_update(output_filenames)
+
+async def renders_in_flight(output_filenames: List[str]) -> set:
+    """Which outputs are still being written: by a render in this process, or by a queued or leased job on a worker"""
+    active = {name for name in output_filenames if name in ACTIVE_RENDERS}
+    if RENDER_MODE == "queue":
+        active |= await job_queue.pending_outputs(output_filenames)
+    return active
+
+async def render_in_flight(output_filename: str) -> bool:
+    return bool(await renders_in_flight([output_filename]))
+
+async def resolve_render_id(render_id: Optional[str], suffix: str) -> str:
+    """Output filename for a render; clients may pick the id to start playback before it finishes"""
+    if not render_id:
+        return f"{uuid.uuid4()}{suffix}"
+    try:
+        render_id = str(uuid.UUID(render_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="render_id must be a UUID")
+    output_filename = f"{render_id}{suffix}"
+    if await render_in_flight(output_filename) or await run_in_threadpool(media_store.exists, "outputs", output_filename):
+        raise HTTPException(status_code=409, detail="render_id already in use")
+    return output_filename
+
+# ==================== HLS PACKAGING ====================
+
+hls_semaphore = asyncio.Semaphore(HLS_MAX_CONCURRENT)
+
+@timed("package_hls")
+def package_output_hls_sync(output_filename: str) -> Optional[dict]:
+    """Probe an output and package it as an HLS ladder; returns the ladder record"""
+    output_path = media_store.checkout("outputs", output_filename)
+    if output_path is None:
+        return None
+    try:
+        data = probe_video(str(output_path))
+        streams = data.get('streams', [])
+        video = next((st for st in streams if st.get('codec_type') == 'video'), {})
+        has_audio = any(st.get('codec_type') == 'audio' for st in streams)
+
+        stem = Path(output_filename).stem
+        rungs = package_hls_ladder(
+            str(output_path),
+            str(HLS_DIR / stem),
+            int(video.get('width', 0)),
+            int(video.get('height', 0)),
+            has_audio,
+            timeout=RENDER_TIMEOUT(float(data.get('format', {}).get('duration', 0)))
+        )
+    finally:
+        media_store.release("outputs", output_filename)
+    if rungs is None:
+        return None
+    return {
+        "status": "ready",
+        "master_url": f"/api/hls/{stem}/master.m3u8",
+        "renditions": [
+            {
+                "name": r["name"],
+                "short_side": r["short_side"],
+                "bandwidth": (r["video_bitrate"] + (r["audio_bitrate"] if has_audio else 0)) * 1000,
+                "playlist_url": f"/api/hls/{stem}/{r['name']}/index.m3u8"
+            }
+            for r in rungs
         ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            logger.error(f"FFmpeg error: {result.stderr}")
-            # If aspect ratio crop fails, try simpler processing
-            cmd_simple = [
-                'ffmpeg', '-y',
-                '-ss', str(start_time),
-                '-i', input_path,
-                '-t', str(target_duration),
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-crf', '23',
-                '-c:a', 'aac',
-                output_path
-            ]
-            result = subprocess.run(cmd_simple, capture_output=True, text=True)
-            return result.returncode == 0
+    }
+
+async def package_output_hls(content_id: str, output_filename: str):
+    """Background task: build the HLS ladder for an output and record it on the content document"""
+    waiting = QUEUE_DEPTH.labels("hls", "waiting")
+    waiting.inc()
+    async with hls_semaphore:
+        waiting.dec()
+        try:
+            with QUEUE_DEPTH.labels("hls", "running").track_inprogress():
+                ladder = await run_in_threadpool(package_output_hls_sync, output_filename)
+        except Exception as e:
+            logger.error(f"HLS packaging failed for {output_filename}: {e}")
+            ladder = None
+    await db.content.update_one(
+        {"id": content_id},
+        {"$set": {"hls": ladder or {"status": "failed"}}}
+    )
+
+# ==================== THUMBNAILS ====================
+
+THUMBNAIL_SOURCES = ("videos", "outputs", "backgrounds")
+THUMBNAIL_ASSETS = ("poster.jpg", "sprite.jpg", "sprite.vtt")
+thumbnail_locks = {}
+
+def thumbnail_urls(kind: str, source: str) -> dict:
+    """Lazy thumbnail URLs for a video; assets are generated on first request"""
+    base = f"/api/thumbnails/{kind}/{source}"
+    return {
+        "poster_url": f"{base}/poster.jpg",
+        "sprite_url": f"{base}/sprite.jpg",
+        "sprite_vtt_url": f"{base}/sprite.vtt"
+    }
+
+@asynccontextmanager
+async def thumbnail_source(kind: str, parts: List[str]):
+    """Local path of the video a thumbnail is cut from; uploads and renders come from the storage backend"""
+    if kind == "backgrounds":
+        yield resolve_media_path(BACKGROUNDS_DIR, *parts)
+    elif len(parts) != 1:
+        yield None
+    else:
+        async with checked_out(kind, parts[0]) as path:
+            yield path
+
+def thumbnail_is_cached(source_path: Path, cache_dir: Path, asset: str) -> bool:
+    if asset == "poster.jpg":
+        return is_fresh(cache_dir / "poster.jpg", source_path)
+    return is_fresh(cache_dir / "sprite.jpg", source_path) and is_fresh(cache_dir / "sprite.vtt", source_path)
+
+def ensure_thumbnail(source_path: Path, cache_dir: Path, asset: str) -> bool:
+    """Generate a thumbnail asset (sprite and its VTT together) unless a fresh copy is cached"""
+    if thumbnail_is_cached(source_path, cache_dir, asset):
         return True
-    except Exception as e:
-        logger.error(f"Error processing video: {e}")
-        return False
+    data = probe_video(str(source_path))
+    duration = float(data.get('format', {}).get('duration', 0))
+    if asset == "poster.jpg":
+        return generate_poster(source_path, cache_dir, duration)
+    video = next((st for st in data.get('streams', []) if st.get('codec_type') == 'video'), {})
+    return generate_sprite(source_path, cache_dir, duration, int(video.get('width', 0)), int(video.get('height', 0)))
 
 # ==================== AI HELPERS ====================
 
+@timed("generate_ai_content")
 async def generate_ai_content(prompt: str, system_message: str) -> str:
+    if LLM_BACKEND == "fake":
+        return await fake_generate(prompt, system_message, FAKE_LLM_LATENCY_MS / 1000)
     if not EMERGENT_LLM_KEY:
         raise HTTPException(status_code=500, detail="AI service not configured")
     
     try:
+        # Only the real backend needs the SDK (and its import cost)
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=str(uuid.uuid4()),
@@ -239,15 +641,19 @@ async def generate_ai_content(prompt: str, system_message: str) -> str:
         logger.error(f"AI generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
 
-async def generate_video_captions(video_info: dict, ai_notes: str = "") -> dict:
-    """Generate captions and viral analysis for a video clip"""
-    system_message = """You are an expert viral video content creator. Your job is to:
+CAPTION_SYSTEM_MESSAGE = """You are an expert viral video content creator. Your job is to:
 1. Generate engaging captions for short-form video content
 2. Analyze what makes content viral
 3. Suggest optimal hooks and call-to-actions
 
 Always provide practical, platform-optimized suggestions."""
 
+def empty_caption_fields() -> dict:
+    """Caption fields when the LLM gave nothing usable; callers fill in fallback captions"""
+    return {"caption": "", "hashtags": "", "hook": "", "cta": "", "summary": DEFAULT_SUMMARY}
+
+async def generate_video_captions(video_info: dict, ai_notes: str = "") -> dict:
+    """Generate captions and viral analysis for a video clip"""
     notes_context = f"\nUser style notes: {ai_notes}" if ai_notes else ""
     
     prompt = f"""A user uploaded a video with the following details:
@@ -261,39 +667,37 @@ Generate:
 2. 5 relevant hashtags
 3. A hook phrase for the first 3 seconds
 4. One call-to-action
+5. A 1 sentence summary of the optimization applied"""
 
-Format your response as:
-CAPTION: [your caption]
-HASHTAGS: [hashtags]
-HOOK: [hook phrase]
-CTA: [call to action]
-SUMMARY: [1 sentence about the optimization applied]"""
-
-    response = await generate_ai_content(prompt, system_message)
-    
-    # Parse response
-    result = {
-        "caption": "",
-        "hashtags": "",
-        "hook": "",
-        "cta": "",
-        "summary": "This clip was optimized for engagement using hook-first cuts and dynamic pacing."
-    }
+    result = await generate_structured(generate_ai_content, prompt, CAPTION_SYSTEM_MESSAGE, CaptionOutput, "clip_captions")
+    return result.model_dump()
+
+async def generate_batch_video_captions(video_info: dict, segments: List[dict], ai_notes: str = "") -> List[dict]:
+    """Captions for several clips of one video in a single LLM request"""
+    notes_context = f"\nUser style notes: {ai_notes}" if ai_notes else ""
+    clip_lines = "\n".join(
+        f"- Clip {i + 1}: starts at {seg['start']:.0f}s, {seg['duration']:.0f}s long"
+        for i, seg in enumerate(segments)
+    )
     
-    lines = response.strip().split('\n')
-    for line in lines:
-        if line.startswith('CAPTION:'):
-            result["caption"] = line.replace('CAPTION:', '').strip()
-        elif line.startswith('HASHTAGS:'):
-            result["hashtags"] = line.replace('HASHTAGS:', '').strip()
-        elif line.startswith('HOOK:'):
-            result["hook"] = line.replace('HOOK:', '').strip()
-        elif line.startswith('CTA:'):
-            result["cta"] = line.replace('CTA:', '').strip()
-        elif line.startswith('SUMMARY:'):
-            result["summary"] = line.replace('SUMMARY:', '').strip()
-    
-    return result
+    prompt = f"""A user uploaded a video and we cut {len(segments)} clips from it:
+- Source duration: {video_info.get('duration', 'unknown')} seconds
+- Format: {video_info.get('aspect_ratio', 'portrait')}
+{clip_lines}
+{notes_context}
+
+For EACH clip, in order, generate a distinct:
+1. Viral caption (2-3 lines max, with emojis)
+2. 5 relevant hashtags
+3. Hook phrase for the first 3 seconds
+4. One call-to-action
+5. A 1 sentence summary of the optimization applied"""
+
+    result = await generate_structured(generate_ai_content, prompt, CAPTION_SYSTEM_MESSAGE, BatchCaptionOutput, "batch_captions")
+    results = [clip.model_dump() for clip in result.clips[:len(segments)]]
+    # Missing clips get empty fields; the caller fills in fallback captions
+    results += [empty_caption_fields() for _ in range(len(segments) - len(results))]
+    return results
 
 # ==================== AUTH ROUTES ====================
 
@@ -376,12 +780,14 @@ async def upload_video(
     file_path = UPLOAD_DIR / filename
     
     # Save file
+    content = await file.read()
+    UPLOAD_BYTES.inc(len(content))
+    await enforce_storage_quota(current_user, len(content))
     async with aiofiles.open(file_path, 'wb') as out_file:
-        content = await file.read()
         await out_file.write(content)
     
     # Get video duration
-    duration = get_video_duration(str(file_path))
+    duration = await run_in_threadpool(get_video_duration, str(file_path))
     
     # Check if video is too long (max 3 minutes = 180 seconds)
     if duration > 180:
@@ -392,21 +798,31 @@ async def upload_video(
             detail=f"Video is too long ({int(duration)}s). Maximum allowed is 3 minutes (180s)."
         )
     
+    file_path = await save_stored("videos", filename, file_path)
+    await storage_manager.register("videos", filename, current_user["id"])
+    
+    # Start highlight analysis now so it is usually cached by the time a clip is requested
+    if HIGHLIGHTS_ENABLED:
+        highlight_analyzer.submit(str(file_path))
+    
     return {
         "id": file_id,
         "filename": filename,
         "duration": duration,
-        "url": f"/api/videos/{filename}"
+        "url": f"/api/videos/{filename}",
+        **thumbnail_urls("videos", filename)
     }
 
 @api_router.post("/generate/video-clip", response_model=VideoClipResponse)
 async def generate_video_clip(
     background_tasks: BackgroundTasks,
+    http_request: Request,
     video_id: str = Form(...),
     video_filename: str = Form(...),
     ai_notes: str = Form(""),
     aspect_ratio: str = Form("portrait"),
     target_duration: int = Form(60),
+    render_id: Optional[str] = Form(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate a viral clip from an uploaded video"""
@@ -418,93 +834,234 @@ async def generate_video_clip(
     if target_duration not in [15, 30, 45, 60, 90, 180]:
         raise HTTPException(status_code=400, detail="Invalid target duration")
     
-    input_path = UPLOAD_DIR / video_filename
-    if not input_path.exists():
-        raise HTTPException(status_code=404, detail="Video file not found")
-    
-    # Get original duration
-    original_duration = get_video_duration(str(input_path))
-    
-    # Generate output filename
-    output_id = str(uuid.uuid4())
-    output_filename = f"{output_id}_clip.mp4"
-    output_path = OUTPUT_DIR / output_filename
-    
-    # Process video
-    success = process_video_clip(
-        str(input_path), 
-        str(output_path), 
-        target_duration,
-        aspect_ratio
-    )
-    
-    if not success or not output_path.exists():
-        raise HTTPException(status_code=500, detail="Failed to process video")
-    
-    # Generate AI captions
-    video_info = {
-        "duration": original_duration,
+    async def start():
+        # Charged here, so a retry that replays a stored result costs nothing
+        await enforce_rate_limit(current_user, "render")
+        await enforce_storage_quota(current_user)
+        
+        # Generate output filename
+        output_filename = await resolve_render_id(render_id, "_clip.mp4")
+        return await dispatch_render("clip", {
+            "user_id": current_user["id"],
+            "content_id": str(uuid.uuid4()),
+            "video_filename": video_filename,
+            "ai_notes": ai_notes,
+            "aspect_ratio": aspect_ratio,
+            "target_duration": target_duration,
+            "output_filename": output_filename
+        }, http_request, background_tasks, source=video_filename)
+    
+    return await idempotent(http_request, current_user, "video-clip", {
+        "video_id": video_id,
+        "video_filename": video_filename,
+        "ai_notes": ai_notes,
+        "aspect_ratio": aspect_ratio,
         "target_duration": target_duration,
-        "aspect_ratio": aspect_ratio
-    }
+        "render_id": render_id
+    }, start)
+
+async def cut_highlight_clips(
+    user_id: str,
+    video_filename: str,
+    ai_notes: str,
+    aspect_ratio: str,
+    target_duration: int,
+    count: int,
+    defer: Callable
+) -> MultiClipResponse:
+    """Render and caption the top-N highlight segments of an upload"""
+    async with checked_out("videos", video_filename) as input_path:
+        if input_path is None:
+            raise HTTPException(status_code=404, detail="Video file not found")
+        
+        # One probe for the whole request
+        data = await run_in_threadpool(probe_video, str(input_path))
+        original_duration = float(data.get('format', {}).get('duration', 0))
+        has_audio = any(st.get('codec_type') == 'audio' for st in data.get('streams', []))
+    
+        # Rank windows by engagement; without analysis, fall back to evenly spaced cuts
+        windows = []
+        if HIGHLIGHTS_ENABLED:
+            try:
+                scores = await asyncio.wrap_future(highlight_analyzer.submit(str(input_path)))
+                windows = top_windows(scores, target_duration, count)
+            except Exception as e:
+                logger.warning(f"Highlight analysis failed for {video_filename}, using even spacing: {e}")
+        if not windows:
+            fit = max(min(count, int(original_duration // target_duration)), 1)
+            windows = [(float(i * target_duration), None) for i in range(fit)]
+    
+        segments = []
+        for start, score in windows:
+            output_filename = f"{uuid.uuid4()}_clip.mp4"
+            segments.append({
+                "start": start,
+                "duration": min(float(target_duration), original_duration - start),
+                "score": score,
+                "output_filename": output_filename,
+                "output_path": str(OUTPUT_DIR / output_filename)
+            })
+    
+        # Decode once, encode every segment; render in chronological order
+        ordered = sorted(segments, key=lambda seg: seg["start"])
+        filenames = [seg["output_filename"] for seg in segments]
+        with rendering(*filenames):
+            success = await run_render(
+                process_video_clips, str(input_path), ordered, aspect_ratio, has_audio,
+                reframe=REFRAME_ENABLED, fragmented=FRAGMENTED_MP4, timeout=RENDER_TIMEOUT
+            ) and all(Path(seg["output_path"]).exists() for seg in segments)
+            if success:
+                await asyncio.gather(*(
+                    save_stored("outputs", seg["output_filename"], Path(seg["output_path"])) for seg in segments
+                ))
+    
+    if not success:
+        for seg in segments:
+            Path(seg["output_path"]).unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail="Failed to process video")
     
+    # Captions for every clip in one LLM request
+    video_info = {"duration": original_duration, "aspect_ratio": aspect_ratio}
     try:
-        ai_result = await generate_video_captions(video_info, ai_notes)
-        captions = f"{ai_result['caption']}\n\n{ai_result['hashtags']}"
-        ai_summary = ai_result['summary']
+        ai_results = await generate_batch_video_captions(video_info, segments, ai_notes)
     except Exception as e:
         logger.error(f"AI caption generation failed: {e}")
-        captions = "🔥 Check out this viral clip!\n\n#viral #content #creator"
-        ai_summary = "This clip was optimized for engagement using hook-first cuts and dynamic pacing."
+        ai_results = [empty_caption_fields() for _ in segments]
     
-    # Get output duration
-    output_duration = get_video_duration(str(output_path))
+    clips = []
+    content_docs = []
+    for index, (seg, ai_result) in enumerate(zip(segments, ai_results), start=1):
+        if ai_result["caption"]:
+            captions = f"{ai_result['caption']}\n\n{ai_result['hashtags']}"
+        else:
+            captions = "🔥 Check out this viral clip!\n\n#viral #content #creator"
+        content_id = str(uuid.uuid4())
+        output_filename = seg["output_filename"]
+        content_doc = {
+            "id": content_id,
+            "user_id": user_id,
+            "type": "clips",
+            "title": f"Viral Clip {index}/{len(segments)} - {target_duration}s {aspect_ratio}",
+            "content": captions,
+            "video_url": f"/api/videos/{video_filename}",
+            "output_url": f"/api/outputs/{output_filename}",
+            "captions": captions,
+            "ai_summary": ai_result["summary"],
+            "duration": seg["duration"],
+            "clip_start": seg["start"],
+            **thumbnail_urls("outputs", output_filename),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "status": "completed"
+        }
+        if HLS_ENABLED:
+            content_doc["hls"] = {"status": "pending"}
+            defer(package_output_hls, content_id, output_filename)
+        content_docs.append(content_doc)
+        clips.append(VideoClipResponse(
+            id=content_id,
+            status="completed",
+            message="Clip generated successfully",
+            video_url=f"/api/videos/{video_filename}",
+            output_url=f"/api/outputs/{output_filename}",
+            captions=captions,
+            ai_summary=ai_result["summary"],
+            duration=seg["duration"],
+            clip_start=seg["start"],
+            score=seg["score"]
+        ))
+    
+    await db.content.insert_many(content_docs)
+    for content_doc in content_docs:
+        await storage_manager.attach(content_doc)
+    return MultiClipResponse(source_duration=original_duration, clips=clips)
+
+@api_router.post("/generate/video-clips", response_model=MultiClipResponse)
+async def generate_video_clips(
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    video_id: str = Form(...),
+    video_filename: str = Form(...),
+    ai_notes: str = Form(""),
+    aspect_ratio: str = Form("portrait"),
+    target_duration: int = Form(30),
+    count: int = Form(3),
+    current_user: dict = Depends(get_current_user)
+):
+    """Cut the top-N non-overlapping highlight segments from one upload"""
+    if aspect_ratio not in ["portrait", "landscape"]:
+        raise HTTPException(status_code=400, detail="Invalid aspect ratio")
     
-    # Save to database
-    content_id = str(uuid.uuid4())
-    content_doc = {
-        "id": content_id,
-        "user_id": current_user["id"],
-        "type": "clips",
-        "title": f"Viral Clip - {target_duration}s {aspect_ratio}",
-        "content": captions,
-        "video_url": f"/api/videos/{video_filename}",
-        "output_url": f"/api/outputs/{output_filename}",
-        "captions": captions,
-        "ai_summary": ai_summary,
-        "duration": output_duration,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "status": "completed"
-    }
+    if target_duration not in [15, 30, 45, 60, 90, 180]:
+        raise HTTPException(status_code=400, detail="Invalid target duration")
     
-    await db.content.insert_one(content_doc)
+    if not 1 <= count <= 5:
+        raise HTTPException(status_code=400, detail="Clip count must be between 1 and 5")
     
-    return VideoClipResponse(
-        id=content_id,
-        status="completed",
-        message="Clip generated successfully",
-        video_url=f"/api/videos/{video_filename}",
-        output_url=f"/api/outputs/{output_filename}",
-        captions=captions,
-        ai_summary=ai_summary,
-        duration=output_duration
-    )
+    # One token per encode
+    await enforce_rate_limit(current_user, "render", cost=count)
+    await enforce_storage_quota(current_user)
+    return await until_disconnected(http_request, cut_highlight_clips(
+        current_user["id"], video_filename, ai_notes, aspect_ratio, target_duration, count, background_tasks.add_task
+    ))
 
 @api_router.get("/videos/{filename}")
 async def serve_video(filename: str):
     """Serve uploaded videos"""
-    file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Video not found")
-    return FileResponse(file_path, media_type="video/mp4")
+    return await stored_media_response("videos", filename, not_found="Video not found")
 
 @api_router.get("/outputs/{filename}")
 async def serve_output(filename: str):
     """Serve processed output videos"""
-    file_path = OUTPUT_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Output not found")
-    return FileResponse(file_path, media_type="video/mp4")
+    if filename in ACTIVE_RENDERS:
+        if not FRAGMENTED_MP4:
+            raise HTTPException(status_code=409, detail="Output is still rendering")
+        return media_delivery.follow_response("outputs", filename, lambda: filename in ACTIVE_RENDERS)
+    # A worker's render can only be served once its job has finished
+    if await render_in_flight(filename):
+        raise HTTPException(status_code=409, detail="Output is still rendering")
+    return await stored_media_response("outputs", filename, not_found="Output not found")
+
+@api_router.get("/hls/{output_id}/{path:path}")
+async def serve_hls(output_id: str, path: str):
+    """Serve HLS master/variant playlists and segments for a packaged output"""
+    media_type = MEDIA_TYPES.get(Path(path).suffix)
+    if media_type is None:
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    return media_delivery.response(
+        "hls", output_id, *path.split("/"),
+        media_type=media_type,
+        not_found="HLS file not found"
+    )
+
+@api_router.get("/thumbnails/{kind}/{source:path}/{asset}")
+async def serve_thumbnail(kind: str, source: str, asset: str):
+    """Serve a poster, sprite sheet or sprite WebVTT, generating and caching it on first request"""
+    if kind not in THUMBNAIL_SOURCES or asset not in THUMBNAIL_ASSETS:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    if kind == "outputs" and await render_in_flight(source):
+        raise HTTPException(status_code=409, detail="Output is still rendering")
+    parts = source.split("/")
+
+    cache_dir = THUMBNAIL_DIR / kind / Path(*parts)
+    async with thumbnail_source(kind, parts) as source_path:
+        if source_path is None:
+            raise HTTPException(status_code=404, detail="Video not found")
+        if not thumbnail_is_cached(source_path, cache_dir, asset):
+            # One generation per source and asset group; concurrent requests wait for it
+            key = (kind, source, asset == "poster.jpg")
+            lock = thumbnail_locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                ok = await run_in_threadpool(ensure_thumbnail, source_path, cache_dir, asset)
+            if not lock.locked():
+                thumbnail_locks.pop(key, None)
+            if not ok:
+                raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
+
+    return media_delivery.response(
+        "thumbnails", kind, *parts, asset,
+        media_type=MEDIA_TYPES[Path(asset).suffix],
+        not_found="Thumbnail not found"
+    )
 
 # ==================== CONTENT ROUTES ====================
 
@@ -514,15 +1071,29 @@ async def get_library(current_user: dict = Depends(get_current_user)):
         {"user_id": current_user["id"]},
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
+    for item in items:
+        # Items created before thumbnails existed still get lazy preview URLs
+        output_url = item.get("output_url")
+        if output_url and not item.get("poster_url") and output_url.startswith("/api/outputs/"):
+            item.update(thumbnail_urls("outputs", output_url[len("/api/outputs/"):]))
     return items
 
 @api_router.delete("/library/{item_id}")
 async def delete_library_item(item_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.content.delete_one({"id": item_id, "user_id": current_user["id"]})
-    if result.deleted_count == 0:
+    item = await db.content.find_one_and_delete({"id": item_id, "user_id": current_user["id"]}, {"_id": 0})
+    if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
+    # Its rendered files go now; the source upload expires once nothing else uses it
+    await storage_manager.release(item)
     return {"message": "Item deleted"}
 
+@api_router.get("/storage/usage")
+async def get_storage_usage(current_user: dict = Depends(get_current_user)):
+    """Bytes the user's uploads and renders take up, against their plan's quota"""
+    plan = current_user.get("plan", "free")
+    usage = await storage_manager.usage(current_user["id"])
+    return {"plan": plan, "quota_bytes": storage_manager.quota_for(plan), **usage}
+
 # ==================== STORY VIDEO GENERATION ====================
 
 class StoryVideoRequest(BaseModel):
@@ -530,6 +1101,9 @@ class StoryVideoRequest(BaseModel):
     style: str = "dramatic"
     story_length: str = "medium"
     background: str = "minecraft"
+    render_id: Optional[str] = None
+    voiceover: bool = False
+    voice: Optional[str] = None
 
 class StoryVideoResponse(BaseModel):
     id: str
@@ -547,24 +1121,13 @@ class BackgroundCategory(BaseModel):
     videos: List[str]
     video_count: int
 
-def get_background_videos() -> dict:
-    """Get all available background videos organized by category"""
-    categories = {
-        "minecraft": {"label": "Minecraft Parkour", "videos": []},
-        "roblox": {"label": "Roblox Gameplay", "videos": []},
-        "subway": {"label": "Subway Runner", "videos": []},
-        "satisfying": {"label": "Satisfying Loops", "videos": []},
-        "cooking": {"label": "ASMR Cooking", "videos": []},
-        "driving": {"label": "GTA City Cruise", "videos": []}
-    }
-    
-    for cat_id in categories:
-        cat_dir = BACKGROUNDS_DIR / cat_id
-        if cat_dir.exists():
-            videos = list(cat_dir.glob("*.mp4"))
-            categories[cat_id]["videos"] = [f"/api/backgrounds/{cat_id}/{v.name}" for v in videos]
-    
-    return categories
+# Built at startup with probed metadata; refreshed when a category directory's mtime changes
+background_catalog = BackgroundCatalog(
+    BACKGROUNDS_DIR,
+    probe=probe_video,
+    refresh_interval=BACKGROUND_REFRESH_SECONDS,
+    strategy=BACKGROUND_SELECTION
+)
 
 def get_target_duration(story_length: str) -> int:
     """Get target duration in seconds based on story length"""
@@ -575,118 +1138,30 @@ def get_target_duration(story_length: str) -> int:
     }
     return durations.get(story_length, 42)
 
-def render_story_video(
-    background_path: str,
-    captions: str,
-    output_path: str,
-    target_duration: int,
-    style: str
-) -> bool:
-    """Render a story video with captions overlaid on background"""
-    try:
-        # Clean captions - remove [BEAT] markers and extra whitespace
-        clean_captions = captions.replace("[BEAT]", "").strip()
-        lines = [l.strip() for l in clean_captions.split("\n") if l.strip()]
-        
-        # Create subtitle file (SRT format)
-        srt_path = output_path.replace(".mp4", ".srt")
-        time_per_line = target_duration / max(len(lines), 1)
-        
-        with open(srt_path, "w") as f:
-            for i, line in enumerate(lines):
-                start_time = i * time_per_line
-                end_time = (i + 1) * time_per_line
-                
-                # Format time as HH:MM:SS,mmm
-                start_h = int(start_time // 3600)
-                start_m = int((start_time % 3600) // 60)
-                start_s = int(start_time % 60)
-                start_ms = int((start_time % 1) * 1000)
-                
-                end_h = int(end_time // 3600)
-                end_m = int((end_time % 3600) // 60)
-                end_s = int(end_time % 60)
-                end_ms = int((end_time % 1) * 1000)
-                
-                f.write(f"{i + 1}\n")
-                f.write(f"{start_h:02d}:{start_m:02d}:{start_s:02d},{start_ms:03d} --> {end_h:02d}:{end_m:02d}:{end_s:02d},{end_ms:03d}\n")
-                f.write(f"{line}\n\n")
-        
-        # Style-based font settings
-        style_fonts = {
-            "dramatic": "fontsize=48:fontcolor=white:borderw=3:bordercolor=black",
-            "mysterious": "fontsize=44:fontcolor=#E0E0E0:borderw=2:bordercolor=#1a1a1a",
-            "heartwarming": "fontsize=46:fontcolor=#FFF5E6:borderw=2:bordercolor=#8B4513",
-            "suspenseful": "fontsize=50:fontcolor=#FF4444:borderw=3:bordercolor=black",
-            "educational": "fontsize=42:fontcolor=white:borderw=2:bordercolor=#333333"
-        }
-        font_style = style_fonts.get(style, style_fonts["dramatic"])
-        
-        # FFmpeg command to create video with subtitles
-        # Loop background video if needed, add subtitles
-        cmd = [
-            "ffmpeg", "-y",
-            "-stream_loop", "-1",  # Loop input
-            "-i", background_path,
-            "-t", str(target_duration),
-            "-vf", f"subtitles={srt_path}:force_style='{font_style},Alignment=2,MarginV=150'",
-            "-c:v", "libx264",
-            "-preset", "fast",
-            "-crf", "23",
-            "-an",  # No audio for now
-            output_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        
-        # Clean up SRT file
-        if os.path.exists(srt_path):
-            os.remove(srt_path)
-        
-        if result.returncode != 0:
-            logger.error(f"FFmpeg error: {result.stderr}")
-            # Try simpler approach without subtitles filter
-            cmd_simple = [
-                "ffmpeg", "-y",
-                "-stream_loop", "-1",
-                "-i", background_path,
-                "-t", str(target_duration),
-                "-vf", f"drawtext=text='{lines[0][:50] if lines else 'Story'}':fontsize=36:fontcolor=white:x=(w-text_w)/2:y=h-200:borderw=2:bordercolor=black",
-                "-c:v", "libx264",
-                "-preset", "fast",
-                "-crf", "23",
-                "-an",
-                output_path
-            ]
-            result = subprocess.run(cmd_simple, capture_output=True, text=True, timeout=120)
-            return result.returncode == 0
-            
-        return True
-    except Exception as e:
-        logger.error(f"Video rendering error: {str(e)}")
-        return False
-
 @api_router.get("/backgrounds")
-async def get_backgrounds():
-    """Get all available background video categories"""
-    categories = get_background_videos()
-    result = []
-    for cat_id, cat_data in categories.items():
-        result.append({
-            "id": cat_id,
-            "label": cat_data["label"],
-            "videos": cat_data["videos"],
-            "video_count": len(cat_data["videos"])
-        })
-    return result
+async def get_backgrounds(request: Request):
+    """Get all available background video categories (ETag-validated)"""
+    await run_in_threadpool(background_catalog.maybe_refresh)
+    etag = background_catalog.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    result = background_catalog.listing()
+    for category in result:
+        category["posters"] = [
+            thumbnail_urls("backgrounds", v[len("/api/backgrounds/"):])["poster_url"]
+            for v in category["videos"]
+        ]
+    return JSONResponse(result, headers=headers)
 
 @api_router.get("/backgrounds/{category}/{filename}")
 async def serve_background(category: str, filename: str):
     """Serve a background video file"""
-    file_path = BACKGROUNDS_DIR / category / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail=f"Background video not found: {category}/{filename}")
-    return FileResponse(file_path, media_type="video/mp4")
+    return media_delivery.response(
+        "backgrounds", category, filename,
+        not_found=f"Background video not found: {category}/{filename}"
+    )
 
 async def generate_story_captions(transcript: str, style: str, story_length: str) -> dict:
     """Generate optimized captions from transcript based on style and length"""
@@ -746,6 +1221,8 @@ Output the formatted captions only, ready for video overlay."""
 @api_router.post("/generate/story-video", response_model=StoryVideoResponse)
 async def generate_story_video(
     request: StoryVideoRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Generate a viral story video with animated captions"""
@@ -753,7 +1230,7 @@ async def generate_story_video(
     # Validate inputs
     valid_styles = ["dramatic", "mysterious", "heartwarming", "suspenseful", "educational"]
     valid_lengths = ["short", "medium", "long"]
-    valid_backgrounds = ["minecraft", "roblox", "subway", "satisfying", "cooking", "driving"]
+    valid_backgrounds = list(BACKGROUND_CATEGORIES)
     
     if request.style not in valid_styles:
         raise HTTPException(status_code=400, detail=f"Invalid style. Choose from: {', '.join(valid_styles)}")
@@ -767,84 +1244,42 @@ async def generate_story_video(
     if not request.transcript.strip():
         raise HTTPException(status_code=400, detail="Story transcript is required")
     
-    # Check for available background videos
-    bg_dir = BACKGROUNDS_DIR / request.background
-    bg_videos = list(bg_dir.glob("*.mp4")) if bg_dir.exists() else []
-    
-    if not bg_videos:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"No background videos available for '{request.background}'. Please select a different background category."
-        )
-    
-    # Select first available background video
-    background_path = str(bg_videos[0])
-    
-    # Generate optimized captions
-    caption_result = await generate_story_captions(
-        request.transcript,
-        request.style,
-        request.story_length
-    )
-    
-    # Get target duration based on story length
-    target_duration = get_target_duration(request.story_length)
-    
-    # Generate output filename
-    output_id = str(uuid.uuid4())
-    output_filename = f"{output_id}_story.mp4"
-    output_path = str(OUTPUT_DIR / output_filename)
-    
-    # Render the video
-    success = render_story_video(
-        background_path=background_path,
-        captions=caption_result["captions"],
-        output_path=output_path,
-        target_duration=target_duration,
-        style=request.style
-    )
-    
-    if not success or not os.path.exists(output_path):
-        raise HTTPException(
-            status_code=500, 
-            detail="Failed to render story video. Please try again or select a different background."
-        )
-    
-    # Save to database
-    item_id = str(uuid.uuid4())
-    content_doc = {
-        "id": item_id,
-        "user_id": current_user["id"],
-        "type": "story_video",
-        "title": f"Story Video: {request.transcript[:40]}...",
-        "content": caption_result["captions"],
-        "captions": caption_result["captions"],
-        "output_url": f"/api/outputs/{output_filename}",
-        "style": request.style,
-        "story_length": request.story_length,
-        "background": request.background,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "status": "completed"
-    }
-    
-    await db.content.insert_one(content_doc)
-    
-    return StoryVideoResponse(
-        id=item_id,
-        status="completed",
-        message="Story video generated successfully",
-        captions=caption_result["captions"],
-        output_url=f"/api/outputs/{output_filename}",
-        style=request.style,
-        story_length=request.story_length,
-        background=request.background
-    )
+    async def start():
+        # Pick a background from the catalog, rotating through every video in the category
+        await run_in_threadpool(background_catalog.maybe_refresh)
+        background = background_catalog.choose(request.background)
+        
+        if background is None:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"No background videos available for '{request.background}'. Please select a different background category."
+            )
+        
+        background_path = background["path"]
+        
+        # Charged here, so a retry that replays a stored result costs nothing
+        await enforce_rate_limit(current_user, "render")
+        await enforce_storage_quota(current_user)
+        
+        # Generate output filename
+        output_filename = await resolve_render_id(request.render_id, "_story.mp4")
+        return await dispatch_render("story", {
+            "user_id": current_user["id"],
+            "content_id": str(uuid.uuid4()),
+            **request.model_dump(exclude={"render_id"}),
+            # Relative, so a worker with its own checkout of the assets finds the same file
+            "background_file": str(Path(background_path).relative_to(BACKGROUNDS_DIR)),
+            "output_filename": output_filename
+        }, http_request, background_tasks)
+    
+    return await idempotent(http_request, current_user, "story-video", request.model_dump(), start)
 
 # ==================== OTHER AI GENERATION ROUTES ====================
 
 @api_router.post("/generate/story", response_model=ContentItem)
 async def generate_story_legacy(request: GenerateStoryRequest, current_user: dict = Depends(get_current_user)):
     """Legacy story generation endpoint"""
+    await enforce_rate_limit(current_user, "llm")
     system_message = """You are a storytelling expert for video content. Create compelling 
     narratives optimized for faceless videos with strong visual descriptions."""
     
@@ -878,6 +1313,7 @@ async def generate_story_legacy(request: GenerateStoryRequest, current_user: dic
 
 @api_router.post("/generate/voiceover", response_model=ContentItem)
 async def generate_voiceover(request: GenerateVoiceoverRequest, current_user: dict = Depends(get_current_user)):
+    await enforce_rate_limit(current_user, "llm")
     system_message = """You are a professional voiceover script writer. Optimize text for 
     natural speech patterns, pacing, and engagement."""
     
@@ -910,6 +1346,12 @@ async def generate_voiceover(request: GenerateVoiceoverRequest, current_user: di
 
 @api_router.post("/generate/transcription", response_model=ContentItem)
 async def generate_transcription(request: TranscriptionRequest, current_user: dict = Depends(get_current_user)):
+    if not request.video_filename and not request.video_description.strip():
+        raise HTTPException(status_code=400, detail="Provide a video_filename to transcribe or a video_description")
+    if request.video_filename:
+        return await transcribe_upload(request, current_user)
+    
+    await enforce_rate_limit(current_user, "llm")
     system_message = """You are an expert at creating video transcriptions and captions. 
     Generate accurate, well-formatted transcriptions with timestamps."""
     
@@ -939,8 +1381,52 @@ async def generate_transcription(request: TranscriptionRequest, current_user: di
     await db.content.insert_one(content_doc)
     return ContentItem(**content_doc)
 
+async def transcribe_upload(request: TranscriptionRequest, current_user: dict) -> ContentItem:
+    """Transcribe an uploaded video's actual audio with the local speech model"""
+    if not transcriber.available():
+        raise HTTPException(status_code=503, detail="Transcription service not configured")
+    
+    try:
+        async with checked_out("videos", request.video_filename) as input_path:
+            if input_path is None:
+                raise HTTPException(status_code=404, detail="Video file not found")
+            # Local speech-to-text is CPU work, charged like a render
+            await enforce_rate_limit(current_user, "render")
+            result = await run_in_threadpool(transcriber.transcribe_file, str(input_path), request.language)
+    except TranscriptionUnavailable:
+        raise HTTPException(status_code=503, detail="Transcription service not configured")
+    except BrokenProcessPool:
+        # A speech worker died (e.g. out of memory); drop the pool so the next request starts a fresh one
+        logger.error("Transcription worker pool broke, restarting it")
+        transcriber.shutdown()
+        raise HTTPException(status_code=503, detail="Transcription is temporarily unavailable. Try again.")
+    except RuntimeError as e:
+        logger.error(f"Transcription failed: {e}")
+        raise HTTPException(status_code=422, detail="Could not read an audio track from this video")
+    
+    item_id = str(uuid.uuid4())
+    content_doc = {
+        "id": item_id,
+        "user_id": current_user["id"],
+        "type": "transcription",
+        "title": f"Transcription: {request.video_description[:50] or request.video_filename}",
+        "content": result["text"],
+        "video_url": f"/api/videos/{request.video_filename}",
+        "segments": result["segments"],
+        "language": result["language"],
+        "duration": result["audio_seconds"],
+        "real_time_factor": result["real_time_factor"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "status": "completed"
+    }
+    
+    await db.content.insert_one(content_doc)
+    await storage_manager.attach(content_doc)
+    return ContentItem(**content_doc)
+
 @api_router.post("/generate/ranking", response_model=ContentItem)
 async def generate_ranking(request: VideoRankingRequest, current_user: dict = Depends(get_current_user)):
+    await enforce_rate_limit(current_user, "llm")
     system_message = """You are a YouTube SEO and video ranking expert. Provide actionable 
     optimization strategies based on current best practices."""
     
@@ -974,17 +1460,68 @@ async def generate_ranking(request: VideoRankingRequest, current_user: dict = De
     await db.content.insert_one(content_doc)
     return ContentItem(**content_doc)
 
-@api_router.post("/generate/split-screen", response_model=ContentItem)
-async def generate_split_screen(
-    video_topic: str = Form(...),
-    style: str = Form("engaging"),
-    duration: str = Form("60s"),
-    current_user: dict = Depends(get_current_user)
-):
-    system_message = """You are an expert in creating split-screen video content. 
+# Longest split-screen render a request may ask for, in seconds
+SPLIT_SCREEN_MAX_SECONDS = 180
+
+def parse_duration_seconds(duration: str, default: int = 60) -> int:
+    """'60s' / '60' -> 60"""
+    try:
+        return int(str(duration).strip().rstrip('s'))
+    except ValueError:
+        return default
+
+@timed("render_split_screen")
+def render_split_screen(
+    clip_path: str,
+    background_source: str,
+    output_path: str,
+    layout: str,
+    duration: float,
+    clip_start: float = 0.0,
+    has_audio: bool = True,
+    timeout: RenderTimeout = RenderTimeout(),
+    cancel: Optional[CancelToken] = None
+) -> bool:
+    """Stack a clip segment with a looping background in one ffmpeg pass"""
+    _, pane_width, pane_height, _ = SPLIT_LAYOUTS[layout]
+    try:
+        background = normalize_background(Path(background_source), NORMALIZED_BACKGROUND_DIR, pane_width, pane_height)
+        cmd = build_split_screen_command(
+            clip_path,
+            str(background),
+            output_path,
+            layout,
+            duration,
+            clip_start=clip_start,
+            has_audio=has_audio,
+            output_args=mp4_output_args(FRAGMENTED_MP4)
+        )
+        result = run_ffmpeg(cmd, timeout(duration), cancel)
+    except RenderCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Split-screen render error: {e}")
+        return False
+    if result.returncode != 0:
+        logger.error(f"FFmpeg split-screen error: {result.stderr}")
+        return False
+    return True
+
+def prenormalize_backgrounds(layout: str = "top_bottom"):
+    """Normalize every catalog background for a layout so split-screen renders only scale the user clip"""
+    _, pane_width, pane_height, _ = SPLIT_LAYOUTS[layout]
+    for videos in list(background_catalog.videos.values()):
+        for video in videos:
+            try:
+                normalize_background(Path(video["path"]), NORMALIZED_BACKGROUND_DIR, pane_width, pane_height)
+            except Exception as e:
+                logger.error(f"Could not normalize background {video['filename']}: {e}")
+
+SPLIT_SCREEN_SYSTEM_MESSAGE = """You are an expert in creating split-screen video content. 
     Design engaging layouts and content strategies for dual-view videos."""
-    
-    prompt = f"""Create a split-screen video concept for: {video_topic}
+
+def split_screen_prompt(video_topic: str, duration: str, style: str) -> str:
+    return f"""Create a split-screen video concept for: {video_topic}
     Duration: {duration}
     Style: {style}
     
@@ -996,8 +1533,51 @@ async def generate_split_screen(
     5. Audio strategy (which side has main audio)
     6. Text overlay suggestions
     7. Engagement hooks for both panels"""
-    
-    content = await generate_ai_content(prompt, system_message)
+
+@api_router.post("/generate/split-screen", response_model=ContentItem)
+async def generate_split_screen(
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    video_topic: str = Form(...),
+    style: str = Form("engaging"),
+    duration: str = Form("60s"),
+    video_filename: Optional[str] = Form(None),
+    background: str = Form("minecraft"),
+    layout: str = Form("top_bottom"),
+    render_id: Optional[str] = Form(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Split-screen concept; with video_filename, also render the clip stacked over a background loop"""
+    if video_filename:
+        if layout not in SPLIT_LAYOUTS:
+            raise HTTPException(status_code=400, detail=f"Invalid layout. Choose from: {', '.join(SPLIT_LAYOUTS)}")
+        if background not in BACKGROUND_CATEGORIES:
+            raise HTTPException(status_code=400, detail=f"Invalid background. Choose from: {', '.join(BACKGROUND_CATEGORIES)}")
+        if not 1 <= parse_duration_seconds(duration) <= SPLIT_SCREEN_MAX_SECONDS:
+            raise HTTPException(status_code=400, detail=f"Duration must be between 1s and {SPLIT_SCREEN_MAX_SECONDS}s")
+        
+        await run_in_threadpool(background_catalog.maybe_refresh)
+        background_video = background_catalog.choose(background)
+        if background_video is None:
+            raise HTTPException(status_code=400, detail=f"No background videos available for '{background}'")
+        
+        await enforce_rate_limit(current_user, "render")
+        await enforce_storage_quota(current_user)
+        output_filename = await resolve_render_id(render_id, "_split.mp4")
+        return await dispatch_render("split_screen", {
+            "user_id": current_user["id"],
+            "content_id": str(uuid.uuid4()),
+            "video_topic": video_topic,
+            "style": style,
+            "duration": duration,
+            "video_filename": video_filename,
+            "background_file": str(Path(background_video["path"]).relative_to(BACKGROUNDS_DIR)),
+            "layout": layout,
+            "output_filename": output_filename
+        }, http_request, background_tasks, source=video_filename)
+    
+    await enforce_rate_limit(current_user, "llm")
+    content = await generate_ai_content(split_screen_prompt(video_topic, duration, style), SPLIT_SCREEN_SYSTEM_MESSAGE)
     
     item_id = str(uuid.uuid4())
     content_doc = {
@@ -1009,10 +1589,436 @@ async def generate_split_screen(
         "created_at": datetime.now(timezone.utc).isoformat(),
         "status": "completed"
     }
-    
     await db.content.insert_one(content_doc)
     return ContentItem(**content_doc)
 
+# ==================== RENDER JOBS ====================
+#
+# The rendering half of the clip, story and split-screen endpoints. Each takes the
+# JSON params its endpoint built (ids included, so a retried job overwrites its own
+# library item) and returns the endpoint's response. Inline they run in the request
+# with deferred work handed to BackgroundTasks; queued they run in worker.py.
+
+async def render_clip_job(params: dict, defer: Callable) -> dict:
+    video_filename = params["video_filename"]
+    aspect_ratio = params["aspect_ratio"]
+    target_duration = params["target_duration"]
+    ai_notes = params["ai_notes"]
+    output_filename = params["output_filename"]
+    output_path = OUTPUT_DIR / output_filename
+    
+    # The source stays in the local cache until the render is done
+    async with checked_out("videos", video_filename) as input_path:
+        if input_path is None:
+            raise HTTPException(status_code=404, detail="Video file not found")
+        
+        # Get original duration
+        original_duration = await run_in_threadpool(get_video_duration, str(input_path))
+        
+        # Process video off the event loop so other requests (and playback of this render) keep flowing
+        with rendering(output_filename):
+            start_time = None
+            if HIGHLIGHTS_ENABLED:
+                try:
+                    with stage_timer("highlight_analysis"):
+                        scores = await asyncio.wrap_future(highlight_analyzer.submit(str(input_path)))
+                    start_time = clip_start(scores, original_duration, target_duration)
+                except Exception as e:
+                    logger.warning(f"Highlight analysis failed for {video_filename}, using fixed offset: {e}")
+        
+            success = await run_render(
+                process_video_clip,
+                str(input_path),
+                str(output_path),
+                target_duration,
+                aspect_ratio,
+                start_time,
+                reframe=REFRAME_ENABLED,
+                fragmented=FRAGMENTED_MP4,
+                timeout=RENDER_TIMEOUT
+            ) and output_path.exists()
+            if success:
+                output_path = await save_stored("outputs", output_filename, output_path)
+    
+    if not success:
+        output_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail="Failed to process video")
+    
+    # Generate AI captions
+    video_info = {
+        "duration": original_duration,
+        "target_duration": target_duration,
+        "aspect_ratio": aspect_ratio
+    }
+    
+    try:
+        ai_result = await generate_video_captions(video_info, ai_notes)
+        captions = f"{ai_result['caption']}\n\n{ai_result['hashtags']}"
+        ai_summary = ai_result['summary']
+    except Exception as e:
+        logger.error(f"AI caption generation failed: {e}")
+        captions = "🔥 Check out this viral clip!\n\n#viral #content #creator"
+        ai_summary = DEFAULT_SUMMARY
+    
+    # Get output duration
+    output_duration = await run_in_threadpool(get_video_duration, str(output_path))
+    
+    # Save to database
+    content_id = params["content_id"]
+    content_doc = {
+        "id": content_id,
+        "user_id": params["user_id"],
+        "type": "clips",
+        "title": f"Viral Clip - {target_duration}s {aspect_ratio}",
+        "content": captions,
+        "video_url": f"/api/videos/{video_filename}",
+        "output_url": f"/api/outputs/{output_filename}",
+        "captions": captions,
+        "ai_summary": ai_summary,
+        "duration": output_duration,
+        "clip_start": start_time,
+        **thumbnail_urls("outputs", output_filename),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "status": "completed"
+    }
+    if HLS_ENABLED:
+        content_doc["hls"] = {"status": "pending"}
+    
+    await db.content.replace_one({"id": content_doc["id"]}, content_doc, upsert=True)
+    await storage_manager.attach(content_doc)
+    if HLS_ENABLED:
+        defer(package_output_hls, content_id, output_filename)
+    
+    return VideoClipResponse(
+        id=content_id,
+        status="completed",
+        message="Clip generated successfully",
+        video_url=f"/api/videos/{video_filename}",
+        output_url=f"/api/outputs/{output_filename}",
+        captions=captions,
+        ai_summary=ai_summary,
+        duration=output_duration
+    ).model_dump()
+
+async def render_story_job(params: dict, defer: Callable) -> dict:
+    request = StoryVideoRequest(**params)
+    background_path = resolve_media_path(BACKGROUNDS_DIR, *params["background_file"].split("/"))
+    if background_path is None:
+        raise HTTPException(status_code=400, detail=f"Background video '{params['background_file']}' not found")
+    background_path = str(background_path)
+    output_filename = params["output_filename"]
+    output_path = str(OUTPUT_DIR / output_filename)
+    
+    # Mark the render active before captioning so a client polling render_id waits instead of 404ing
+    with rendering(output_filename):
+        # Generate optimized captions
+        caption_result = await generate_story_captions(
+            request.transcript,
+            request.style,
+            request.story_length
+        )
+        
+        # Get target duration based on story length
+        target_duration = get_target_duration(request.story_length)
+        
+        # Synthesize narration (cached per line); the video then runs as long as the voiceover
+        narration_path = None
+        line_durations = None
+        lines, beats = parse_caption_script(caption_result["captions"])
+        # Captions that are only whitespace or [BEAT] markers leave nothing to narrate
+        if request.voiceover and lines:
+            pauses = (beats * BEAT_PAUSE_SECONDS).tolist()
+            try:
+                with stage_timer("synthesize_narration"):
+                    narration, line_durations = await run_in_threadpool(
+                        synthesize_narration, tts_engine, lines, pauses, TTS_CACHE_DIR, request.voice
+                    )
+            except TTSError as e:
+                logger.error(f"Voiceover synthesis failed: {e}")
+                raise HTTPException(status_code=503, detail="Voiceover is currently unavailable. Try again without voiceover.")
+            narration_path = str(narration)
+            target_duration = math.ceil(sum(line_durations) + sum(pauses) + 0.5)
+        
+        # Render the video
+        success = await run_render(
+            render_story_video,
+            background_path=background_path,
+            captions=caption_result["captions"],
+            output_path=output_path,
+            target_duration=target_duration,
+            style=request.style,
+            narration_path=narration_path,
+            line_durations=line_durations,
+            timing_unit=CAPTION_TIMING_UNIT,
+            karaoke=CAPTION_KARAOKE,
+            fragmented=FRAGMENTED_MP4,
+            timeout=RENDER_TIMEOUT
+        ) and os.path.exists(output_path)
+        if success:
+            await save_stored("outputs", output_filename, Path(output_path))
+    
+    if not success:
+        Path(output_path).unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=500, 
+            detail="Failed to render story video. Please try again or select a different background."
+        )
+    
+    # Save to database
+    item_id = params["content_id"]
+    content_doc = {
+        "id": item_id,
+        "user_id": params["user_id"],
+        "type": "story_video",
+        "title": f"Story Video: {request.transcript[:40]}...",
+        "content": caption_result["captions"],
+        "captions": caption_result["captions"],
+        "output_url": f"/api/outputs/{output_filename}",
+        "style": request.style,
+        "story_length": request.story_length,
+        "background": request.background,
+        "voiceover": request.voiceover,
+        "duration": target_duration,
+        **thumbnail_urls("outputs", output_filename),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "status": "completed"
+    }
+    if HLS_ENABLED:
+        content_doc["hls"] = {"status": "pending"}
+    
+    await db.content.replace_one({"id": content_doc["id"]}, content_doc, upsert=True)
+    await storage_manager.attach(content_doc)
+    if HLS_ENABLED:
+        defer(package_output_hls, item_id, output_filename)
+    
+    return StoryVideoResponse(
+        id=item_id,
+        status="completed",
+        message="Story video generated successfully",
+        captions=caption_result["captions"],
+        output_url=f"/api/outputs/{output_filename}",
+        style=request.style,
+        story_length=request.story_length,
+        background=request.background
+    ).model_dump()
+
+async def render_split_screen_job(params: dict, defer: Callable) -> dict:
+    video_filename = params["video_filename"]
+    output_filename = params["output_filename"]
+    background_path = resolve_media_path(BACKGROUNDS_DIR, *params["background_file"].split("/"))
+    if background_path is None:
+        raise HTTPException(status_code=400, detail=f"Background video '{params['background_file']}' not found")
+    
+    async with checked_out("videos", video_filename) as input_path:
+        if input_path is None:
+            raise HTTPException(status_code=404, detail="Video file not found")
+        
+        data = await run_in_threadpool(probe_video, str(input_path))
+        original_duration = float(data.get('format', {}).get('duration', 0))
+        has_audio = any(st.get('codec_type') == 'audio' for st in data.get('streams', []))
+        output_duration = min(float(parse_duration_seconds(params["duration"])), original_duration)
+    
+        # Use the most engaging window when the upload is longer than the split-screen
+        clip_start_time = 0.0
+        if HIGHLIGHTS_ENABLED and original_duration > output_duration:
+            try:
+                scores = await asyncio.wrap_future(highlight_analyzer.submit(str(input_path)))
+                clip_start_time = clip_start(scores, original_duration, output_duration) or 0.0
+            except Exception as e:
+                logger.warning(f"Highlight analysis failed for {video_filename}: {e}")
+    
+        output_path = OUTPUT_DIR / output_filename
+        with rendering(output_filename):
+            success = await run_render(
+                render_split_screen,
+                str(input_path),
+                str(background_path),
+                str(output_path),
+                params["layout"],
+                output_duration,
+                clip_start_time,
+                has_audio,
+                timeout=RENDER_TIMEOUT
+            ) and output_path.exists()
+            if success:
+                output_path = await save_stored("outputs", output_filename, output_path)
+    
+    if not success:
+        output_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail="Failed to render split-screen video")
+    
+    # The video is already rendered; a missing concept should not fail the job
+    video_topic = params["video_topic"]
+    try:
+        content = await generate_ai_content(
+            split_screen_prompt(video_topic, params["duration"], params["style"]), SPLIT_SCREEN_SYSTEM_MESSAGE
+        )
+    except HTTPException as e:
+        logger.error(f"Split-screen concept generation failed: {e.detail}")
+        content = f"Split-screen render: {video_topic}"
+    
+    item_id = params["content_id"]
+    content_doc = {
+        "id": item_id,
+        "user_id": params["user_id"],
+        "type": "split_screen",
+        "title": f"Split Screen: {video_topic[:50]}",
+        "content": content,
+        "video_url": f"/api/videos/{video_filename}",
+        "output_url": f"/api/outputs/{output_filename}",
+        "duration": output_duration,
+        "clip_start": clip_start_time,
+        **thumbnail_urls("outputs", output_filename),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "status": "completed"
+    }
+    if HLS_ENABLED:
+        content_doc["hls"] = {"status": "pending"}
+    
+    await db.content.replace_one({"id": item_id}, content_doc, upsert=True)
+    await storage_manager.attach(content_doc)
+    if HLS_ENABLED:
+        defer(package_output_hls, item_id, output_filename)
+    return ContentItem(**content_doc).model_dump()
+
+RENDER_JOBS = {
+    "clip": render_clip_job,
+    "story": render_story_job,
+    "split_screen": render_split_screen_job
+}
+
+async def until_disconnected(http_request: Request, render: Awaitable):
+    """Await a render in the request, cancelling it (and killing its ffmpeg) if the client goes away"""
+    task = asyncio.ensure_future(render)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info(f"Client left {http_request.url.path}, cancelling its render")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        task.cancel()
+
+async def dispatch_render(
+    kind: str,
+    params: dict,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    source: Optional[str] = None
+):
+    """Render now, or queue the job for a worker and answer 202 with where to poll it"""
+    if RENDER_MODE == "inline":
+        return await until_disconnected(http_request, RENDER_JOBS[kind](params, background_tasks.add_task))
+    # Catch a missing upload here rather than after the job waits its turn
+    if source and not await run_in_threadpool(media_store.exists, "videos", source):
+        raise HTTPException(status_code=404, detail="Video file not found")
+    job = await job_queue.enqueue(kind, params, params["user_id"], params.get("output_filename"))
+    return job_response(job)
+
+def job_response(job: dict) -> JSONResponse:
+    status_url = f"/api/jobs/{job['id']}"
+    return JSONResponse(
+        status_code=202,
+        content={**public_job(job), "status_url": status_url},
+        headers={"Location": status_url}
+    )
+
+# A retry does a queued render again when its job ended like this
+RETRYABLE_JOB_STATUSES = ("failed", "cancelled")
+
+def replay(record: dict, job: Optional[dict]) -> Response:
+    """What a retry with a used Idempotency-Key gets: the stored response, or how its job is doing now"""
+    headers = {"Idempotent-Replayed": "true"}
+    if job is not None:
+        if job["status"] == "completed":
+            return JSONResponse(job["result"], headers=headers)
+        response = job_response(job)
+        response.headers.update(headers)
+        return response
+    return JSONResponse(record["response"], status_code=record["status_code"], headers=headers)
+
+async def idempotent(http_request: Request, user: dict, scope: str, params: dict, start: Callable[[], Awaitable]):
+    """Run start() once per Idempotency-Key; retries get its result, or wait for it while it runs"""
+    key = http_request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return await start()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is longer than {MAX_KEY_LENGTH} characters")
+    request_fingerprint = fingerprint(scope, params)
+    while True:
+        try:
+            record = await idempotency_store.begin(user["id"], key, request_fingerprint)
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        if record is None:
+            break
+        if record["status"] == "completed":
+            job = await job_queue.get(record["job_id"]) if record.get("job_id") else None
+            if job is None or job["status"] not in RETRYABLE_JOB_STATUSES:
+                return replay(record, job)
+            # Its job failed or was cancelled: this retry renders again, unless another retry already does
+            if await idempotency_store.reopen(user["id"], key, record["job_id"]):
+                break
+            continue
+        # The first request is still rendering inline; its result (or failure) shows up in the record
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+        if await http_request.is_disconnected():
+            raise HTTPException(status_code=499, detail="Client closed request")
+    
+    # An inline render can outlast the lock; keep it while this request works so a retry never takes over
+    holder = asyncio.create_task(idempotency_store.hold(user["id"], key))
+    try:
+        response = await start()
+    except BaseException:
+        await idempotency_store.release(user["id"], key)
+        raise
+    finally:
+        holder.cancel()
+    if isinstance(response, JSONResponse):
+        body = json.loads(response.body)
+        await idempotency_store.complete(user["id"], key, response.status_code, body, job_id=body.get("id"))
+    else:
+        await idempotency_store.complete(user["id"], key, 200, jsonable_encoder(response))
+    return response
+
+def job_handler(render: Callable) -> Callable:
+    """Adapt a render job for JobWorker: deferred work runs before the job completes, client errors are final"""
+    async def handle(params: dict) -> dict:
+        deferred = []
+        try:
+            result = await render(params, lambda func, *args: deferred.append((func, args)))
+        except HTTPException as e:
+            if e.status_code < 500:
+                raise JobFailed(e.detail)
+            raise RuntimeError(e.detail)
+        for func, args in deferred:
+            await func(*args)
+        return result
+    return handle
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Status of a queued render; once completed, result holds what the endpoint would have returned"""
+    job = await job_queue.get(job_id, current_user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@api_router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Cancel a queued or running render; the worker kills its ffmpeg and removes the partial output"""
+    job = await job_queue.cancel(job_id, current_user["id"])
+    if job is None:
+        existing = await job_queue.get(job_id, current_user["id"])
+        if existing is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job already {existing['status']}")
+    return public_job(job)
+
 # ==================== USER PROFILE ROUTES ====================
 
 @api_router.put("/profile")
@@ -1039,6 +2045,33 @@ async def update_profile(
         created_at=updated_user["created_at"]
     )
 
+# ==================== ADMIN: PROFILES ====================
+
+@api_router.get("/admin/profiles")
+async def list_profiles(admin: dict = Depends(get_admin_user)):
+    """Saved request profiles, newest first"""
+    files = sorted(PROFILE_DIR.glob("*.speedscope.json"), reverse=True) if PROFILE_DIR.exists() else []
+    return [
+        {"name": f.name, "size": f.stat().st_size, "url": f"/api/admin/profiles/{f.name}"}
+        for f in files[:200]
+    ]
+
+@api_router.get("/admin/profiles/{name}")
+async def get_profile(name: str, admin: dict = Depends(get_admin_user)):
+    """Download a profile (open it at https://www.speedscope.app)"""
+    path = resolve_media_path(PROFILE_DIR, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+# ==================== ADMIN: STORAGE ====================
+
+@api_router.get("/admin/storage")
+async def get_storage_report(admin: dict = Depends(get_admin_user)):
+    """Disk usage per storage directory and the last sweep's results"""
+    report = await run_in_threadpool(storage_manager.disk_usage)
+    return {**report, "last_sweep": storage_manager.last_sweep}
+
 # ==================== HEALTH CHECK ====================
 
 @api_router.get("/")
@@ -1047,7 +2080,12 @@ async def root():
 
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "ClipTag AI"}
+    return {"status": "healthy", "service": "ClipTag AI", "llm_parse": parse_stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Include router and middleware
 app.include_router(api_router)
@@ -1059,7 +2097,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(
+    ProfilingMiddleware,
+    profile_dir=PROFILE_DIR,
+    is_admin_request=is_admin_request,
+    sample_rate=PROFILE_SAMPLE_RATE
+)
@@ -0,0 +1,357 @@
+"""Where uploads and renders are kept: local directories or an S3-compatible bucket.
+
+ffmpeg always works on local files. Uploads and renders are written to the
+local upload/output directories first and then handed to the backend with
+``save()``:
+
+- ``LocalStorage`` leaves them where they are; serving goes through
+  MediaDelivery as before
+- ``S3Storage`` uploads them to ``<prefix><kind>/<filename>`` (multipart,
+  parts sent in parallel) and moves the local copy into a read-through cache;
+  serving redirects to a pre-signed URL. A node that needs a stored file as an
+  ffmpeg input checks it out of the cache, which downloads it on a miss and
+  evicts the least recently used files beyond its byte budget, never one that
+  is checked out
+
+Any S3-compatible server works (AWS, MinIO, Ceph, R2) through
+``S3_ENDPOINT_URL``. boto3 is only imported when the S3 backend first
+connects: importing it and building the client takes about a second, so the
+API does it during startup (``connect()``) rather than at import.
+"""
+import os
+import shutil
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from delivery import MEDIA_TYPES, resolve_media_path
+
+BACKENDS = ("local", "s3")
+MIB = 1024 ** 2
+
+
+def check_name(filename: str) -> str:
+    """Stored files are flat; reject anything that could address another key or path"""
+    if not filename or filename in (".", "..") or "/" in filename or "\\" in filename:
+        raise ValueError(f"Invalid stored file name '{filename}'")
+    return filename
+
+
+def content_type(filename: str) -> str:
+    return MEDIA_TYPES.get(Path(filename).suffix.lower(), "application/octet-stream")
+
+
+class LocalStorage:
+    """Files stay in the local upload/output directories"""
+
+    def __init__(self, roots: Dict[str, Path]):
+        self.roots = roots
+
+    def connect(self):
+        pass
+
+    def save(self, kind: str, filename: str, source: Path) -> Path:
+        dest = self.roots[kind] / check_name(filename)
+        if Path(source).resolve() != dest.resolve():
+            shutil.move(str(source), dest)
+        return dest
+
+    def checkout(self, kind: str, filename: str) -> Optional[Path]:
+        return resolve_media_path(self.roots[kind], filename)
+
+    def release(self, kind: str, filename: str):
+        pass
+
+    def exists(self, kind: str, filename: str) -> bool:
+        return (self.roots[kind] / filename).is_file()
+
+    def size(self, kind: str, filename: str) -> int:
+        path = self.roots[kind] / filename
+        return path.stat().st_size if path.is_file() else 0
+
+    def delete(self, kind: str, filename: str) -> int:
+        path = self.roots[kind] / check_name(filename)
+        try:
+            freed = path.stat().st_size
+            path.unlink()
+            return freed
+        except FileNotFoundError:
+            return 0
+
+    def list(self, kind: str) -> List[Tuple[str, float, int]]:
+        """(filename, mtime, bytes) of every stored file of a kind"""
+        root = self.roots[kind]
+        if not root.exists():
+            return []
+        files = []
+        for path in root.iterdir():
+            if path.is_file():
+                stat = path.stat()
+                files.append((path.name, stat.st_mtime, stat.st_size))
+        return files
+
+    def url(self, kind: str, filename: str) -> Optional[str]:
+        """Direct download URL, or None to serve through MediaDelivery"""
+        return None
+
+    def describe(self) -> dict:
+        return {"backend": "local"}
+
+
+class ReadThroughCache:
+    """Local copies of stored files, bounded in bytes, least recently used evicted first"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._pins: Counter = Counter()
+        self._loading: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Pick up what a previous process left, oldest access first
+        existing = [p for p in root.glob("*/*") if p.is_file() and not p.name.startswith(".")] if root.exists() else []
+        for path in sorted(existing, key=lambda p: p.stat().st_atime):
+            self._entries[(path.parent.name, path.name)] = path.stat().st_size
+            self.total_bytes += path.stat().st_size
+
+    def path(self, kind: str, filename: str) -> Path:
+        return self.root / kind / filename
+
+    def _add(self, key: Tuple[str, str], size: int, pin: bool):
+        """Lock held"""
+        if key in self._entries:
+            self.total_bytes -= self._entries[key]
+        self._entries[key] = size
+        self._entries.move_to_end(key)
+        self.total_bytes += size
+        if pin:
+            self._pins[key] += 1
+        self._evict()
+
+    def _evict(self):
+        """Lock held"""
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self._pins[key]:
+                continue
+            self.total_bytes -= self._entries.pop(key)
+            self.path(*key).unlink(missing_ok=True)
+
+    def adopt(self, kind: str, filename: str, source: Path) -> Path:
+        """Move a freshly written file into the cache (the node that made it will likely read it next)"""
+        dest = self.path(kind, filename)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(source), dest)
+        with self._lock:
+            self._add((kind, filename), dest.stat().st_size, pin=False)
+        return dest
+
+    def checkout(self, kind: str, filename: str, fetch: Callable[[Path], bool]) -> Optional[Path]:
+        """Local path of the file, fetching it on a miss; None when fetch finds nothing. Pair with release()"""
+        key = (kind, filename)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._pins[key] += 1
+                self.hits += 1
+                return self.path(*key)
+            loader = self._loading.setdefault(key, threading.Lock())
+
+        # One download per file; concurrent checkouts wait for it
+        with loader:
+            with self._lock:
+                if key in self._entries:
+                    self._pins[key] += 1
+                    self.hits += 1
+                    return self.path(*key)
+            dest = self.path(*key)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            partial = dest.with_name(f".{filename}.{uuid.uuid4().hex}.part")
+            found = False
+            try:
+                found = fetch(partial)
+                if found:
+                    os.replace(partial, dest)
+            finally:
+                partial.unlink(missing_ok=True)
+                with self._lock:
+                    if found:
+                        self.misses += 1
+                        self._add(key, dest.stat().st_size, pin=True)
+                    self._loading.pop(key, None)
+            return dest if found else None
+
+    def release(self, kind: str, filename: str):
+        key = (kind, filename)
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                del self._pins[key]
+            self._evict()
+
+    def discard(self, kind: str, filename: str):
+        """Drop a deleted file (readers that already opened it keep their handle)"""
+        key = (kind, filename)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)
+            self.path(*key).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "checked_out": len(self._pins),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class S3Storage:
+    """Files in an S3-compatible bucket, with a local read-through cache for ffmpeg inputs"""
+
+    def __init__(
+        self,
+        bucket: str,
+        cache: ReadThroughCache,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        url_ttl: int = 300,
+        multipart_chunk_mb: int = 8,
+        max_concurrency: int = 8,
+    ):
+        self.bucket = bucket
+        self.cache = cache
+        self.prefix = prefix
+        self.url_ttl = url_ttl
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.multipart_chunk_mb = multipart_chunk_mb
+        self.max_concurrency = max_concurrency
+        self._client = None
+        self._transfer = None
+        self._connect_lock = threading.Lock()
+
+    def connect(self):
+        """Import boto3 and build the client; every operation calls this, the API calls it once at startup"""
+        with self._connect_lock:
+            if self._client is not None:
+                return
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+
+            # Files over one chunk go up and down as multipart transfers, max_concurrency parts at a time
+            chunk = self.multipart_chunk_mb * MIB
+            self._transfer = TransferConfig(
+                multipart_threshold=chunk, multipart_chunksize=chunk, max_concurrency=self.max_concurrency, use_threads=True
+            )
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                config=Config(
+                    signature_version="s3v4",
+                    # Path-style addressing for MinIO and other self-hosted endpoints
+                    s3={"addressing_style": "path" if self.endpoint_url else "auto"},
+                    max_pool_connections=max(10, self.max_concurrency * 2),
+                ),
+            )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.connect()
+        return self._client
+
+    @property
+    def transfer(self):
+        if self._transfer is None:
+            self.connect()
+        return self._transfer
+
+    def key(self, kind: str, filename: str) -> str:
+        return f"{self.prefix}{kind}/{check_name(filename)}"
+
+    @staticmethod
+    def _not_found(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def save(self, kind: str, filename: str, source: Path) -> Path:
+        self.client.upload_file(
+            str(source), self.bucket, self.key(kind, filename),
+            ExtraArgs={"ContentType": content_type(filename)}, Config=self.transfer,
+        )
+        return self.cache.adopt(kind, filename, Path(source))
+
+    def _download(self, kind: str, filename: str, dest: Path) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.download_file(self.bucket, self.key(kind, filename), str(dest), Config=self.transfer)
+        except ClientError as e:
+            if self._not_found(e):
+                return False
+            raise
+        return True
+
+    def checkout(self, kind: str, filename: str) -> Optional[Path]:
+        try:
+            check_name(filename)
+        except ValueError:
+            return None
+        return self.cache.checkout(kind, filename, lambda dest: self._download(kind, filename, dest))
+
+    def release(self, kind: str, filename: str):
+        self.cache.release(kind, filename)
+
+    def _head(self, kind: str, filename: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(kind, filename))
+        except ClientError as e:
+            if self._not_found(e):
+                return None
+            raise
+
+    def exists(self, kind: str, filename: str) -> bool:
+        return self._head(kind, filename) is not None
+
+    def size(self, kind: str, filename: str) -> int:
+        head = self._head(kind, filename)
+        return int(head["ContentLength"]) if head else 0
+
+    def delete(self, kind: str, filename: str) -> int:
+        freed = self.size(kind, filename)
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(kind, filename))
+        self.cache.discard(kind, filename)
+        return freed
+
+    def list(self, kind: str) -> List[Tuple[str, float, int]]:
+        prefix = f"{self.prefix}{kind}/"
+        files = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                files.append((obj["Key"][len(prefix):], obj["LastModified"].timestamp(), obj["Size"]))
+        return files
+
+    def url(self, kind: str, filename: str) -> Optional[str]:
+        """Pre-signed GET, valid for url_ttl seconds (signing is local, no request to the server)"""
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.key(kind, filename), "ResponseContentType": content_type(filename)},
+            ExpiresIn=self.url_ttl,
+        )
+
+    def describe(self) -> dict:
+        return {"backend": "s3", "bucket": self.bucket, "prefix": self.prefix, "cache": self.cache.stats()}
@@ -0,0 +1,324 @@
+"""Lifecycle of uploaded and rendered files: ownership, quotas and cleanup.
+
+Every stored upload and render (in whichever storage backend, see
+storage_backends.py) has a record in the files collection, keyed ``"<kind>/<filename>"`` (kinds as in the media URLs:
+``videos`` for uploads, ``outputs`` for renders):
+
+- an upload starts unowned and expires after the retention period unless a
+  library item made from it (its ``video_url``) claims it; when the last such
+  item is deleted it gets a fresh retention period
+- an output belongs to the library item whose ``output_url`` names it and is
+  deleted, with its HLS ladder and thumbnails, together with that item
+
+A periodic sweep deletes expired uploads, stored files with no record (failed
+or abandoned renders; files a library item still references are adopted
+instead), local HLS and thumbnail directories whose source is gone, and
+records whose file is gone. It lists each kind once, works in batches and
+does the storage I/O off the event loop. Usage per user is the sum of their records' sizes, capped per plan.
+"""
+import asyncio
+import logging
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("videos", "outputs")
+URL_PREFIXES = {"videos": "/api/videos/", "outputs": "/api/outputs/"}
+
+GIB = 1024 ** 3
+PLAN_QUOTAS: Dict[str, int] = {"free": 2 * GIB, "pro": 50 * GIB}
+DEFAULT_PLAN = "free"
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, used: int, quota: int):
+        super().__init__(f"Storage quota exceeded ({used} of {quota} bytes)")
+        self.used = used
+        self.quota = quota
+
+
+def file_id(kind: str, filename: str) -> str:
+    return f"{kind}/{filename}"
+
+
+def url_file(url: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(kind, filename) for an /api/videos/ or /api/outputs/ URL"""
+    for kind, prefix in URL_PREFIXES.items():
+        if url and url.startswith(prefix):
+            return kind, url[len(prefix):]
+    return None
+
+
+def remove_path(path: Path) -> int:
+    """Delete a file or directory tree; returns the bytes freed"""
+    try:
+        if path.is_dir():
+            freed = sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+            shutil.rmtree(path, ignore_errors=True)
+            return freed
+        freed = path.stat().st_size
+        path.unlink()
+        return freed
+    except FileNotFoundError:
+        return 0
+
+
+def directory_bytes(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class StorageManager:
+    def __init__(
+        self,
+        files,
+        content,
+        backend,
+        hls_dir: Path,
+        thumbnail_dir: Path,
+        upload_retention: timedelta = timedelta(hours=24),
+        orphan_grace: timedelta = timedelta(hours=1),
+        batch_size: int = 200,
+        quotas: Dict[str, int] = PLAN_QUOTAS,
+        in_flight: Optional[Callable[[List[str]], Awaitable[Set[str]]]] = None,
+    ):
+        self.files = files
+        self.content = content
+        self.backend = backend
+        self.hls_dir = hls_dir
+        self.thumbnail_dir = thumbnail_dir
+        self.upload_retention = upload_retention
+        self.orphan_grace = orphan_grace
+        self.batch_size = batch_size
+        self.quotas = quotas
+        # Which of these filenames an ffmpeg process (here or on a render worker) is still writing;
+        # those are never orphans
+        self.in_flight = in_flight
+        self.last_sweep: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        await self.files.create_index("user_id")
+        await self.files.create_index("expires_at", sparse=True)
+
+    # ---- ownership ----
+
+    async def register(self, kind: str, filename: str, user_id: str, content_id: Optional[str] = None):
+        """Record a file; unowned uploads expire after the retention period"""
+        size = await asyncio.get_running_loop().run_in_executor(None, self.backend.size, kind, filename)
+        now = datetime.now(timezone.utc)
+        expires_at = now + self.upload_retention if kind == "videos" and not content_id else None
+        await self.files.update_one(
+            {"_id": file_id(kind, filename)},
+            {
+                "$set": {"kind": kind, "filename": filename, "user_id": user_id, "bytes": size, "expires_at": expires_at},
+                "$setOnInsert": {"created_at": now},
+                "$addToSet": {"content_ids": {"$each": [content_id] if content_id else []}},
+            },
+            upsert=True,
+        )
+
+    async def attach(self, content_doc: dict):
+        """Claim the files a new library item points at"""
+        for url in (content_doc.get("output_url"), content_doc.get("video_url")):
+            located = url_file(url)
+            if located:
+                await self.register(*located, content_doc["user_id"], content_doc["id"])
+
+    async def release(self, content_doc: dict) -> int:
+        """Delete a removed library item's outputs now; its upload gets a fresh retention period once unowned"""
+        freed = 0
+        located = url_file(content_doc.get("output_url"))
+        if located and located[0] == "outputs":
+            freed += await self.delete_files([located])
+        located = url_file(content_doc.get("video_url"))
+        if located and located[0] == "videos":
+            _id = file_id(*located)
+            await self.files.update_one({"_id": _id}, {"$pull": {"content_ids": content_doc["id"]}})
+            await self.files.update_one(
+                {"_id": _id, "content_ids": {"$size": 0}},
+                {"$set": {"expires_at": datetime.now(timezone.utc) + self.upload_retention}},
+            )
+        return freed
+
+    def _derived_paths(self, kind: str, filename: str) -> List[Path]:
+        """Local artifacts made from a stored file"""
+        paths = [self.thumbnail_dir / kind / filename]
+        if kind == "outputs":
+            paths.append(self.hls_dir / Path(filename).stem)
+        return paths
+
+    def _delete_sync(self, located: List[Tuple[str, str]]) -> int:
+        freed = 0
+        for kind, filename in located:
+            freed += self.backend.delete(kind, filename)
+            freed += sum(remove_path(p) for p in self._derived_paths(kind, filename))
+        return freed
+
+    async def delete_files(self, located: Iterable[Tuple[str, str]]) -> int:
+        """Delete stored files with their derived artifacts and records"""
+        located = list(located)
+        if not located:
+            return 0
+        freed = await asyncio.get_running_loop().run_in_executor(None, self._delete_sync, located)
+        await self.files.delete_many({"_id": {"$in": [file_id(*item) for item in located]}})
+        return freed
+
+    # ---- quotas and usage ----
+
+    def quota_for(self, plan: str) -> int:
+        return self.quotas.get(plan, self.quotas[DEFAULT_PLAN])
+
+    async def usage(self, user_id: str) -> dict:
+        totals = {kind: {"files": 0, "bytes": 0} for kind in KINDS}
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$kind", "files": {"$sum": 1}, "bytes": {"$sum": "$bytes"}}},
+        ]
+        async for row in self.files.aggregate(pipeline):
+            totals[row["_id"]] = {"files": row["files"], "bytes": row["bytes"]}
+        return {"used_bytes": sum(t["bytes"] for t in totals.values()), "by_kind": totals}
+
+    async def check_quota(self, user: dict, incoming_bytes: int = 0):
+        """Raise QuotaExceeded when the user's files plus incoming_bytes would pass their plan's quota"""
+        quota = self.quota_for(user.get("plan", DEFAULT_PLAN))
+        used = (await self.usage(user["id"]))["used_bytes"]
+        if used + incoming_bytes > quota:
+            raise QuotaExceeded(used, quota)
+
+    def disk_usage(self) -> dict:
+        """Stored bytes per kind, local derived artifacts and free local disk (blocking; lists the backend)"""
+        stored = {}
+        for kind in KINDS:
+            listing = self.backend.list(kind)
+            stored[kind] = {"files": len(listing), "bytes": sum(size for _, _, size in listing)}
+        disk = shutil.disk_usage(self.thumbnail_dir if self.thumbnail_dir.exists() else Path("."))
+        return {
+            "storage": self.backend.describe(),
+            "stored": stored,
+            "local": {"hls": directory_bytes(self.hls_dir), "thumbnails": directory_bytes(self.thumbnail_dir)},
+            "disk": {"total": disk.total, "used": disk.used, "free": disk.free},
+        }
+
+    # ---- sweeping ----
+
+    async def sweep(self) -> dict:
+        stats = {"expired": 0, "orphans": 0, "adopted": 0, "derived": 0, "dangling": 0, "bytes_freed": 0}
+        loop = asyncio.get_running_loop()
+
+        # Expired uploads, a batch at a time
+        while True:
+            expired = await self.files.find(
+                {"expires_at": {"$lte": datetime.now(timezone.utc)}}, {"kind": 1, "filename": 1}
+            ).to_list(self.batch_size)
+            if not expired:
+                break
+            stats["bytes_freed"] += await self.delete_files((d["kind"], d["filename"]) for d in expired)
+            stats["expired"] += len(expired)
+
+        # One listing per kind serves the orphan, derived and dangling passes
+        cutoff = time.time() - self.orphan_grace.total_seconds()
+        stored = {}
+        for kind in KINDS:
+            listing = await loop.run_in_executor(None, self.backend.list, kind)
+            stored[kind] = {name for name, _, _ in listing}
+            names = sorted(name for name, mtime, _ in listing if mtime < cutoff)
+            for start in range(0, len(names), self.batch_size):
+                batch = names[start:start + self.batch_size]
+                active = await self._in_flight(batch)
+                batch = [n for n in batch if n not in active]
+                freed, orphans, adopted = await self._sweep_untracked(kind, batch)
+                stats["bytes_freed"] += freed
+                stats["orphans"] += orphans
+                stats["adopted"] += adopted
+
+        # HLS ladders and thumbnails whose source file is gone
+        stale = await loop.run_in_executor(None, self._stale_derived, stored, cutoff)
+        stats["derived"] = len(stale)
+        stats["bytes_freed"] += await loop.run_in_executor(None, lambda: sum(remove_path(p) for p in stale))
+
+        # Records whose file is gone; records newer than the grace period may be for files saved after the listing
+        last_id = ""
+        recorded_before = datetime.fromtimestamp(cutoff, timezone.utc)
+        while True:
+            batch = await self.files.find(
+                {"_id": {"$gt": last_id}, "created_at": {"$lt": recorded_before}}, {"kind": 1, "filename": 1}
+            ).sort("_id", 1).to_list(self.batch_size)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            gone = [d for d in batch if d["filename"] not in stored.get(d["kind"], ())]
+            active = await self._in_flight([d["filename"] for d in gone])
+            missing = [d["_id"] for d in gone if d["filename"] not in active]
+            if missing:
+                await self.files.delete_many({"_id": {"$in": missing}})
+                stats["dangling"] += len(missing)
+
+        if any(v for k, v in stats.items() if k != "bytes_freed"):
+            logger.info(f"Storage sweep: {stats}")
+        self.last_sweep = {"finished_at": datetime.now(timezone.utc).isoformat(), **stats}
+        return stats
+
+    async def _in_flight(self, filenames: List[str]) -> Set[str]:
+        if self.in_flight is None or not filenames:
+            return set()
+        return await self.in_flight(filenames)
+
+    async def _sweep_untracked(self, kind: str, names: List[str]) -> Tuple[int, int, int]:
+        """Delete the untracked files among names, adopting those a library item still points at"""
+        if not names:
+            return 0, 0, 0
+        tracked = {
+            d["filename"] for d in await self.files.find(
+                {"_id": {"$in": [file_id(kind, n) for n in names]}}, {"filename": 1}
+            ).to_list(None)
+        }
+        untracked = [n for n in names if n not in tracked]
+        if not untracked:
+            return 0, 0, 0
+        field = "output_url" if kind == "outputs" else "video_url"
+        urls = [URL_PREFIXES[kind] + n for n in untracked]
+        referenced = set()
+        async for doc in self.content.find({field: {"$in": urls}}, {"_id": 0, "id": 1, "user_id": 1, field: 1}):
+            filename = doc[field][len(URL_PREFIXES[kind]):]
+            referenced.add(filename)
+            await self.register(kind, filename, doc["user_id"], doc["id"])
+        orphans = [(kind, n) for n in untracked if n not in referenced]
+        freed = await self.delete_files(orphans)
+        return freed, len(orphans), len(referenced)
+
+    def _stale_derived(self, stored: Dict[str, set], cutoff: float) -> List[Path]:
+        stale = []
+        if self.hls_dir.exists():
+            for ladder in self.hls_dir.iterdir():
+                if ladder.is_dir() and ladder.stat().st_mtime < cutoff and f"{ladder.name}.mp4" not in stored["outputs"]:
+                    stale.append(ladder)
+        for kind in KINDS:
+            thumbnails = self.thumbnail_dir / kind
+            if not thumbnails.exists():
+                continue
+            for entry in thumbnails.iterdir():
+                if entry.is_dir() and entry.stat().st_mtime < cutoff and entry.name not in stored[kind]:
+                    stale.append(entry)
+        return stale
+
+    async def _run(self, interval: float):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float):
+        """Sweep now and then every interval seconds; call from the event loop"""
+        self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,162 @@
+"""In-memory caption subtitles for story renders.
+
+Captions are built as an ASS document in memory and handed to ffmpeg's
+``subtitles`` filter through an anonymous memfd (``/proc/self/fd/N``), so no
+subtitle file is ever written next to the output and nothing is left behind
+when ffmpeg fails or times out. A pipe does not work here: ffmpeg may
+initialise the filter graph more than once and needs to re-open the file.
+
+The per-style look is compiled into ASS ``Style:`` lines once at import.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# Caption look per story style (drawtext-like notation, compiled to ASS below)
+STYLE_FONTS = {
+    "dramatic": "fontsize=48:fontcolor=white:borderw=3:bordercolor=black",
+    "mysterious": "fontsize=44:fontcolor=#E0E0E0:borderw=2:bordercolor=#1a1a1a",
+    "heartwarming": "fontsize=46:fontcolor=#FFF5E6:borderw=2:bordercolor=#8B4513",
+    "suspenseful": "fontsize=50:fontcolor=#FF4444:borderw=3:bordercolor=black",
+    "educational": "fontsize=42:fontcolor=white:borderw=2:bordercolor=#333333"
+}
+
+# Script resolution the style sizes are expressed in; libass scales it to the actual video
+PLAY_RES_X = 540
+PLAY_RES_Y = 960
+MARGIN_V = 150
+FONT_NAME = "Arial"
+
+NAMED_COLORS = {
+    "white": "FFFFFF",
+    "black": "000000",
+    "red": "FF0000",
+    "yellow": "FFFF00",
+}
+
+Cue = Tuple[float, float, str]
+
+
+def ass_color(value: str, alpha: int = 0) -> str:
+    """Convert white / #RRGGBB to ASS &HAABBGGRR"""
+    rgb = NAMED_COLORS.get(value.lower(), value.lstrip("#")).upper()
+    if len(rgb) != 6:
+        rgb = "FFFFFF"
+    return f"&H{alpha:02X}{rgb[4:6]}{rgb[2:4]}{rgb[0:2]}"
+
+
+def parse_style_spec(spec: str) -> dict:
+    return dict(part.split("=", 1) for part in spec.split(":") if "=" in part)
+
+
+def compile_ass_style(name: str, spec: str) -> str:
+    options = parse_style_spec(spec)
+    primary = ass_color(options.get("fontcolor", "white"))
+    # Karaoke words show in the secondary colour until their \k time is reached
+    secondary = ass_color(options.get("fontcolor", "white"), alpha=0x90)
+    outline = ass_color(options.get("bordercolor", "black"))
+    fields = [
+        name, FONT_NAME, options.get("fontsize", "48"),
+        primary, secondary, outline, "&H80000000",
+        "-1", "0", "0", "0",        # Bold, Italic, Underline, StrikeOut
+        "100", "100", "0", "0",     # ScaleX, ScaleY, Spacing, Angle
+        "1", options.get("borderw", "2"), "0",  # BorderStyle, Outline, Shadow
+        "2", "30", "30", str(MARGIN_V), "1",    # Alignment (bottom center), MarginL/R/V, Encoding
+    ]
+    return "Style: " + ",".join(fields)
+
+
+ASS_STYLES = {name: compile_ass_style(name, spec) for name, spec in STYLE_FONTS.items()}
+
+ASS_HEADER = f"""[Script Info]
+ScriptType: v4.00+
+PlayResX: {PLAY_RES_X}
+PlayResY: {PLAY_RES_Y}
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+"""
+
+ASS_EVENTS_HEADER = """
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def escape_ass_text(text: str) -> str:
+    """Make caption text literal for libass: no override blocks, no \\N/\\h escapes"""
+    text = text.replace("\\", "\\\u2060")  # word joiner breaks up \N, \n, \h
+    text = text.replace("{", "\\{").replace("}", "\\}")  # libass literal braces, never an override block
+    text = text.replace("\r\n", "\n").replace("\n", "\\N")
+    return text
+
+
+def format_ass_time(seconds: float) -> str:
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    secs, cs = divmod(rest, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{cs:02d}"
+
+
+def format_srt_time(seconds: float) -> str:
+    milliseconds = int(round(max(seconds, 0) * 1000))
+    hours, rest = divmod(milliseconds, 3600000)
+    minutes, rest = divmod(rest, 60000)
+    secs, ms = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{ms:03d}"
+
+
+def karaoke_text(words: Sequence[Tuple[str, int]]) -> str:
+    """Word-by-word highlight: each word gets a \\k tag with its duration in centiseconds"""
+    return " ".join(f"{{\\k{max(cs, 0)}}}{escape_ass_text(word)}" for word, cs in words)
+
+
+def build_ass(cues: Sequence[Cue], style: str, karaoke: Optional[Sequence[Sequence[Tuple[str, int]]]] = None) -> str:
+    """ASS document for the cues; pass per-cue word timings to render karaoke captions"""
+    style_name = style if style in ASS_STYLES else "dramatic"
+    events: List[str] = []
+    for i, (start, end, text) in enumerate(cues):
+        body = karaoke_text(karaoke[i]) if karaoke is not None else escape_ass_text(text)
+        events.append(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},{style_name},,0,0,0,,{body}")
+    return ASS_HEADER + ASS_STYLES[style_name] + "\n" + ASS_EVENTS_HEADER + "\n".join(events) + "\n"
+
+
+def build_srt(cues: Sequence[Cue]) -> str:
+    blocks = [
+        f"{i}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text}\n"
+        for i, (start, end, text) in enumerate(cues, start=1)
+    ]
+    return "\n".join(blocks)
+
+
+@contextmanager
+def subtitle_file(content: str, suffix: str = ".ass") -> Iterator[Tuple[str, Tuple[int, ...]]]:
+    """Yield (path, pass_fds) for subtitles ffmpeg can open without a file on disk.
+
+    Linux uses an anonymous memfd; elsewhere a temporary file is used and always
+    removed on exit, including when ffmpeg times out.
+    """
+    data = content.encode("utf-8")
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create(f"captions{suffix}")
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            yield f"/proc/self/fd/{fd}", (fd,)
+        finally:
+            os.close(fd)
+        return
+
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with tmp:
+            tmp.write(data)
+        yield tmp.name, ()
+    finally:
+        os.unlink(tmp.name)
@@ -0,0 +1,146 @@
+"""Poster frames and scrub-preview sprite sheets for videos.
+
+Assets are written next to each other in a per-source cache directory:
+
+    <cache_dir>/poster.jpg   single frame, 480px wide
+    <cache_dir>/sprite.jpg   grid of small frames sampled across the video
+    <cache_dir>/sprite.vtt   WebVTT cues pointing at sprite.jpg#xywh=...
+
+Writes go to a temporary name and are renamed into place so a concurrent
+reader never sees a half-written file.
+"""
+import logging
+import math
+import os
+import subprocess
+import uuid
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+POSTER_WIDTH = 480
+SPRITE_THUMB_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_MAX_THUMBS = 100
+SPRITE_MIN_INTERVAL = 1.0
+
+
+def is_fresh(asset_path: Path, source_path: Path) -> bool:
+    """Cached asset exists and is newer than its source"""
+    try:
+        return asset_path.stat().st_mtime >= source_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def format_vtt_time(seconds: float) -> str:
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
+
+
+def sprite_layout(duration: float, width: int, height: int) -> dict:
+    """Interval, grid and thumb size for a sprite covering the whole video"""
+    interval = max(SPRITE_MIN_INTERVAL, duration / SPRITE_MAX_THUMBS) if duration > 0 else SPRITE_MIN_INTERVAL
+    count = max(1, min(SPRITE_MAX_THUMBS, math.ceil(duration / interval))) if duration > 0 else 1
+    columns = min(SPRITE_COLUMNS, count)
+    rows = math.ceil(count / columns)
+    thumb_width = SPRITE_THUMB_WIDTH
+    thumb_height = even(thumb_width * height / width) if width and height else even(thumb_width * 16 / 9)
+    return {
+        "interval": interval,
+        "count": count,
+        "columns": columns,
+        "rows": rows,
+        "thumb_width": thumb_width,
+        "thumb_height": thumb_height,
+    }
+
+
+def build_sprite_vtt(layout: dict, duration: float, sprite_name: str = "sprite.jpg") -> str:
+    lines = ["WEBVTT", ""]
+    for i in range(layout["count"]):
+        start = i * layout["interval"]
+        end = min((i + 1) * layout["interval"], duration) if duration > 0 else start + layout["interval"]
+        if end <= start:
+            break
+        x = (i % layout["columns"]) * layout["thumb_width"]
+        y = (i // layout["columns"]) * layout["thumb_height"]
+        lines.append(f"{format_vtt_time(start)} --> {format_vtt_time(end)}")
+        lines.append(f"{sprite_name}#xywh={x},{y},{layout['thumb_width']},{layout['thumb_height']}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def run_ffmpeg_to(path: Path, cmd_before_output: list, timeout: Optional[float] = None) -> bool:
+    tmp_path = path.with_name(f".{path.stem}.{uuid.uuid4().hex[:8]}.tmp{path.suffix}")
+    try:
+        result = subprocess.run([*cmd_before_output, str(tmp_path)], capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f"Thumbnail generation timed out for {path}")
+        tmp_path.unlink(missing_ok=True)
+        return False
+    if result.returncode != 0 or not tmp_path.exists():
+        logger.error(f"Thumbnail generation error: {result.stderr}")
+        tmp_path.unlink(missing_ok=True)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+def generate_poster(source_path: Path, cache_dir: Path, duration: float, timeout: Optional[float] = 60) -> bool:
+    """Extract a poster frame a little way in, past fade-ins and black intro frames"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    at = min(duration * 0.1, 3.0) if duration > 0 else 0
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-ss', f"{at:.3f}",
+        '-i', str(source_path),
+        '-frames:v', '1',
+        '-vf', f"scale={POSTER_WIDTH}:-2",
+        '-q:v', '4',
+    ]
+    return run_ffmpeg_to(cache_dir / "poster.jpg", cmd, timeout)
+
+
+def generate_sprite(
+    source_path: Path,
+    cache_dir: Path,
+    duration: float,
+    width: int,
+    height: int,
+    timeout: Optional[float] = 300,
+) -> bool:
+    """Render the sprite sheet in one low-resolution decode pass, then its WebVTT index"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    layout = sprite_layout(duration, width, height)
+    vf = (
+        f"fps=1/{layout['interval']:.4f},"
+        f"scale={layout['thumb_width']}:{layout['thumb_height']},"
+        f"tile={layout['columns']}x{layout['rows']}"
+    )
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', str(source_path),
+        '-an',
+        '-vf', vf,
+        '-frames:v', '1',
+        '-q:v', '5',
+    ]
+    if not run_ffmpeg_to(cache_dir / "sprite.jpg", cmd, timeout):
+        return False
+
+    vtt_path = cache_dir / "sprite.vtt"
+    tmp_path = cache_dir / f".sprite.{uuid.uuid4().hex[:8]}.tmp.vtt"
+    try:
+        tmp_path.write_text(build_sprite_vtt(layout, duration))
+        os.replace(tmp_path, vtt_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return True
@@ -0,0 +1,162 @@
+"""Local speech-to-text for uploaded videos.
+
+ffmpeg decodes the upload's audio track to 16 kHz mono PCM on stdout. The
+stream is cut into ~30 s chunks at the quietest point near each boundary (so
+words are not split) and every chunk is submitted to a process pool as soon
+as it has been read, so decoding and recognition overlap and long uploads
+are transcribed in parallel. Each worker process loads the speech model once.
+
+The model is faster-whisper (CTranslate2, int8 on CPU), an optional
+dependency: ``pip install faster-whisper``.
+"""
+import importlib.util
+import logging
+import subprocess
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30.0
+# Look this far back from a chunk boundary for a quiet place to cut
+CUT_SEARCH_SECONDS = 2.0
+CUT_FRAME_SECONDS = 0.02
+
+_worker_model = None
+
+
+class TranscriptionUnavailable(Exception):
+    pass
+
+
+def _init_worker(model_size: str, cpu_threads: int):
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(model_size, device="cpu", compute_type="int8", cpu_threads=cpu_threads)
+
+
+def _transcribe_chunk(audio: np.ndarray, offset: float, language: Optional[str]) -> dict:
+    segments, info = _worker_model.transcribe(audio, language=language, beam_size=1, vad_filter=True)
+    return {
+        "language": info.language,
+        "segments": [
+            {"start": round(offset + seg.start, 2), "end": round(offset + seg.end, 2), "text": seg.text.strip()}
+            for seg in segments
+        ],
+    }
+
+
+def quiet_cut_index(samples: np.ndarray, target: int) -> int:
+    """Sample index at or before target where the audio is quietest within the search window"""
+    frame = int(CUT_FRAME_SECONDS * SAMPLE_RATE)
+    start = max(target - int(CUT_SEARCH_SECONDS * SAMPLE_RATE), 0)
+    window = samples[start:target]
+    n_frames = len(window) // frame
+    if n_frames == 0:
+        return target
+    energy = np.square(window[: n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    return start + int(np.argmin(energy)) * frame
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+
+class Transcriber:
+    """Process-pool transcriber; the pool and models are created on first use"""
+
+    def __init__(self, model_size: str = "base", workers: int = 2, cpu_threads: int = 2):
+        self.model_size = model_size
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def available(self) -> bool:
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_size, self.cpu_threads),
+            )
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def transcribe_file(self, input_path: str, language: Optional[str] = None) -> dict:
+        """Transcribe a media file's audio; returns timestamped segments and the real-time factor"""
+        if not self.available():
+            raise TranscriptionUnavailable("faster-whisper is not installed")
+
+        started = time.perf_counter()
+        cmd = [
+            'ffmpeg', '-v', 'error', '-nostdin',
+            '-i', input_path,
+            '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE),
+            '-f', 's16le', '-'
+        ]
+        # stderr goes to a file: a pipe nobody reads until stdout ends can fill up and stall ffmpeg
+        errors = tempfile.TemporaryFile()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+
+        chunk_samples = int(CHUNK_SECONDS * SAMPLE_RATE)
+        read_bytes = chunk_samples * 2
+        futures: List[Future] = []
+        buffer = np.zeros(0, dtype=np.float32)
+        offset_samples = 0
+        try:
+            while True:
+                data = proc.stdout.read(read_bytes)
+                if data:
+                    pcm = np.frombuffer(data[: len(data) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0
+                    buffer = np.concatenate((buffer, pcm))
+                while len(buffer) >= chunk_samples + int(CUT_SEARCH_SECONDS * SAMPLE_RATE) or (not data and len(buffer)):
+                    cut = quiet_cut_index(buffer, chunk_samples) if len(buffer) > chunk_samples else len(buffer)
+                    cut = cut or len(buffer)
+                    futures.append(self.pool.submit(_transcribe_chunk, buffer[:cut], offset_samples / SAMPLE_RATE, language))
+                    offset_samples += cut
+                    buffer = buffer[cut:]
+                if not data:
+                    break
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            errors.seek(0)
+            stderr = errors.read().decode("utf-8", "replace")
+            errors.close()
+
+        if proc.returncode != 0 and offset_samples == 0:
+            raise RuntimeError(f"Audio extraction failed: {stderr.strip()}")
+
+        segments = []
+        detected_language = language
+        for future in futures:
+            result = future.result()
+            segments.extend(result["segments"])
+            detected_language = detected_language or result["language"]
+
+        audio_seconds = offset_samples / SAMPLE_RATE
+        elapsed = time.perf_counter() - started
+        rtf = elapsed / audio_seconds if audio_seconds else 0.0
+        logger.info(f"Transcribed {audio_seconds:.1f}s of audio in {elapsed:.1f}s (RTF {rtf:.2f}, {len(futures)} chunks)")
+        return {
+            "segments": segments,
+            "language": detected_language,
+            "audio_seconds": round(audio_seconds, 2),
+            "processing_seconds": round(elapsed, 2),
+            "real_time_factor": round(rtf, 3),
+            "text": "\n".join(f"[{format_timestamp(s['start'])}] {s['text']}" for s in segments),
+        }
@@ -0,0 +1,176 @@
+"""Text-to-speech narration for story videos.
+
+Engines are pluggable; the default is espeak-ng, which runs fully offline.
+Every line is synthesized to its own WAV and cached by a hash of
+(engine, voice, text), so re-renders and retries never synthesize twice.
+The narration track is the cached lines joined with silence for [BEAT]
+pauses, and the measured line durations drive caption timing.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import uuid
+import wave
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+VOICE_PATTERN = re.compile(r"^[A-Za-z0-9_+.-]{1,40}$")
+
+
+class TTSError(Exception):
+    pass
+
+
+class TTSEngine:
+    """Base class: synthesize one line of text to a WAV file"""
+
+    name = "base"
+
+    def __init__(self, default_voice: str):
+        self.default_voice = default_voice
+
+    def available(self) -> bool:
+        raise NotImplementedError
+
+    def resolve_voice(self, voice: Optional[str]) -> str:
+        """Requested voice if it is a plain voice name, else the engine default"""
+        if voice and VOICE_PATTERN.match(voice):
+            return voice
+        return self.default_voice
+
+    def synthesize(self, text: str, voice: str, out_path: Path) -> None:
+        raise NotImplementedError
+
+
+class EspeakEngine(TTSEngine):
+    """espeak-ng (or legacy espeak) command-line synthesizer"""
+
+    name = "espeak"
+
+    def __init__(self, default_voice: str = "en-us", words_per_minute: int = 165):
+        super().__init__(default_voice)
+        self.words_per_minute = words_per_minute
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self) -> bool:
+        return self.binary is not None
+
+    def synthesize(self, text: str, voice: str, out_path: Path) -> None:
+        cmd = [self.binary, "-v", voice, "-s", str(self.words_per_minute), "-w", str(out_path), "--", text]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        except subprocess.TimeoutExpired:
+            raise TTSError("espeak timed out")
+        if result.returncode != 0:
+            raise TTSError(f"espeak failed: {result.stderr.strip()}")
+
+
+class PiperEngine(TTSEngine):
+    """Piper neural TTS; the voice is the path to a local .onnx model"""
+
+    name = "piper"
+
+    def __init__(self, default_voice: str = ""):
+        super().__init__(default_voice)
+        self.binary = shutil.which("piper")
+
+    def available(self) -> bool:
+        return self.binary is not None and bool(self.default_voice)
+
+    def resolve_voice(self, voice: Optional[str]) -> str:
+        # Voices are model paths; only the configured model is ever used
+        return self.default_voice
+
+    def synthesize(self, text: str, voice: str, out_path: Path) -> None:
+        cmd = [self.binary, "--model", voice, "--output_file", str(out_path)]
+        try:
+            result = subprocess.run(cmd, input=text, capture_output=True, text=True, timeout=120)
+        except subprocess.TimeoutExpired:
+            raise TTSError("piper timed out")
+        if result.returncode != 0:
+            raise TTSError(f"piper failed: {result.stderr.strip()}")
+
+
+TTS_ENGINES: Dict[str, Type[TTSEngine]] = {
+    "espeak": EspeakEngine,
+    "piper": PiperEngine,
+}
+
+
+def get_engine(name: str, default_voice: Optional[str] = None) -> TTSEngine:
+    if name not in TTS_ENGINES:
+        raise ValueError(f"Unknown TTS engine '{name}'. Choose from: {', '.join(TTS_ENGINES)}")
+    engine_cls = TTS_ENGINES[name]
+    return engine_cls(default_voice) if default_voice else engine_cls()
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def wav_duration(path: Path) -> float:
+    with wave.open(str(path), "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+
+def synthesize_line(engine: TTSEngine, text: str, voice: str, cache_dir: Path) -> Path:
+    """Cached WAV for one line"""
+    path = cache_dir / f"{cache_key(engine.name, voice, text)}.wav"
+    if path.exists():
+        return path
+    tmp_path = path.with_name(f".{path.stem}.{uuid.uuid4().hex[:8]}.tmp.wav")
+    try:
+        engine.synthesize(text, voice, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
+
+
+def synthesize_narration(
+    engine: TTSEngine,
+    lines: Sequence[str],
+    pauses_after: Sequence[float],
+    cache_dir: Path,
+    voice: Optional[str] = None,
+) -> Tuple[Path, List[float]]:
+    """Narration WAV for all lines with silence after each, plus each line's spoken duration"""
+    if not lines:
+        raise TTSError("Nothing to narrate")
+    if not engine.available():
+        raise TTSError(f"TTS engine '{engine.name}' is not installed")
+    voice = engine.resolve_voice(voice)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    line_paths = [synthesize_line(engine, text, voice, cache_dir) for text in lines]
+    durations = [wav_duration(p) for p in line_paths]
+
+    track_key = cache_key(engine.name, voice, *lines, *(f"{p:.3f}" for p in pauses_after))
+    track_path = cache_dir / f"narration_{track_key}.wav"
+    if track_path.exists():
+        return track_path, durations
+
+    tmp_path = track_path.with_name(f".{track_path.stem}.{uuid.uuid4().hex[:8]}.tmp.wav")
+    try:
+        params = None
+        with wave.open(str(tmp_path), "wb") as out:
+            for line_path, pause in zip(line_paths, pauses_after):
+                with wave.open(str(line_path), "rb") as w:
+                    if params is None:
+                        params = w.getparams()
+                        out.setparams(params)
+                    elif w.getparams()[:3] != params[:3]:
+                        raise TTSError("Narration lines have mismatched audio formats")
+                    out.writeframes(w.readframes(w.getnframes()))
+                silence_frames = int(round(pause * params.framerate))
+                out.writeframes(b"\0" * silence_frames * params.nchannels * params.sampwidth)
+        os.replace(tmp_path, track_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return track_path, durations
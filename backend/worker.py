@@ -0,0 +1,58 @@
+"""Standalone render worker: drains clip, story and split-screen jobs from the Mongo queue.
+
+Run the API with ``RENDER_MODE=queue`` and start as many workers as there
+are encode slots to fill, on this machine or others. They read the same
+environment as the API (MONGO_URL, DB_NAME, storage backend and render
+settings). Workers on other machines need ``STORAGE_BACKEND=s3``, because
+uploads and renders must be reachable from every node.
+
+    cd backend && python worker.py --concurrency 2
+
+SIGINT/SIGTERM stop claiming; jobs in hand finish first. A worker that
+dies mid-job loses its lease and another worker retries the job (see
+job_queue.py).
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from job_queue import JobWorker
+
+logger = logging.getLogger("worker")
+
+
+async def main(args):
+    # Imported here so --help works without a configured environment
+    import server
+
+    await server.job_queue.ensure_indexes()
+    handlers = {kind: server.job_handler(render) for kind, render in server.RENDER_JOBS.items()}
+    if args.kinds:
+        handlers = {kind: handlers[kind] for kind in args.kinds}
+    worker = JobWorker(
+        server.job_queue,
+        handlers,
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        worker_id=args.worker_id
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        server.highlight_analyzer.shutdown()
+        server.client.close()
+        logger.info(f"Worker {worker.worker_id} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs run at once")
+    parser.add_argument("--kinds", nargs="+", choices=["clip", "story", "split_screen"], help="only these job kinds")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between claims when idle")
+    parser.add_argument("--worker-id", help="defaults to host:pid:random")
+    args = parser.parse_args()
+    asyncio.run(main(args))
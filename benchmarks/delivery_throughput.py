@@ -0,0 +1,180 @@
+"""Compare video delivery throughput: in-process FileResponse vs. sendfile offload.
+
+Starts the API-side delivery app under uvicorn (and media_server.py for the
+sendfile mode) on localhost, drives them with a concurrent aiohttp load
+generator and reports throughput plus server CPU seconds per GB delivered.
+
+    python benchmarks/delivery_throughput.py --size-mb 64 --concurrency 16 --duration 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+SIGNING_KEY = "benchmark-signing-key"
+
+
+def serve_api(port: int, media_dir: str, mode: str, media_port: int):
+    """Minimal API exposing /api/outputs/{filename} through MediaDelivery"""
+    import uvicorn
+    from fastapi import FastAPI
+    from delivery import MediaDelivery
+
+    delivery = MediaDelivery(
+        roots={"outputs": Path(media_dir)},
+        mode=mode,
+        sendfile_base_url=f"http://127.0.0.1:{media_port}",
+        signing_key=SIGNING_KEY,
+    )
+    app = FastAPI()
+
+    @app.get("/api/outputs/{filename}")
+    async def serve_output(filename: str):
+        return delivery.response("outputs", filename)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve_media(port: int, media_dir: str):
+    os.environ["MEDIA_SIGNING_KEY"] = SIGNING_KEY
+    import media_server
+    from aiohttp import web
+
+    media_server.SIGNING_KEY = SIGNING_KEY.encode("utf-8")
+    web.run_app(media_server.create_app({"outputs": Path(media_dir)}), host="127.0.0.1", port=port, print=None)
+
+
+def cpu_seconds(pid: int) -> float:
+    """utime + stime of a process from /proc (Linux only)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def load(url: str, concurrency: int, duration: float) -> dict:
+    import aiohttp
+
+    total_bytes = 0
+    requests_done = 0
+    errors = 0
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    async def worker(session):
+        nonlocal total_bytes, requests_done, errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as resp:
+                    if resp.status != 200:
+                        errors += 1
+                        continue
+                    async for chunk in resp.content.iter_chunked(1024 * 1024):
+                        total_bytes += len(chunk)
+                requests_done += 1
+                latencies.append(time.perf_counter() - started)
+            except aiohttp.ClientError:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests_done,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_mb_s": round(total_bytes / elapsed / 1e6, 1),
+        "requests_per_s": round(requests_done / elapsed, 2),
+        "p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+        "p99_s": round(latencies[int(len(latencies) * 0.99) - 1], 3) if latencies else None,
+        "bytes": total_bytes,
+    }
+
+
+async def run_mode(mode: str, media_dir: str, filename: str, args) -> dict:
+    script = str(Path(__file__).resolve())
+    procs = [subprocess.Popen([sys.executable, script, "--serve-api", mode, "--media-dir", media_dir,
+                               "--api-port", str(args.api_port), "--media-port", str(args.media_port)])]
+    if mode == "sendfile":
+        procs.append(subprocess.Popen([sys.executable, script, "--serve-media", "--media-dir", media_dir,
+                                       "--media-port", str(args.media_port)]))
+    try:
+        await wait_for_port(args.api_port)
+        if mode == "sendfile":
+            await wait_for_port(args.media_port)
+        cpu_before = sum(cpu_seconds(p.pid) for p in procs)
+        result = await load(f"http://127.0.0.1:{args.api_port}/api/outputs/{filename}", args.concurrency, args.duration)
+        cpu_used = sum(cpu_seconds(p.pid) for p in procs) - cpu_before
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+    result["mode"] = mode
+    result["server_cpu_s"] = round(cpu_used, 2)
+    result["server_cpu_s_per_gb"] = round(cpu_used / (result["bytes"] / 1e9), 2) if result["bytes"] else None
+    return result
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as media_dir:
+        filename = "bench_clip.mp4"
+        with open(os.path.join(media_dir, filename), "wb") as f:
+            f.write(os.urandom(args.size_mb * 1024 * 1024))
+
+        results = []
+        for mode in args.modes:
+            result = await run_mode(mode, media_dir, filename, args)
+            results.append(result)
+            print(f"{mode:>10}: {result['throughput_mb_s']:>8} MB/s  {result['requests_per_s']:>7} req/s  "
+                  f"p99 {result['p99_s']}s  server CPU {result['server_cpu_s_per_gb']} s/GB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--modes", nargs="+", default=["stream", "sendfile"], choices=["stream", "sendfile"])
+    parser.add_argument("--api-port", type=int, default=18001)
+    parser.add_argument("--media-port", type=int, default=18002)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--serve-api", metavar="MODE", help=argparse.SUPPRESS)
+    parser.add_argument("--serve-media", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--media-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_api:
+        serve_api(args.api_port, args.media_dir, args.serve_api, args.media_port)
+    elif args.serve_media:
+        serve_media(args.media_port, args.media_dir)
+    else:
+        asyncio.run(main(args))
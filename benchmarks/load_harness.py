@@ -0,0 +1,281 @@
+"""API load harness: concurrent user journeys against the real app.
+
+Boots ``server:app`` under uvicorn in a background thread with the fake LLM
+backend (``LLM_BACKEND=fake``) and either an in-memory Mongo stand-in
+(mongomock-motor, the default) or a real mongod (``--mongo-url``), then runs
+--users virtual users concurrently over HTTP. Each user registers, then
+repeats upload -> clip -> library --iterations times.
+
+Per endpoint it reports request and error counts, throughput, p50/p95/p99/max
+latency, and the worst event-loop lag observed while requests to that
+endpoint were in flight. Lag is sampled on the server's own loop, so a
+synchronous ffprobe or bcrypt call in a handler shows up next to the
+endpoint that made it.
+
+    python benchmarks/load_harness.py --users 20 --iterations 2
+    python benchmarks/load_harness.py --mongo-url mongodb://localhost:27017 --users 50 --json load.json
+
+Rate limits are disabled unless --rate-limits is given; files and the test
+database created by the run are removed at the end.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+LAG_INTERVAL = 0.01
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile; q in [0, 100]"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def make_upload(path: Path, duration: int):
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-shortest", str(path),
+    ], check=True)
+
+
+class AppServer:
+    """uvicorn on its own thread and event loop, with a loop-lag sampler beside the app"""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        # (timestamp, lag seconds) on the perf_counter clock
+        self.lag_samples = []
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name="load-harness-server", daemon=True)
+
+    async def _sample_lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            now = time.perf_counter()
+            self.lag_samples.append((now, max(now - started - LAG_INTERVAL, 0.0)))
+
+    async def _serve(self):
+        sampler = asyncio.get_running_loop().create_task(self._sample_lag())
+        try:
+            await self.server.serve()
+        finally:
+            sampler.cancel()
+
+    def start(self, timeout: float = 30):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("API server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+class Recorder:
+    def __init__(self):
+        # endpoint -> list of (start, end, status)
+        self.requests = defaultdict(list)
+        self.created_uploads = set()
+        self.created_outputs = set()
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, "error"
+        self.requests[endpoint].append((started, time.perf_counter(), status))
+        return response
+
+
+async def journey(recorder: Recorder, client: httpx.AsyncClient, upload: bytes, args):
+    email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+    response = await recorder.call(
+        client, "POST /api/auth/register", "POST", "/api/auth/register",
+        json={"email": email, "password": "load-test-password", "name": "Load Test"},
+    )
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for _ in range(args.iterations):
+        response = await recorder.call(
+            client, "POST /api/upload/video", "POST", "/api/upload/video",
+            headers=headers, files={"file": ("load.mp4", upload, "video/mp4")},
+        )
+        if response is None or response.status_code != 200:
+            continue
+        video = response.json()
+        recorder.created_uploads.add(video["filename"])
+
+        response = await recorder.call(
+            client, "POST /api/generate/video-clip", "POST", "/api/generate/video-clip",
+            headers=headers,
+            data={
+                "video_id": video["id"], "video_filename": video["filename"],
+                "aspect_ratio": args.aspect_ratio, "target_duration": str(args.clip_duration),
+            },
+        )
+        if response is not None and response.status_code == 200:
+            output_url = response.json().get("output_url") or ""
+            if output_url.startswith("/api/outputs/"):
+                recorder.created_outputs.add(output_url[len("/api/outputs/"):])
+
+        await recorder.call(client, "GET /api/library", "GET", "/api/library", headers=headers)
+
+
+async def run_load(base_url: str, upload: bytes, args) -> tuple:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+
+        async def delayed(i):
+            if args.ramp:
+                await asyncio.sleep(args.ramp * i / args.users)
+            await journey(recorder, client, upload, args)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(delayed(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def summarize(recorder: Recorder, lag_samples, elapsed: float) -> dict:
+    report = {"elapsed_s": round(elapsed, 3), "endpoints": {}}
+    for endpoint, calls in recorder.requests.items():
+        latencies = [(end - start) * 1000 for start, end, _ in calls]
+        lags = [
+            lag for stamp, lag in lag_samples
+            if any(start <= stamp <= end for start, end, _ in calls)
+        ]
+        statuses = defaultdict(int)
+        for _, _, status in calls:
+            statuses[str(status)] += 1
+        report["endpoints"][endpoint] = {
+            "requests": len(calls),
+            "errors": sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 400),
+            "statuses": dict(statuses),
+            "throughput_rps": round(len(calls) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1),
+            "max_loop_lag_ms": round(max(lags, default=0.0) * 1000, 1),
+        }
+    lags = [lag * 1000 for _, lag in lag_samples]
+    report["event_loop_lag_ms"] = {
+        "p50": round(percentile(lags, 50), 1),
+        "p99": round(percentile(lags, 99), 1),
+        "max": round(max(lags, default=0.0), 1),
+    }
+    return report
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<32} {'reqs':>5} {'err':>4} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'loop lag':>9}")
+    for endpoint, row in report["endpoints"].items():
+        print(
+            f"{endpoint:<32} {row['requests']:>5} {row['errors']:>4} {row['throughput_rps']:>7.2f} "
+            f"{row['p50_ms']:>6.0f}ms {row['p95_ms']:>6.0f}ms {row['p99_ms']:>6.0f}ms {row['max_ms']:>6.0f}ms "
+            f"{row['max_loop_lag_ms']:>7.0f}ms"
+        )
+    lag = report["event_loop_lag_ms"]
+    print(f"event loop lag: p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms "
+          f"over {report['elapsed_s']:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=1, help="upload -> clip -> library rounds per user")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which users start")
+    parser.add_argument("--mongo-url", help="real Mongo to use instead of the in-memory stand-in")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="simulated LLM response time")
+    parser.add_argument("--upload-seconds", type=int, default=30, help="length of the uploaded test video")
+    parser.add_argument("--clip-duration", type=int, default=15)
+    parser.add_argument("--aspect-ratio", default="portrait", choices=["portrait", "landscape"])
+    parser.add_argument("--rate-limits", action="store_true", help="keep per-user rate limits on")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.mongo_url and importlib.util.find_spec("mongomock_motor") is None:
+        sys.exit("In-memory Mongo needs mongomock-motor (pip install mongomock-motor), or pass --mongo-url")
+
+    db_name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    # Set before the import: server.py reads its configuration at import time
+    os.environ.update({
+        "MONGO_URL": args.mongo_url or "mongodb://localhost:27017",
+        "DB_NAME": db_name,
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "RATE_LIMITS_ENABLED": "true" if args.rate_limits else "false",
+        "LOOP_LAG_THRESHOLD_MS": "0",
+        "PROFILE_SAMPLE_RATE": "0",
+        "SPLIT_SCREEN_PRENORMALIZE": "false",
+        # The sweeper would treat files from other runs (no records in the stand-in) as orphans
+        "STORAGE_SWEEP_INTERVAL": "0",
+    })
+    if not args.mongo_url:
+        # Swapped in before server.py builds its client, so every collection it hands out is in memory
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    import server  # noqa: E402
+
+    app_server = AppServer(server.app, args.port)
+    recorder = None
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            upload_path = Path(workdir) / "upload.mp4"
+            make_upload(upload_path, args.upload_seconds)
+            upload = upload_path.read_bytes()
+
+        app_server.start()
+        print(f"{args.users} users x {args.iterations} iteration(s), "
+              f"{'mongo ' + args.mongo_url if args.mongo_url else 'in-memory mongo'}, fake LLM {args.llm_latency_ms:.0f} ms")
+        recorder, elapsed = asyncio.run(run_load(f"http://127.0.0.1:{args.port}", upload, args))
+    finally:
+        app_server.stop()
+        if recorder:
+            for filename in recorder.created_uploads:
+                (server.UPLOAD_DIR / filename).unlink(missing_ok=True)
+            for filename in recorder.created_outputs:
+                (server.OUTPUT_DIR / filename).unlink(missing_ok=True)
+        if args.mongo_url:
+            from pymongo import MongoClient
+
+            MongoClient(args.mongo_url).drop_database(db_name)
+
+    report = summarize(recorder, app_server.lag_samples, elapsed)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
@@ -0,0 +1,78 @@
+"""Reframing overhead: subject analysis time as a share of a portrait clip render.
+
+The source is a 1920x1080 clip whose subject jumps from the left third to the
+right third halfway through, so the crop actually has to move. For each run
+we time the analysis (frame sampling + tracking + expression) and the render
+with the resulting crop, and compare against the static center-crop render.
+The target is analysis < 30% of the total.
+
+    python benchmarks/reframe_overhead.py --duration 30 --runs 3
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from reframe import opencv_available, portrait_crop_filter  # noqa: E402
+
+STATIC_CROP = "crop=ih*9/16:ih,scale=1080:1920"
+TARGET_SHARE = 0.30
+
+
+def make_source(path: str, duration: int):
+    half = duration / 2
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", "color=c=red:size=240x240:rate=30",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-filter_complex",
+        f"[0:v]hue=s=0[bg];[bg][1:v]overlay=x='if(lt(t,{half}),300,1400)+40*sin(t*3)':y=420:shortest=1[v]",
+        "-map", "[v]", "-map", "2:a",
+        "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def render(source: str, vf: str, output: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error", "-i", source,
+        "-vf", vf,
+        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
+        "-c:a", "aac", "-b:a", "128k", output,
+    ], check=True)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"subject detection: {'face (OpenCV) + motion' if opencv_available() else 'motion only'}")
+    with tempfile.TemporaryDirectory() as workdir:
+        source = str(Path(workdir) / "source.mp4")
+        output = str(Path(workdir) / "out.mp4")
+        make_source(source, args.duration)
+
+        static, analysis, reframed = [], [], []
+        for _ in range(args.runs):
+            static.append(render(source, STATIC_CROP, output))
+            started = time.perf_counter()
+            vf = portrait_crop_filter(source, 0, args.duration) or STATIC_CROP
+            analysis.append(time.perf_counter() - started)
+            reframed.append(render(source, vf, output))
+
+    a, r, s = statistics.median(analysis), statistics.median(reframed), statistics.median(static)
+    share = a / (a + r)
+    print(f"center crop render: {s:6.2f} s")
+    print(f"reframe analysis:   {a:6.2f} s")
+    print(f"reframed render:    {r:6.2f} s")
+    print(f"analysis share:     {share:6.1%} of total ({'ok' if share < TARGET_SHARE else 'over'} target {TARGET_SHARE:.0%})")
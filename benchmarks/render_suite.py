@@ -0,0 +1,249 @@
+"""Render benchmark suite: time, CPU, memory, size and quality per render case.
+
+Runs ``process_video_clip`` for every source x aspect ratio x duration and
+``render_story_video`` for every caption style x duration, over the shipped
+``assets/backgrounds/*/bg*.mp4`` files and synthetic testsrc2 sources. Each
+case runs in a fresh child process so CPU time and peak RSS cover exactly
+that render's ffmpeg (and Python) work:
+
+- wall_s: median wall time over --runs
+- cpu_s: median user+system CPU of the render, ffmpeg included
+- peak_rss_mb: largest resident set of any process in the render
+- size_bytes: output file size
+- quality: VMAF (ffmpeg built with libvmaf) or SSIM against the source
+  segment with the same geometry; story renders compare against the bare
+  background, so burned-in captions lower the absolute score but it stays
+  comparable between runs
+
+Clip cases use a fixed start and the static center crop so runs are
+comparable; benchmarks/reframe_overhead.py covers reframing.
+
+    python benchmarks/render_suite.py --out results.json --baseline benchmarks/render_baseline.json
+    python benchmarks/render_suite.py --baseline benchmarks/render_baseline.json --update-baseline
+
+Exits with status 1 when a case regresses past the thresholds.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from renders import process_video_clip, render_story_video  # noqa: E402
+from subtitles import ASS_STYLES  # noqa: E402
+
+BACKGROUNDS_DIR = BACKEND_DIR / "assets" / "backgrounds"
+ASPECT_FILTERS = {
+    "portrait": "crop=ih*9/16:ih,scale=1080:1920",
+    "landscape": "crop=iw:iw*9/16,scale=1920:1080",
+}
+SYNTHETIC_SOURCES = {"synthetic_1080p": "1920x1080", "synthetic_portrait": "1080x1920"}
+STORY_CAPTIONS = (
+    "I found a note under my door this morning.\n"
+    "It said: don't trust the neighbour upstairs.\n"
+    "[BEAT]\n"
+    "I live on the top floor.\n"
+    "Follow for part two."
+)
+# Relative increase that counts as a regression for time, CPU, memory and size
+DEFAULT_THRESHOLD = 0.15
+# Absolute drop that counts as a quality regression, per metric
+QUALITY_TOLERANCE = {"vmaf": 1.0, "ssim": 0.005}
+
+
+def make_synthetic_source(path: Path, size: str, duration: int):
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-c:a", "aac", "-shortest", str(path),
+    ], check=True)
+
+
+def quality_metric() -> str:
+    filters = subprocess.run(["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True).stdout
+    return "vmaf" if re.search(r"\slibvmaf\s", filters) else "ssim"
+
+
+def measure_quality(output: Path, reference: Path, vf: str, duration: int, metric: str, loop: bool = False):
+    """Score output against the reference segment run through the same geometry filter"""
+    compare = "libvmaf=shortest=1" if metric == "vmaf" else "ssim=shortest=1"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", str(output),
+        *(["-stream_loop", "-1"] if loop else []),
+        "-t", str(duration), "-i", str(reference),
+        "-lavfi", f"[0:v]setpts=PTS-STARTPTS[dist];[1:v]{vf},setpts=PTS-STARTPTS[ref];[dist][ref]{compare}",
+        "-f", "null", "-",
+    ]
+    stderr = subprocess.run(cmd, capture_output=True, text=True).stderr
+    pattern = r"VMAF score: ([\d.]+)" if metric == "vmaf" else r"SSIM .*All:([\d.]+)"
+    match = re.search(pattern, stderr)
+    return float(match.group(1)) if match else None
+
+
+def _cpu_seconds(usage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+def _run_case(kind: str, params: dict) -> dict:
+    """Runs in a fresh child process; RUSAGE_CHILDREN then only holds this render's ffmpeg"""
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    if kind == "clip":
+        ok = process_video_clip(
+            params["source"], params["output"], params["duration"], params["aspect_ratio"],
+            start_time=0, reframe=False,
+        )
+    else:
+        ok = render_story_video(
+            params["source"], STORY_CAPTIONS, params["output"], params["duration"], params["style"],
+        )
+    wall = time.perf_counter() - started
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "ok": bool(ok),
+        "wall_s": wall,
+        "cpu_s": _cpu_seconds(children) + _cpu_seconds(own) - _cpu_seconds(self_before),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": max(children.ru_maxrss, own.ru_maxrss) / 1024,
+    }
+
+
+def run_case(pool_context, kind: str, params: dict) -> dict:
+    with pool_context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(_run_case, (kind, params))
+
+
+def build_cases(sources: dict, durations, styles, aspect_ratios):
+    cases = []
+    for source_name, source in sources.items():
+        for aspect_ratio in aspect_ratios:
+            for duration in durations:
+                cases.append({
+                    "name": f"clip/{source_name}/{aspect_ratio}/{duration}s",
+                    "kind": "clip", "source": source, "aspect_ratio": aspect_ratio, "duration": duration,
+                    "vf": ASPECT_FILTERS[aspect_ratio], "loop": False,
+                })
+    story_background = next((s for name, s in sources.items() if not name.startswith("synthetic")), None)
+    story_background = story_background or next(iter(sources.values()))
+    for style in styles:
+        for duration in durations:
+            cases.append({
+                "name": f"story/{style}/{duration}s",
+                "kind": "story", "source": story_background, "style": style, "duration": duration,
+                "vf": "null", "loop": True,
+            })
+    return cases
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Regression messages for cases present in both runs"""
+    regressions = []
+    for name, current in results["cases"].items():
+        previous = baseline.get("cases", {}).get(name)
+        if not previous or not current["ok"] or not previous["ok"]:
+            continue
+        for key in ("wall_s", "cpu_s", "peak_rss_mb", "size_bytes"):
+            old, new = previous.get(key), current.get(key)
+            if old and new and new > old * (1 + threshold):
+                regressions.append(f"{name}: {key} {old:.2f} -> {new:.2f} (+{new / old - 1:.0%})")
+        old, new = previous.get("quality"), current.get("quality")
+        if old and new and old["metric"] == new["metric"] and None not in (old["score"], new["score"]):
+            if new["score"] < old["score"] - QUALITY_TOLERANCE[new["metric"]]:
+                regressions.append(f"{name}: {new['metric']} {old['score']:.3f} -> {new['score']:.3f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", default="15,30,60", help="comma-separated target durations in seconds")
+    parser.add_argument("--styles", default=",".join(ASS_STYLES), help="comma-separated caption styles")
+    parser.add_argument("--aspect-ratios", default=",".join(ASPECT_FILTERS))
+    parser.add_argument("--no-synthetic", action="store_true", help="only the shipped background videos")
+    parser.add_argument("--no-backgrounds", action="store_true", help="only synthetic sources")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--out", default="render_results.json")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run's results to --baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    durations = [int(d) for d in args.durations.split(",") if d]
+    styles = [s for s in args.styles.split(",") if s]
+    aspect_ratios = [a for a in args.aspect_ratios.split(",") if a]
+    metric = quality_metric()
+    context = multiprocessing.get_context("fork")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        work = Path(workdir)
+        sources = {}
+        if not args.no_backgrounds:
+            for path in sorted(BACKGROUNDS_DIR.glob("*/bg*.mp4")):
+                sources[f"{path.parent.name}_{path.stem}"] = str(path)
+        if not args.no_synthetic:
+            for name, size in SYNTHETIC_SOURCES.items():
+                path = work / f"{name}.mp4"
+                make_synthetic_source(path, size, max(durations) + 10)
+                sources[name] = str(path)
+
+        results = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": multiprocessing.cpu_count()},
+            "quality_metric": metric,
+            "cases": {},
+        }
+        for case in build_cases(sources, durations, styles, aspect_ratios):
+            if args.filter not in case["name"]:
+                continue
+            output = work / "out.mp4"
+            params = {**case, "output": str(output)}
+            runs = [run_case(context, case["kind"], params) for _ in range(args.runs)]
+            ok = all(r["ok"] for r in runs) and output.exists() and output.stat().st_size > 0
+            entry = {
+                "ok": ok,
+                "wall_s": round(statistics.median(r["wall_s"] for r in runs), 3),
+                "cpu_s": round(statistics.median(r["cpu_s"] for r in runs), 3),
+                "peak_rss_mb": round(max(r["peak_rss_mb"] for r in runs), 1),
+                "size_bytes": output.stat().st_size if ok else None,
+                "quality": {
+                    "metric": metric,
+                    "score": measure_quality(output, Path(case["source"]), case["vf"], case["duration"], metric, case["loop"]),
+                } if ok else None,
+            }
+            results["cases"][case["name"]] = entry
+            score = entry["quality"]["score"] if ok and entry["quality"]["score"] is not None else float("nan")
+            print(
+                f"{case['name']:<45} {'ok ' if ok else 'FAIL'} wall {entry['wall_s']:7.2f}s  cpu {entry['cpu_s']:7.2f}s  "
+                f"rss {entry['peak_rss_mb']:7.1f}MB  {(entry['size_bytes'] or 0) / 1e6:7.2f}MB  {metric} {score:.3f}"
+            )
+            output.unlink(missing_ok=True)
+
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    print(f"results written to {args.out}")
+
+    if args.baseline:
+        baseline_path = Path(args.baseline)
+        if args.update_baseline:
+            baseline_path.write_text(json.dumps(results, indent=2))
+            print(f"baseline updated: {baseline_path}")
+        elif baseline_path.exists():
+            regressions = compare(results, json.loads(baseline_path.read_text()), args.threshold)
+            for line in regressions:
+                print(f"REGRESSION {line}")
+            print(f"{len(regressions)} regression(s) against {baseline_path} (threshold +{args.threshold:.0%})")
+            sys.exit(1 if regressions else 0)
+        else:
+            print(f"no baseline at {baseline_path}; rerun with --update-baseline to create it")
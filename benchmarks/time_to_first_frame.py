@@ -0,0 +1,197 @@
+"""Measure time-to-first-frame for the render output muxing modes.
+
+Two numbers per mode:
+
+- finished: a client on a throttled link (Range-capable HTTP server) opens the
+  finished file and decodes its first video frame with ffmpeg.
+- during render: wall time from starting the encode until the file on disk
+  holds enough to decode a first frame (ftyp + moov + first complete fragment
+  for fragmented MP4; the finalized file otherwise).
+
+    python benchmarks/time_to_first_frame.py --duration 60 --mbit 8 --rtt-ms 60
+"""
+import argparse
+import asyncio
+import os
+import struct
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+# Muxer flags under test; "faststart" and "fragmented" mirror server.mp4_output_args()
+MODES = {
+    "legacy": [],
+    "faststart": ["-movflags", "+faststart"],
+    "fragmented": [
+        "-force_key_frames", "expr:gte(t,n_forced*2)",
+        "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+    ],
+}
+
+ENCODE_ARGS = [
+    "-vf", "crop=ih*9/16:ih,scale=1080:1920",
+    "-c:v", "libx264", "-preset", "fast", "-crf", "23",
+    "-c:a", "aac", "-b:a", "128k",
+]
+
+
+def make_source(path: str, duration: int):
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=30:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def top_level_boxes(path: str):
+    """(type, offset, size) of complete top-level MP4 boxes currently on disk"""
+    boxes = []
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            size, box_type = struct.unpack(">I4s", f.read(8))
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0]
+            elif size == 0:
+                size = file_size - offset
+            if size < 8 or offset + size > file_size:
+                break
+            boxes.append((box_type.decode("latin-1"), offset, size))
+            offset += size
+    return boxes
+
+
+def playable_prefix(path: str) -> bool:
+    types = [box[0] for box in top_level_boxes(path)]
+    if "moov" not in types:
+        return False
+    if "moof" in types:
+        return "mdat" in types[types.index("moof"):]
+    return "mdat" in types
+
+
+def time_during_render(source: str, output: str, mux_args) -> float:
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        ["ffmpeg", "-y", "-v", "error", "-i", source, *ENCODE_ARGS, *mux_args, output],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    is_fragmented = "empty_moov" in " ".join(mux_args)
+    while proc.poll() is None:
+        if is_fragmented and os.path.exists(output) and playable_prefix(output):
+            elapsed = time.perf_counter() - started
+            proc.wait()
+            return elapsed
+        time.sleep(0.02)
+    return time.perf_counter() - started
+
+
+class ThrottledRangeServer:
+    """Tiny HTTP/1.1 file server with Range support, a bandwidth cap and added latency"""
+
+    def __init__(self, root: str, bytes_per_s: float, rtt: float):
+        self.root = Path(root)
+        self.bytes_per_s = bytes_per_s
+        self.rtt = rtt
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.lower()] = value.strip()
+
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                path = self.root / target.lstrip("/").split("?")[0]
+                size = path.stat().st_size
+                start, end = 0, size - 1
+                status = "200 OK"
+                if "range" in headers:
+                    spec = headers["range"].split("=", 1)[1].split(",")[0]
+                    first, _, last = spec.partition("-")
+                    if first:
+                        start = int(first)
+                        end = int(last) if last else size - 1
+                    else:
+                        start = size - int(last)
+                    end = min(end, size - 1)
+                    status = "206 Partial Content"
+
+                await asyncio.sleep(self.rtt)
+                response_headers = [
+                    f"HTTP/1.1 {status}",
+                    "Content-Type: video/mp4",
+                    "Accept-Ranges: bytes",
+                    f"Content-Length: {end - start + 1}",
+                ]
+                if status.startswith("206"):
+                    response_headers.append(f"Content-Range: bytes {start}-{end}/{size}")
+                writer.write(("\r\n".join(response_headers) + "\r\n\r\n").encode("latin-1"))
+                if method == "HEAD":
+                    await writer.drain()
+                    continue
+
+                tick = 0.02
+                chunk = max(int(self.bytes_per_s * tick), 1)
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        data = f.read(min(chunk, remaining))
+                        writer.write(data)
+                        await writer.drain()
+                        remaining -= len(data)
+                        await asyncio.sleep(tick)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def time_finished(url: str) -> float:
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error", "-i", url, "-frames:v", "1", "-f", "null", "-",
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    await proc.wait()
+    return time.perf_counter() - started
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.mp4")
+        make_source(source, args.duration)
+
+        during = {}
+        for mode, mux_args in MODES.items():
+            during[mode] = time_during_render(source, os.path.join(workdir, f"{mode}.mp4"), mux_args)
+
+        server = ThrottledRangeServer(workdir, args.mbit * 1e6 / 8, args.rtt_ms / 1000)
+        tcp = await asyncio.start_server(server.handle, "127.0.0.1", args.port)
+        async with tcp:
+            print(f"{'mode':>12} {'size MB':>8} {'finished TTFF s':>16} {'during render s':>16}")
+            for mode in MODES:
+                output = os.path.join(workdir, f"{mode}.mp4")
+                ttff = await time_finished(f"http://127.0.0.1:{args.port}/{mode}.mp4")
+                print(f"{mode:>12} {os.path.getsize(output) / 1e6:>8.1f} {ttff:>16.2f} {during[mode]:>16.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=60, help="Source/clip length in seconds")
+    parser.add_argument("--mbit", type=float, default=8.0, help="Simulated client bandwidth")
+    parser.add_argument("--rtt-ms", type=float, default=60.0, help="Added latency per request")
+    parser.add_argument("--port", type=int, default=18010)
+    asyncio.run(main(parser.parse_args()))
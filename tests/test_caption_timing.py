@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from caption_timing import (
+    BEAT_PAUSE_SECONDS,
+    parse_caption_script,
+    schedule,
+    time_captions,
+    word_timings,
+)
+
+
+def test_parse_caption_script_turns_beats_into_pauses():
+    lines, beats = parse_caption_script("First line\n[BEAT]\nSecond line [BEAT]\n[BEAT] Third line\nLast")
+    assert lines == ["First line", "Second line", "Third line", "Last"]
+    assert beats.tolist() == [1, 2, 0, 0]
+
+
+def test_longer_lines_stay_on_screen_longer():
+    cues = time_captions("Short.\nThis line is quite a bit longer than the first one.", total_duration=10)
+    first, second = [end - start for start, end, _ in cues]
+    assert second > first
+
+
+def test_cues_fill_target_duration_including_pauses():
+    cues = time_captions("One\n[BEAT]\nTwo two\nThree three three", total_duration=20)
+    assert cues[-1][1] == pytest.approx(20.0)
+    gap = cues[1][0] - cues[0][1]
+    assert gap == pytest.approx(BEAT_PAUSE_SECONDS)
+    assert all(end > start for start, end, _ in cues)
+
+
+def test_measured_durations_override_estimates():
+    cues = time_captions("a\nb", durations=[1.5, 2.0])
+    assert [(s, e) for s, e, _ in cues] == [(0.0, 1.5), (1.5, 3.5)]
+
+
+def test_schedule_without_total_uses_clamped_reading_time():
+    starts, ends = schedule(np.array([3.0, 300.0]), np.zeros(2), reading_speed=15.0, min_duration=0.8, max_duration=6.0)
+    assert (ends - starts).tolist() == pytest.approx([0.8, 6.0])
+
+
+def test_schedule_handles_thousands_of_segments():
+    weights = np.random.default_rng(0).integers(5, 80, 10000).astype(float)
+    starts, ends = schedule(weights, np.zeros(10000), total_duration=5000.0)
+    assert ends[-1] == pytest.approx(5000.0)
+    assert np.all(starts[1:] >= ends[:-1] - 1e-9)
+
+
+def test_word_timings_sum_to_cue_duration():
+    cues = time_captions("The quick brown fox\njumps over", total_duration=7)
+    words = word_timings(cues)
+    for (start, end, _), line_words in zip(cues, words):
+        assert sum(cs for _, cs in line_words) == int((end - start) * 100)
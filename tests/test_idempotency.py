@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+
+
+@pytest.fixture
+def store():
+    return IdempotencyStore(AsyncMongoMockClient()["idempotency_test"].idempotency)
+
+
+def test_retry_sees_first_request_then_its_result(store):
+    clip = fingerprint("video-clip", {"video_filename": "a.mp4", "target_duration": 15})
+
+    async def scenario():
+        await store.ensure_indexes()
+        assert await store.begin("u1", "k1", clip) is None
+        running = await store.begin("u1", "k1", clip)
+        # Same key from another user is a different request
+        assert await store.begin("u2", "k1", clip) is None
+        with pytest.raises(IdempotencyConflict):
+            await store.begin("u1", "k1", fingerprint("video-clip", {"video_filename": "b.mp4"}))
+        await store.complete("u1", "k1", 200, {"id": "c1"})
+        return running, await store.begin("u1", "k1", clip)
+
+    running, done = asyncio.run(scenario())
+    assert running["status"] == "in_progress"
+    assert (done["status"], done["status_code"], done["response"]) == ("completed", 200, {"id": "c1"})
+
+
+def test_failed_or_abandoned_claims_can_be_retried(store):
+    story = fingerprint("story-video", {"transcript": "Once"})
+
+    async def scenario():
+        await store.ensure_indexes()
+        await store.begin("u1", "failed", story)
+        await store.release("u1", "failed")
+        retried = await store.begin("u1", "failed", story)
+
+        await store.begin("u1", "abandoned", story)
+        await store.collection.update_one(
+            {"key": "abandoned"}, {"$set": {"locked_until": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        return retried, await store.begin("u1", "abandoned", story)
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_key_of_a_failed_job_is_reopened_once(store):
+    clip = fingerprint("video-clip", {"video_filename": "a.mp4"})
+
+    async def scenario():
+        await store.ensure_indexes()
+        await store.begin("u1", "k1", clip)
+        await store.complete("u1", "k1", 202, {"id": "job-1"}, job_id="job-1")
+        first, second = await asyncio.gather(store.reopen("u1", "k1", "job-1"), store.reopen("u1", "k1", "job-1"))
+        return first, second, await store.begin("u1", "k1", clip)
+
+    first, second, record = asyncio.run(scenario())
+    assert sorted([first, second]) == [False, True]
+    assert record["status"] == "in_progress" and "job_id" not in record
+
+
+def test_claim_is_held_while_its_request_runs():
+    store = IdempotencyStore(AsyncMongoMockClient()["idempotency_test"].idempotency, lock=timedelta(seconds=0.3))
+    clip = fingerprint("video-clip", {"video_filename": "a.mp4"})
+
+    async def scenario():
+        await store.ensure_indexes()
+        await store.begin("u1", "slow", clip)
+        holder = asyncio.create_task(store.hold("u1", "slow"))
+        # Longer than the lock: without renewal a retry would take the claim over
+        await asyncio.sleep(0.5)
+        retry = await store.begin("u1", "slow", clip)
+        holder.cancel()
+        return retry
+
+    assert asyncio.run(scenario())["status"] == "in_progress"
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from job_queue import JobFailed, JobQueue, JobWorker
+
+
+@pytest.fixture
+def queue():
+    db = AsyncMongoMockClient()["jobs_test"]
+    return JobQueue(db.jobs, lease_seconds=30, max_attempts=2, retry_delay=0)
+
+
+def test_claimed_job_is_leased_to_one_worker(queue):
+    async def scenario():
+        job = await queue.enqueue("clip", {"n": 1}, "u1", output_filename="a_clip.mp4")
+        first = await queue.claim("w1", ["clip"])
+        second = await queue.claim("w2", ["clip"])
+        assert await queue.pending_outputs(["a_clip.mp4", "b_clip.mp4"]) == {"a_clip.mp4"}
+        assert await queue.complete(first, {"ok": True})
+        assert await queue.pending_outputs(["a_clip.mp4"]) == set()
+        return job, first, second, await queue.get(job["id"], "u1")
+
+    job, first, second, done = asyncio.run(scenario())
+    assert first["id"] == job["id"] and first["attempts"] == 1
+    assert second is None
+    assert done["status"] == "completed" and done["result"] == {"ok": True}
+
+
+def test_expired_lease_is_retried_then_reaped(queue):
+    async def expire(job_id):
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await queue.collection.update_one({"id": job_id}, {"$set": {"lease_expires": past}})
+
+    async def scenario():
+        job = await queue.enqueue("story", {}, "u1")
+        stalled = await queue.claim("w1", ["story"])
+        await expire(job["id"])
+        retried = await queue.claim("w2", ["story"])
+        # The first worker's late result is refused
+        assert not await queue.complete(stalled, {})
+        await expire(job["id"])
+        assert await queue.claim("w3", ["story"]) is None
+        assert await queue.reap() == 1
+        return retried, await queue.get(job["id"])
+
+    retried, job = asyncio.run(scenario())
+    assert retried["worker"] == "w2" and retried["attempts"] == 2
+    assert job["status"] == "failed"
+
+
+def test_worker_retries_errors_but_not_permanent_failures(queue):
+    calls = []
+
+    async def flaky(params):
+        calls.append(params["kind"])
+        if params["kind"] == "bad":
+            raise JobFailed("Video file not found")
+        if len(calls) < 3:
+            raise RuntimeError("ffmpeg crashed")
+        return {"rendered": True}
+
+    async def scenario():
+        bad = await queue.enqueue("clip", {"kind": "bad"}, "u1")
+        good = await queue.enqueue("clip", {"kind": "good"}, "u1")
+        worker = JobWorker(queue, {"clip": flaky})
+        while (job := await queue.claim(worker.worker_id, ["clip"])) is not None:
+            await worker.run_job(job)
+        return await queue.get(bad["id"]), await queue.get(good["id"])
+
+    bad, good = asyncio.run(scenario())
+    assert (bad["status"], bad["attempts"], bad["error"]) == ("failed", 1, "Video file not found")
+    assert (good["status"], good["attempts"], good["result"]) == ("completed", 2, {"rendered": True})
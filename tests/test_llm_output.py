@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from llm_output import (
+    BatchCaptionOutput,
+    CaptionOutput,
+    LLMOutputError,
+    PARSE_STATS,
+    generate_structured,
+    parse_structured,
+)
+
+
+def test_valid_json_needs_no_repair():
+    value, repaired = parse_structured('{"caption": "Wait for it 🔥", "hashtags": "#fyp #viral"}', CaptionOutput)
+    assert value.caption == "Wait for it 🔥"
+    assert not repaired
+
+
+def test_fenced_json_with_trailing_comma_is_repaired_locally():
+    text = 'Here you go:\n```json\n{"caption": "Hi", "hashtags": ["fyp", "#viral"],}\n```'
+    value, repaired = parse_structured(text, CaptionOutput)
+    assert repaired
+    assert value.hashtags == "#fyp #viral"
+
+
+def test_legacy_key_lines_are_accepted():
+    value, _ = parse_structured("CAPTION: Hello\nHASHTAGS: #a #b\nCTA: Follow", CaptionOutput)
+    assert (value.caption, value.hashtags, value.cta) == ("Hello", "#a #b", "Follow")
+
+
+def test_retry_only_after_repair_fails():
+    responses = iter(["not json at all", '{"clips": [{"caption": "One", "hashtags": "#a"}]}'])
+    calls = []
+
+    async def generate(prompt, system_message):
+        calls.append(prompt)
+        return next(responses)
+
+    def exported():
+        return REGISTRY.get_sample_value("cliptag_llm_parse_total", {"kind": "test_batch", "outcome": "retried"}) or 0
+
+    PARSE_STATS.pop("test_batch", None)
+    before = exported()
+    result = asyncio.run(generate_structured(generate, "p", "s", BatchCaptionOutput, "test_batch"))
+    assert len(calls) == 2
+    assert result.clips[0].caption == "One"
+    assert PARSE_STATS["test_batch"]["retried"] == 1
+    assert exported() == before + 1
+
+
+def test_gives_up_after_retries():
+    async def generate(prompt, system_message):
+        return "still not json"
+
+    with pytest.raises(LLMOutputError):
+        asyncio.run(generate_structured(generate, "p", "s", CaptionOutput, "test_fail", retries=1))
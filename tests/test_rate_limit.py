@@ -0,0 +1,39 @@
+import asyncio
+
+import rate_limit
+from rate_limit import BucketLimit, MemoryBucketStore, RateLimited, RateLimiter
+
+
+def test_bucket_charges_cost_and_reports_wait():
+    limiter = RateLimiter(MemoryBucketStore(), {"free": {"render": BucketLimit(capacity=3, per_hour=3600)}})
+
+    async def scenario():
+        await limiter.check("u1", "free", "render", cost=3)
+        try:
+            await limiter.check("u1", "free", "render")
+        except RateLimited as e:
+            return e.retry_after
+
+    assert 0 < asyncio.run(scenario()) <= 1
+
+
+def test_memory_store_forgets_refilled_buckets(monkeypatch):
+    limit = BucketLimit(capacity=2, per_hour=36)
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: clock[0])
+    store = MemoryBucketStore()
+
+    async def scenario():
+        await store.take("idle", limit)
+        await store.take("busy", limit, cost=2)
+        # "idle" is full again after 100 s, "busy" after 200 s
+        clock[0] += 110
+        await store.take("busy", limit, cost=0)
+        kept = set(store._buckets)
+        clock[0] += 100
+        await store.take("other", limit)
+        return kept, set(store._buckets)
+
+    kept, after = asyncio.run(scenario())
+    assert kept == {"busy"}
+    assert after == {"other"}
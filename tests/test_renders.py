@@ -0,0 +1,37 @@
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+from renders import CancelToken, RenderCancelled, RenderTimeout, run_ffmpeg
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+# Encodes far longer than any test waits
+SLOW = ["ffmpeg", "-v", "error", "-re", "-f", "lavfi", "-i", "testsrc2=duration=600", "-f", "null", "-"]
+
+
+def test_cancel_kills_running_ffmpeg():
+    cancel = CancelToken()
+    threading.Timer(0.5, cancel.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(RenderCancelled):
+        run_ffmpeg(SLOW, timeout=60, cancel=cancel)
+    assert time.monotonic() - started < 10
+    assert not cancel._processes
+
+    # A cancelled token starts nothing more
+    with pytest.raises(RenderCancelled):
+        run_ffmpeg(["ffmpeg", "-version"], cancel=cancel)
+
+
+def test_timeout_kills_ffmpeg():
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_ffmpeg(SLOW, timeout=RenderTimeout(base=0.5, per_second=0)(600))
+
+
+def test_timeout_scales_with_output_length():
+    timeout = RenderTimeout(base=60, per_second=4)
+    assert timeout(0) == 60 and timeout(30) == 180 and timeout(-5) == 60
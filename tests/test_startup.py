@@ -0,0 +1,42 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Cumulative `import server` time allowed, best of a few runs; CI runners can set their own
+BUDGET_MS = float(os.environ.get("STARTUP_IMPORT_BUDGET_MS", 2500))
+
+# Only needed by the code paths that use them, so importing the API must not load them
+LAZY_MODULES = ("emergentintegrations", "boto3", "cv2", "faster_whisper", "pyinstrument")
+
+PROBE = f"""
+import sys
+import server
+print(",".join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+"""
+
+
+def import_server(cache_dir):
+    env = dict(
+        os.environ, MONGO_URL="mongodb://localhost:27017", DB_NAME="startup_test", LLM_BACKEND="fake",
+        # The S3 backend, so boto3 is held to the same rule; its client is built at startup, not import
+        STORAGE_BACKEND="s3", S3_BUCKET="startup-test", STORAGE_CACHE_DIR=str(cache_dir)
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    # "import time: <self us> | <cumulative us> | <module>", nested imports indented under the module name
+    cumulative = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| server$", result.stderr, re.MULTILINE)
+    return int(cumulative.group(1)) / 1000, result.stdout.strip()
+
+
+def test_server_imports_within_budget_without_optional_sdks(tmp_path):
+    runs = [import_server(tmp_path / "media") for _ in range(3)]
+    assert {loaded for _, loaded in runs} == {""}
+    best = min(ms for ms, _ in runs)
+    assert best < BUDGET_MS, f"import server took {best:.0f} ms (budget {BUDGET_MS:.0f} ms)"
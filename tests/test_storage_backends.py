@@ -0,0 +1,58 @@
+import pytest
+
+from storage_backends import ReadThroughCache
+
+
+def fetcher(size, calls):
+    def fetch(dest):
+        calls.append(dest.name)
+        dest.write_bytes(b"x" * size)
+        return True
+    return fetch
+
+
+def test_cache_evicts_least_recently_used_but_not_checked_out(tmp_path):
+    cache = ReadThroughCache(tmp_path, max_bytes=25)
+    calls = []
+    a = cache.checkout("videos", "a.mp4", fetcher(10, calls))
+    cache.release("videos", "a.mp4")
+    cache.checkout("videos", "b.mp4", fetcher(10, calls))  # stays checked out
+    cache.checkout("videos", "a.mp4", fetcher(10, calls))  # hit, now most recent
+    cache.release("videos", "a.mp4")
+    cache.checkout("videos", "c.mp4", fetcher(10, calls))
+
+    # a was the least recently used file not in use
+    assert not a.exists()
+    assert cache.path("videos", "b.mp4").exists() and cache.path("videos", "c.mp4").exists()
+    assert len(calls) == 3
+    assert cache.stats()["bytes"] == 20
+
+
+def test_cache_miss_without_object_returns_none(tmp_path):
+    cache = ReadThroughCache(tmp_path, max_bytes=100)
+    assert cache.checkout("outputs", "missing.mp4", lambda dest: False) is None
+    assert not list(tmp_path.rglob("*.part"))
+
+
+def test_s3_round_trip(tmp_path):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    from storage_backends import S3Storage
+
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="media")
+        storage = S3Storage("media", ReadThroughCache(tmp_path / "cache", 1024), prefix="test/", region="us-east-1")
+        source = tmp_path / "render.mp4"
+        source.write_bytes(b"video")
+
+        cached = storage.save("outputs", "render.mp4", source)
+        assert not source.exists() and cached.read_bytes() == b"video"
+        assert storage.list("outputs")[0][0] == "render.mp4"
+        assert "X-Amz-Signature" in storage.url("outputs", "render.mp4")
+
+        storage.cache.discard("outputs", "render.mp4")
+        assert storage.checkout("outputs", "render.mp4").read_bytes() == b"video"
+        storage.release("outputs", "render.mp4")
+        assert storage.delete("outputs", "render.mp4") == 5
+        assert not storage.exists("outputs", "render.mp4")
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from storage_backends import LocalStorage
+from storage_manager import QuotaExceeded, StorageManager
+
+
+async def in_flight(filenames):
+    # A render still writing this output, here or on a worker
+    return {name for name in filenames if name == "rendering_clip.mp4"}
+
+
+@pytest.fixture
+def manager(tmp_path):
+    db = AsyncMongoMockClient()["storage_test"]
+    roots = {"videos": tmp_path / "uploads", "outputs": tmp_path / "outputs"}
+    for root in roots.values():
+        root.mkdir()
+    return StorageManager(
+        db.files, db.content, LocalStorage(roots), tmp_path / "outputs" / "hls", tmp_path / "thumbnails",
+        quotas={"free": 100}, in_flight=in_flight,
+    )
+
+
+
+def write(path, size=10, age=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_expired_uploads_go_and_claimed_ones_stay(manager):
+    async def scenario():
+        write(manager.backend.roots["videos"] / "old.mp4")
+        write(manager.backend.roots["videos"] / "used.mp4")
+        await manager.register("videos", "old.mp4", "u1")
+        await manager.register("videos", "used.mp4", "u1")
+        await manager.attach({"id": "c1", "user_id": "u1", "video_url": "/api/videos/used.mp4"})
+        await manager.files.update_one(
+            {"_id": "videos/old.mp4"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        return await manager.sweep()
+
+    stats = asyncio.run(scenario())
+    assert stats["expired"] == 1
+    assert not (manager.backend.roots["videos"] / "old.mp4").exists()
+    assert (manager.backend.roots["videos"] / "used.mp4").exists()
+
+
+def test_untracked_files_are_deleted_unless_referenced_or_rendering(manager):
+    outputs = manager.backend.roots["outputs"]
+    hour = 3600 * 2
+
+    async def scenario():
+        write(outputs / "partial_clip.mp4", age=hour)
+        write(outputs / "legacy_clip.mp4", age=hour)
+        write(outputs / "rendering_clip.mp4", age=hour)
+        write(outputs / "fresh_clip.mp4")
+        await manager.content.insert_one({"id": "c1", "user_id": "u1", "output_url": "/api/outputs/legacy_clip.mp4"})
+        return await manager.sweep()
+
+    stats = asyncio.run(scenario())
+    assert (stats["orphans"], stats["adopted"]) == (1, 1)
+    assert sorted(p.name for p in outputs.iterdir() if p.is_file()) == [
+        "fresh_clip.mp4", "legacy_clip.mp4", "rendering_clip.mp4"
+    ]
+
+
+def test_release_deletes_outputs_and_starts_upload_retention(manager):
+    item = {"id": "c1", "user_id": "u1", "output_url": "/api/outputs/a_clip.mp4", "video_url": "/api/videos/src.mp4"}
+
+    async def scenario():
+        write(manager.backend.roots["videos"] / "src.mp4")
+        write(manager.backend.roots["outputs"] / "a_clip.mp4")
+        write(manager.hls_dir / "a_clip" / "master.m3u8")
+        await manager.attach(item)
+        await manager.release(item)
+        return await manager.files.find_one({"_id": "videos/src.mp4"})
+
+    upload = asyncio.run(scenario())
+    assert not (manager.backend.roots["outputs"] / "a_clip.mp4").exists()
+    assert not (manager.hls_dir / "a_clip").exists()
+    assert upload["content_ids"] == [] and upload["expires_at"] is not None
+
+
+def test_quota_counts_stored_bytes(manager):
+    async def scenario():
+        write(manager.backend.roots["videos"] / "big.mp4", size=80)
+        await manager.register("videos", "big.mp4", "u1")
+        await manager.check_quota({"id": "u1", "plan": "free"}, 20)
+        await manager.check_quota({"id": "u1", "plan": "free"}, 21)
+
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(scenario())